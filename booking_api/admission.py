@@ -0,0 +1,311 @@
+"""
+Admission control for bursts of bookings of the same class.
+
+When a popular class opens, far more booking requests arrive than it has
+slots, and without admission control each of them is validated against the
+database only to be told the class is full. ``admit()`` runs before
+``BookingCreateView`` does any database work, as ``aadmit()`` does before
+``AsyncBookingCreateView``, and keeps a ``_Gate`` per class in process
+memory:
+
+* A token budget of the slots the class has left. It is learned from the
+  class that validation loads anyway, so admission never adds a query.
+  Admitted requests hold a token until they have booked, and give it back
+  if they fail for another reason. Once the budget is spent and no admitted
+  request is still running, requests are rejected as sold out straight away.
+* A bound of ``ADMISSION_MAX_WRITERS`` requests per class in the booking
+  code at once. Further requests queue for up to
+  ``ADMISSION_QUEUE_TIMEOUT`` seconds, and at most ``ADMISSION_MAX_QUEUE``
+  of them wait per class; the rest are turned away with a 503.
+
+Budgets are only a guide: the conditional decrement in ``reservations``
+still decides every booking, and each process keeps its own budgets. A
+budget is forgotten after ``ADMISSION_REFRESH_INTERVAL`` seconds without
+running requests, so slots freed by cancellations in any process are seen,
+and whenever the class itself is saved.
+
+Decisions, queue lengths and queueing time are exported at ``/api/metrics/``.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .metrics import registry
+
+
+DEFAULT_MAX_WRITERS = 4
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_QUEUE_TIMEOUT = 2.0
+DEFAULT_REFRESH_INTERVAL = 1.0
+
+# Gates of idle classes are dropped once there are more than this many
+MAX_GATES = 4096
+
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+registry.define_counter(
+    'booking_admission_decisions_total', 'Booking requests by admission decision.'
+)
+registry.define_gauge(
+    'booking_admission_queued', 'Booking requests waiting for admission.'
+)
+registry.define(
+    'booking_admission_queue_wait_seconds', 'Time booking requests waited for admission.', QUEUE_WAIT_BUCKETS
+)
+
+
+class AdmissionRejected(Exception):
+    """Base class for requests turned away before any database work."""
+
+    message = "Unable to book this class right now"
+
+    def __init__(self, class_id, message=None):
+        self.class_id = class_id
+        super().__init__(message or self.message)
+
+
+class SoldOut(AdmissionRejected):
+    """The class has no slots left."""
+
+    message = "No available slots for this class"
+
+
+class Overloaded(AdmissionRejected):
+    """Too many requests for the class are already running or waiting."""
+
+    message = "Too many booking requests for this class; please retry"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _record(decision):
+    registry.inc('booking_admission_decisions_total', (('decision', decision),))
+
+
+class _Gate:
+    """Admission state of one class."""
+
+    __slots__ = ('condition', 'tokens', 'writers', 'waiting', 'generation', 'learned_at')
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # Slots left, or None until a request has loaded the class
+        self.tokens = None
+        self.writers = 0
+        self.waiting = 0
+        # Bumped whenever tokens is reset, so older tokens aren't given back
+        self.generation = 0
+        self.learned_at = 0.0
+
+    def forget(self):
+        self.tokens = None
+        self.generation += 1
+
+    def is_idle(self):
+        return not self.writers and not self.waiting
+
+
+class Ticket:
+    """
+    An admitted request; use it as a context manager around the booking.
+
+    The view reports what it found out with ``learn()``, ``booked()`` and
+    ``sold_out()``, and leaving the block lets the next request in.
+    """
+
+    def __init__(self, gate=None, token=False):
+        self.gate = gate
+        self.token = token
+        self.generation = gate.generation if gate is not None else 0
+
+    def learn(self, available_slots):
+        """Set the class's budget from its loaded ``available_slots``, if unknown."""
+        gate = self.gate
+        if gate is None:
+            return
+        with gate.condition:
+            if gate.tokens is None:
+                gate.tokens = available_slots
+                gate.learned_at = time.monotonic()
+            if not self.token and gate.tokens > 0:
+                gate.tokens -= 1
+                self.token = True
+                self.generation = gate.generation
+
+    def booked(self):
+        """The booking was made, so its token is spent."""
+        self.token = False
+
+    def sold_out(self):
+        """The database found the class full, whatever the budget said."""
+        gate = self.gate
+        if gate is None:
+            return
+        with gate.condition:
+            gate.tokens = 0
+            gate.generation += 1
+            gate.learned_at = time.monotonic()
+        self.token = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        gate = self.gate
+        if gate is None:
+            return
+        with gate.condition:
+            gate.writers -= 1
+            if self.token and self.generation == gate.generation:
+                gate.tokens += 1
+            gate.condition.notify_all()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await sync_to_async(self.__exit__, thread_sensitive=False)(*exc_info)
+
+
+class AdmissionController:
+    """Per-class gates of one process."""
+
+    def __init__(self):
+        self.gates = {}
+        self.lock = threading.Lock()
+
+    def gate(self, class_id):
+        gate = self.gates.get(class_id)
+        if gate is None:
+            with self.lock:
+                if len(self.gates) >= MAX_GATES:
+                    self.gates = {key: value for key, value in self.gates.items() if not value.is_idle()}
+                gate = self.gates.setdefault(class_id, _Gate())
+        return gate
+
+    def admit(self, class_id):
+        """
+        Admit a booking request for ``class_id``; return a ``Ticket``.
+
+        Raises ``SoldOut`` or ``Overloaded`` to turn the request away.
+        """
+        max_writers = _setting('ADMISSION_MAX_WRITERS', DEFAULT_MAX_WRITERS)
+        refresh_interval = _setting('ADMISSION_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL)
+        gate = self.gate(class_id)
+
+        with gate.condition:
+            if gate.waiting >= _setting('ADMISSION_MAX_QUEUE', DEFAULT_MAX_QUEUE):
+                _record('queue_full')
+                raise Overloaded(class_id)
+
+            started = deadline = None
+            while True:
+                if not gate.writers and gate.tokens is not None:
+                    if time.monotonic() - gate.learned_at >= refresh_interval:
+                        gate.forget()
+                    elif gate.tokens <= 0:
+                        _record('sold_out')
+                        raise SoldOut(class_id)
+
+                # Without a budget, requests are let in to learn it
+                if gate.writers < max_writers and (gate.tokens is None or gate.tokens > 0):
+                    break
+
+                now = time.monotonic()
+                if deadline is None:
+                    started = now
+                    deadline = now + _setting('ADMISSION_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT)
+                if now >= deadline:
+                    _record('timed_out')
+                    raise Overloaded(class_id)
+
+                # Wait for a running request to finish, and maybe return its token
+                gate.waiting += 1
+                registry.inc('booking_admission_queued', amount=1)
+                try:
+                    gate.condition.wait(deadline - now)
+                finally:
+                    gate.waiting -= 1
+                    registry.inc('booking_admission_queued', amount=-1)
+
+            gate.writers += 1
+            token = gate.tokens is not None
+            if token:
+                gate.tokens -= 1
+            ticket = Ticket(gate, token)
+
+        if started is not None:
+            registry.observe('booking_admission_queue_wait_seconds', (), time.monotonic() - started)
+            _record('queued')
+        else:
+            _record('admitted')
+        return ticket
+
+    def forget(self, class_id):
+        """Drop what is known about a class, e.g. after it was edited."""
+        gate = self.gates.get(class_id)
+        if gate is not None:
+            with gate.condition:
+                gate.forget()
+
+    def clear(self):
+        """Drop every gate."""
+        with self.lock:
+            self.gates = {}
+
+
+_controller = AdmissionController()
+
+
+def is_enabled():
+    """Return whether booking requests go through admission control."""
+    return _setting('ADMISSION_CONTROL_ENABLED', True)
+
+
+def parse_class_id(data):
+    """Return the ``class_id`` of a booking request body, or None if it isn't a valid id."""
+    class_id = data.get('class_id') if isinstance(data, dict) else None
+    if isinstance(class_id, bool):
+        return None
+    if isinstance(class_id, int):
+        return class_id
+    if isinstance(class_id, str) and class_id.isdigit():
+        return int(class_id)
+    return None
+
+
+def admit(class_id):
+    """
+    Admit a booking request for ``class_id``; return a ``Ticket``.
+
+    Requests without a valid ``class_id`` are let through, since validation
+    rejects them without touching the class.
+    """
+    if class_id is None or not is_enabled():
+        return Ticket()
+    return _controller.admit(class_id)
+
+
+async def aadmit(class_id):
+    """
+    Async version of ``admit``.
+
+    Queued requests block on their class's condition, so they wait in a
+    thread of their own rather than the one the async views share for
+    database work, where they would hold up the bookings they wait for.
+    """
+    return await sync_to_async(admit, thread_sensitive=False)(class_id)
+
+
+def forget(class_id):
+    """Drop what is known about a class."""
+    _controller.forget(class_id)
+
+
+def clear():
+    """Drop every gate."""
+    _controller.clear()
@@ -0,0 +1,15 @@
+"""
+App configuration for the fitness booking API.
+"""
+from django.apps import AppConfig
+
+
+class BookingApiConfig(AppConfig):
+    """App configuration for booking_api."""
+    
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'booking_api'
+    
+    def ready(self):
+        # Connect signal receivers and register system checks
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,332 @@
+"""
+Async views for the fitness booking API.
+
+These mirror the views in ``views.py`` but run natively under ASGI, using
+Django's async ORM instead of being pushed to a worker thread. They are
+routed to when ``ASYNC_BOOKING_VIEWS`` is enabled in settings.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import admission
+from . import availability
+from . import cache as classes_cache
+from . import exports
+from . import idempotency
+from . import routing
+from .metrics import stage
+from .models import BookingSummary, FitnessClass
+from .pagination import apaginate_by_datetime, get_page_size, InvalidCursor
+from .reservations import reserve_slot, ReservationError, ClassNotFound, ClassFull, AlreadyBooked
+from .timezones import get_request_timezone
+from .serializers import (
+    FitnessClassSerializer,
+    BookingSerializer,
+    BookingSummarySerializer,
+    BookingCreateSerializer
+)
+from .views import (
+    parse_class_fields,
+    parse_class_filters,
+    filter_classes,
+    upcoming_classes,
+    next_page_headers,
+    cached_classes_response,
+    make_classes_entry,
+    classes_entry_timeout,
+    EXPORT_FORBIDDEN,
+    export_params,
+    export_headers
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    """Render ``data`` the same way the DRF views do."""
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+async def arefresh_cached_slots(cache_key, entry):
+    """Async version of ``views.refresh_cached_slots``."""
+    sequence = await classes_cache.aget_slot_sequence()
+    if not classes_cache.needs_patch(entry, sequence):
+        return entry
+    
+    changed = await classes_cache.achanged_slots(entry['sequence'], sequence)
+    class_ids = classes_cache.stale_classes(entry, changed)
+    if class_ids is None:
+        return None
+    slots = {}
+    if class_ids:
+        rows = FitnessClass.objects.filter(pk__in=class_ids).values_list('id', 'available_slots')
+        slots = {class_id: available async for class_id, available in rows}
+    entry = classes_cache.patch_entry(entry, slots, sequence)
+    await classes_cache.aset_entry(cache_key, entry)
+    return entry
+
+
+class AsyncAPIView(View):
+    """
+    Base class for async JSON views.
+    
+    Like DRF's ``APIView``, these views are exempt from CSRF checks.
+    """
+    
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+
+class AsyncFitnessClassListView(AsyncAPIView):
+    """
+    Async API view to retrieve a list of all upcoming fitness classes.
+    """
+    
+    async def get(self, request):
+        """
+        GET method to retrieve upcoming fitness classes, one page at a time.
+        """
+        try:
+            tz = get_request_timezone(request)
+        except ValueError as e:
+            logger.warning("Invalid classes list request: %s", e)
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Look the page up under the current cache version
+        with stage('cache'):
+            version = await classes_cache.aget_version()
+            cache_key = classes_cache.make_key(version, request.GET, str(tz))
+            sequence = await classes_cache.aget_slot_sequence()
+            pinned = await routing.ais_pinned(request)
+            entry = None if pinned else await classes_cache.aget_entry(cache_key)
+            if entry is not None:
+                entry = await arefresh_cached_slots(cache_key, entry)
+        
+        if entry is None:
+            replica = None
+            try:
+                fields = parse_class_fields(request.GET.get('fields'))
+                filters = parse_class_filters(request.GET, tz)
+                page_size = get_page_size(request.GET.get('page_size'))
+                with stage('query'):
+                    index = await sync_to_async(availability.get_index)()
+                    if index is not None:
+                        page, next_cursor = index.page(request.GET.get('cursor'), page_size, **filters)
+                    else:
+                        async with routing.areplica_reads(request) as replica:
+                            page, next_cursor = await apaginate_by_datetime(
+                                filter_classes(upcoming_classes(fields), **filters),
+                                request.GET.get('cursor'),
+                                page_size
+                            )
+            except (InvalidCursor, ValueError) as e:
+                logger.warning("Invalid classes list request: %s", e)
+                return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            
+            # Serialize the data
+            with stage('serialize'):
+                serializer = FitnessClassSerializer(page, many=True, fields=fields, context={'timezone': tz})
+                entry = make_classes_entry(
+                    JSONRenderer().render(serializer.data), next_page_headers(request, next_cursor),
+                    page, fields, filters, sequence
+                )
+                await classes_cache.aset_entry(cache_key, entry, classes_entry_timeout(page, replica))
+            
+            logger.info("Retrieved %s upcoming fitness classes", len(page))
+        
+        return cached_classes_response(request, entry)
+
+
+class AsyncBookingCreateView(AsyncAPIView):
+    """
+    Async API view to create a new booking.
+    """
+    
+    async def post(self, request):
+        """
+        POST method to create a new booking.
+        
+        With an ``Idempotency-Key`` header, retries of a request get its
+        original response back without running it again, and a retry that
+        arrives while the original is still running waits briefly for it.
+        """
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return json_response({"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        key = request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+        if key is None:
+            return await self.admit_booking(data)
+        
+        try:
+            with stage('idempotency'):
+                outcome = await idempotency.abegin(key, idempotency.fingerprint(request))
+        except idempotency.IdempotencyError as e:
+            logger.warning("Booking rejected for Idempotency-Key %r: %s", key, e)
+            response = json_response({"error": str(e)}, status=e.status_code)
+            if e.retry_after:
+                response['Retry-After'] = str(e.retry_after)
+            return response
+        
+        if not isinstance(outcome, idempotency.Claim):
+            logger.info("Replayed the booking response for Idempotency-Key %r", key)
+            response = json_response(outcome['data'], status=outcome['status_code'])
+            response[idempotency.REPLAYED_HEADER] = 'true'
+            return response
+        
+        async with outcome as claim:
+            response = await self.admit_booking(data)
+            await claim.acomplete(response.status_code, json.loads(response.content))
+        return response
+    
+    async def admit_booking(self, data):
+        """
+        Create a booking once admission control lets the request in.
+        
+        Admission control turns requests away without a query when the class
+        is sold out or has too many bookings running.
+        """
+        class_id = admission.parse_class_id(data)
+        try:
+            with stage('admit'):
+                ticket = await admission.aadmit(class_id)
+        except admission.SoldOut as e:
+            logger.warning("Booking rejected for sold out class %s", class_id)
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except admission.Overloaded as e:
+            logger.warning("Booking turned away for busy class %s", class_id)
+            response = json_response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '1'
+            return response
+        
+        async with ticket:
+            return await self.create_booking(data, ticket)
+    
+    async def create_booking(self, data, ticket):
+        """
+        Validate and make an admitted booking, reporting what was learned
+        about the class to its admission ``ticket``.
+        """
+        # First validate the request data
+        serializer = BookingCreateSerializer(data=data)
+        with stage('validate'):
+            is_valid = await sync_to_async(serializer.is_valid)()
+        
+        fitness_class = getattr(serializer, 'fitness_class', None)
+        if fitness_class is not None and fitness_class.is_upcoming():
+            ticket.learn(fitness_class.available_slots)
+        
+        if not is_valid:
+            logger.warning("Invalid booking request: %s", serializer.errors)
+            return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        validated_data = serializer.validated_data
+        class_id = validated_data.get('class_id')
+        
+        # Validation already checked for an existing booking
+        if validated_data.get('already_booked'):
+            logger.warning("Duplicate booking for class %s by %s", class_id, validated_data.get('client_email'))
+            return json_response({"error": str(AlreadyBooked(class_id))}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Transactions are sync-only in Django, so the reservation runs in a thread
+        try:
+            with stage('reserve'):
+                booking = await sync_to_async(reserve_slot)(
+                    class_id,
+                    validated_data.get('client_name'),
+                    validated_data.get('client_email'),
+                    validated_data.get('fitness_class')
+                )
+        except ClassNotFound:
+            logger.warning("Fitness class not found: %s", class_id)
+            return json_response({"error": "Fitness class not found"}, status=status.HTTP_404_NOT_FOUND)
+        except ReservationError as e:
+            if isinstance(e, ClassFull):
+                ticket.sold_out()
+            logger.warning("Booking rejected for class %s: %s", class_id, e)
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        ticket.booked()
+        
+        # Serialize the booking
+        with stage('serialize'):
+            booking_serializer = BookingSerializer(booking)
+        
+        response = json_response(booking_serializer.data, status=status.HTTP_201_CREATED)
+        await routing.apin_to_primary(response, [booking.client_email])
+        
+        logger.info("Created booking %s for client %s", booking.id, booking.client_email)
+        return response
+
+
+class AsyncBookingListView(AsyncAPIView):
+    """
+    Async API view to retrieve all bookings for a specific email address.
+    """
+    
+    async def get(self, request):
+        """
+        GET method to retrieve all bookings for a specific email address.
+        """
+        email = request.GET.get('email')
+        
+        # Check if the email is provided
+        if not email:
+            logger.warning("Email parameter is required")
+            return json_response({"error": "Email parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            tz = get_request_timezone(request)
+        except ValueError as e:
+            logger.warning("Invalid bookings request: %s", e)
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Serialize the bookings with a single indexed lookup on the summaries
+        bookings = BookingSummary.objects.filter(client_email=email).order_by('-booking_time')
+        with stage('serialize'):
+            async with routing.areplica_reads(request, email):
+                data = await BookingSummarySerializer(bookings, timezone=tz).adata()
+        
+        logger.info("Retrieved %s bookings for email %s", len(data), email)
+        return json_response(data)
+
+
+class AsyncExportView(AsyncAPIView):
+    """
+    Async API view to stream every fitness class or booking as NDJSON or CSV.
+    
+    Under ASGI, Django buffers sync iterators before streaming them, so this
+    view streams from the async ORM to keep memory flat.
+    """
+    
+    async def get(self, request, resource):
+        """
+        GET method to stream an export.
+        """
+        if not await exports.acan_export(request):
+            logger.warning("Export of %s refused to an unauthorized client", resource)
+            return json_response(EXPORT_FORBIDDEN, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            export_format, since, until = export_params(resource, request.GET)
+        except ValueError as e:
+            logger.warning("Invalid export request: %s", e)
+            return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        logger.info("Exporting %s as %s since %s", resource, export_format, since)
+        return StreamingHttpResponse(
+            exports.astream_export(resource, export_format, since, until),
+            content_type=exports.CONTENT_TYPES[export_format],
+            headers=export_headers(resource, export_format, until)
+        )
@@ -0,0 +1,355 @@
+"""
+Process-local availability index of upcoming fitness classes.
+
+``AvailabilityIndex`` holds every upcoming class in parallel ``array``
+columns sorted on ``(datetime, id)``, with strings interned into lookup
+tables and per-type and per-instructor position lists. Queries for
+upcoming classes, optionally by type, instructor or time window, are
+answered with ``bisect`` and never touch the database.
+
+The index follows the database in two ways:
+
+* Model signals in this process mark it changed. Slot count changes are
+  patched in place with one primary-key query on the next read; any other
+  change rebuilds the index.
+* Other processes are followed through the shared cache, checked at most
+  every ``AVAILABILITY_CHECK_INTERVAL`` seconds. Slot count changes are
+  read from the log of changed class ids that ``cache`` keeps for the
+  listing and patched in the same way. Any other change bumps a version
+  number that rebuilds the index.
+
+This only works if the cache is shared by every process, which the
+``booking_api.E001`` deploy check enforces.
+
+While the index is being rebuilt, ``get_index()`` returns None and callers
+fall back to the database.
+"""
+import bisect
+import datetime
+import threading
+import time
+from array import array
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import cache
+from .models import FitnessClass
+from .pagination import encode_cursor, decode_cursor
+
+
+VERSION_KEY = 'availability:version'
+DEFAULT_CHECK_INTERVAL = 1.0
+
+# Changes to these fields are patched in place instead of rebuilding
+PATCHABLE_FIELDS = frozenset(['available_slots'])
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def to_micros(value):
+    """Convert an aware datetime to integer microseconds since the epoch."""
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_micros(value):
+    """Convert integer microseconds since the epoch to an aware UTC datetime."""
+    return _EPOCH + datetime.timedelta(microseconds=value)
+
+
+class _Interned:
+    """Lookup table that maps strings to small integer codes and back."""
+
+    __slots__ = ('values', 'codes')
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class AvailabilityIndex:
+    """Immutable snapshot of upcoming classes, except for the slot counts."""
+
+    __slots__ = (
+        'version', 'sequence', 'class_ids', 'starts', 'available_slots', 'total_slots',
+        'names', 'class_types', 'instructors', 'name_codes', 'type_codes',
+        'instructor_codes', 'positions', 'by_type', 'by_instructor',
+    )
+
+    def __init__(self, rows, version, sequence=None):
+        """Build the index from ``(id, datetime, name, class_type, instructor, total, available)`` rows."""
+        self.version = version
+        # Position in the slot change log the slot counts are up to date with
+        self.sequence = sequence
+        self.class_ids = array('q')
+        self.starts = array('q')
+        self.total_slots = array('l')
+        self.available_slots = array('l')
+        self.name_codes = array('l')
+        self.type_codes = array('l')
+        self.instructor_codes = array('l')
+        self.names = _Interned()
+        self.class_types = _Interned()
+        self.instructors = _Interned()
+        by_type = {}
+        by_instructor = {}
+
+        for position, (class_id, start, name, class_type, instructor, total, available) in enumerate(rows):
+            self.class_ids.append(class_id)
+            self.starts.append(to_micros(start))
+            self.total_slots.append(total)
+            self.available_slots.append(available)
+            self.name_codes.append(self.names.code(name))
+
+            type_code = self.class_types.code(class_type)
+            self.type_codes.append(type_code)
+            by_type.setdefault(type_code, array('l')).append(position)
+
+            instructor_code = self.instructors.code(instructor)
+            self.instructor_codes.append(instructor_code)
+            by_instructor.setdefault(instructor_code, array('l')).append(position)
+
+        self.positions = {class_id: position for position, class_id in enumerate(self.class_ids)}
+        self.by_type = by_type
+        self.by_instructor = by_instructor
+
+    @classmethod
+    def build(cls, version, sequence=None):
+        """Load every upcoming class with one query."""
+        rows = (
+            FitnessClass.objects.filter(datetime__gt=timezone.now())
+            .order_by('datetime', 'id')
+            .values_list(
+                'id', 'datetime', 'name', 'class_type', 'instructor', 'total_slots', 'available_slots'
+            )
+        )
+        return cls(rows.iterator(chunk_size=2000), version, sequence)
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def patch(self, rows):
+        """Update slot counts from ``(id, available_slots)`` rows."""
+        for class_id, available in rows:
+            position = self.positions.get(class_id)
+            if position is not None:
+                self.available_slots[position] = available
+
+    def _bounds(self, now, start, end, after):
+        """Return the ``[lo, hi)`` positions inside the time window."""
+        starts = self.starts
+        lo = bisect.bisect_right(starts, to_micros(now))
+        if start is not None:
+            lo = max(lo, bisect.bisect_left(starts, to_micros(start)))
+        if after is not None:
+            after_start, after_id = to_micros(after[0]), after[1]
+            position = bisect.bisect_left(starts, after_start)
+            while position < len(starts) and starts[position] == after_start and self.class_ids[position] <= after_id:
+                position += 1
+            lo = max(lo, position)
+
+        hi = len(starts) if end is None else bisect.bisect_left(starts, to_micros(end))
+        return lo, hi
+
+    def search(self, now=None, start=None, end=None, class_type=None, instructor=None,
+               has_slots=False, after=None, limit=None):
+        """
+        Return the positions of upcoming classes in ``(datetime, id)`` order.
+
+        ``start`` is inclusive and ``end`` exclusive; ``after`` is a
+        ``(datetime, id)`` keyset cursor. Unknown types or instructors match
+        nothing.
+        """
+        lo, hi = self._bounds(now or timezone.now(), start, end, after)
+
+        # Walk the narrowest candidate list; every list is in position order
+        type_code = instructor_code = None
+        candidates = None
+        if class_type is not None:
+            type_code = self.class_types.codes.get(class_type)
+            if type_code is None:
+                return []
+            candidates = self.by_type[type_code]
+        if instructor is not None:
+            instructor_code = self.instructors.codes.get(instructor)
+            if instructor_code is None:
+                return []
+            by_instructor = self.by_instructor[instructor_code]
+            if candidates is None or len(by_instructor) < len(candidates):
+                candidates = by_instructor
+
+        if candidates is None:
+            candidates = range(lo, hi)
+        else:
+            candidates = candidates[bisect.bisect_left(candidates, lo):bisect.bisect_left(candidates, hi)]
+
+        positions = []
+        for position in candidates:
+            if type_code is not None and self.type_codes[position] != type_code:
+                continue
+            if instructor_code is not None and self.instructor_codes[position] != instructor_code:
+                continue
+            if has_slots and self.available_slots[position] <= 0:
+                continue
+            positions.append(position)
+            if limit is not None and len(positions) >= limit:
+                break
+        return positions
+
+    def instance(self, position):
+        """Return an unsaved ``FitnessClass`` with the indexed fields of ``position``."""
+        return FitnessClass(
+            id=self.class_ids[position],
+            name=self.names.values[self.name_codes[position]],
+            class_type=self.class_types.values[self.type_codes[position]],
+            datetime=from_micros(self.starts[position]),
+            instructor=self.instructors.values[self.instructor_codes[position]],
+            total_slots=self.total_slots[position],
+            available_slots=self.available_slots[position],
+        )
+
+    def page(self, cursor, page_size, **filters):
+        """
+        Return one page of classes and the cursor for the next page.
+
+        Mirrors ``pagination.paginate_by_datetime``, including its cursors.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        positions = self.search(after=after, limit=page_size + 1, **filters)
+        next_cursor = None
+        if len(positions) > page_size:
+            positions = positions[:page_size]
+            last = positions[-1]
+            next_cursor = encode_cursor(from_micros(self.starts[last]), self.class_ids[last])
+        return [self.instance(position) for position in positions], next_cursor
+
+
+class _IndexHolder:
+    """Keeps the process's index in step with the database."""
+
+    def __init__(self):
+        self.index = None
+        self.stale = True
+        self.dirty = set()
+        # Set when the slot change log no longer covers what was missed
+        self.reload_slots = False
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def check(self, index):
+        """Pick up the changes other processes made since the last check."""
+        if cache.get_version(VERSION_KEY) != index.version:
+            self.stale = True
+            return
+
+        sequence = cache.get_slot_sequence()
+        if sequence == index.sequence:
+            return
+        changed = None if index.sequence is None else cache.changed_slots(index.sequence, sequence)
+        if changed is None:
+            self.reload_slots = True
+        else:
+            self.dirty.update(changed)
+        index.sequence = sequence
+
+    def get(self):
+        """Return a current index, or None if the caller should use the database."""
+        interval = getattr(settings, 'AVAILABILITY_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        now = time.monotonic()
+        if now - self.checked_at >= interval:
+            self.checked_at = now
+            if self.index is not None:
+                self.check(self.index)
+
+        if self.stale or self.index is None:
+            # Only one thread rebuilds; the others fall back to the database
+            if not self.lock.acquire(blocking=False):
+                return None
+            try:
+                self.stale = False
+                self.dirty = set()
+                self.reload_slots = False
+                version = cache.get_version(VERSION_KEY)
+                self.index = AvailabilityIndex.build(version, cache.get_slot_sequence())
+            except Exception:
+                self.stale = True
+                raise
+            finally:
+                self.lock.release()
+
+        elif self.reload_slots:
+            with self.lock:
+                if self.reload_slots:
+                    self.reload_slots = False
+                    self.dirty = set()
+                    # Classes that have started are never served, so they can keep old counts
+                    self.index.patch(
+                        FitnessClass.objects.filter(datetime__gt=timezone.now())
+                        .values_list('id', 'available_slots')
+                    )
+
+        elif self.dirty:
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+                if dirty:
+                    self.index.patch(
+                        FitnessClass.objects.filter(pk__in=dirty).values_list('id', 'available_slots')
+                    )
+
+        return self.index
+
+    def changed(self, class_ids=None, fields=None):
+        """Record a change to classes made by this process."""
+        if class_ids is not None and fields is not None and PATCHABLE_FIELDS.issuperset(fields):
+            # Other processes read slot changes from the log in the cache
+            self.dirty.update(class_ids)
+            return
+
+        self.stale = True
+
+        # Tell other processes, and keep our own version in step if nobody
+        # else changed anything in between
+        version = cache.invalidate(VERSION_KEY)
+        index = self.index
+        if index is not None and index.version == version - 1:
+            index.version = version
+
+    def clear(self):
+        """Drop the index; the next read rebuilds it."""
+        self.index = None
+        self.stale = True
+        self.dirty = set()
+        self.reload_slots = False
+
+
+_holder = _IndexHolder()
+
+
+def is_enabled():
+    """Return whether the availability index is used."""
+    return getattr(settings, 'AVAILABILITY_INDEX_ENABLED', True)
+
+
+def get_index():
+    """Return the current availability index, or None to fall back to the database."""
+    if not is_enabled():
+        return None
+    return _holder.get()
+
+
+def changed(class_ids=None, fields=None):
+    """Mark classes as changed; ``None`` means any class or field."""
+    _holder.changed(class_ids, fields)
+
+
+def clear():
+    """Drop the availability index."""
+    _holder.clear()
@@ -0,0 +1,245 @@
+"""
+Response cache for the upcoming classes listing.
+
+Rendered pages of ``GET /api/classes/`` are stored in the Django cache
+configured by ``CLASSES_CACHE_ALIAS`` (local memory by default; any backend
+with ``get``/``set``/``add``/``incr``, such as Redis, works). Every entry is
+keyed on a global version number, so invalidation is a single ``incr`` and
+stale entries simply expire. Entries also expire when the first class on
+the page starts, since it then drops out of the listing.
+
+Slot count changes, which every booking makes, don't bump the version.
+They are published to a short log of changed class ids instead, and a
+cached page whose classes are in the log has their counts patched in with
+one primary-key query when it is next read. Pages filtered on
+``has_slots`` can gain or lose classes with any slot change, so they are
+rendered again instead.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+
+
+VERSION_KEY = 'classes:version'
+DEFAULT_TIMEOUT = 60
+
+# Sequence number of the slot change log, and how long and how far back
+# its entries are kept; readers further behind re-read the counts instead
+SLOTS_SEQUENCE_KEY = 'classes:slots'
+SLOTS_LOG_TIMEOUT = 300
+SLOTS_LOG_WINDOW = 1000
+
+
+def get_cache():
+    """Return the cache backend used for the classes listing."""
+    return caches[getattr(settings, 'CLASSES_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    """Return how long cached pages live, in seconds."""
+    return getattr(settings, 'CLASSES_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_version(key=VERSION_KEY):
+    """Return the current version stored under ``key``, creating it if needed."""
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so an evicted version never reuses old keys
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(key=VERSION_KEY):
+    """Async version of ``get_version``."""
+    cache = get_cache()
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns() // 1000, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def invalidate(key=VERSION_KEY):
+    """Bump the version stored under ``key``; return the new version."""
+    cache = get_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # The version key was evicted; the next read starts a new one
+        return get_version(key)
+
+
+def slots_log_key(sequence):
+    """Build the cache key of one entry of the slot change log."""
+    return f'{SLOTS_SEQUENCE_KEY}:{sequence}'
+
+
+def get_slot_sequence():
+    """Return the sequence number of the latest slot change."""
+    return get_version(SLOTS_SEQUENCE_KEY)
+
+
+async def aget_slot_sequence():
+    """Async version of ``get_slot_sequence``."""
+    return await aget_version(SLOTS_SEQUENCE_KEY)
+
+
+def publish_slot_changes(class_ids):
+    """Log that the slot counts of ``class_ids`` changed; return the new sequence number."""
+    sequence = invalidate(SLOTS_SEQUENCE_KEY)
+    get_cache().set(slots_log_key(sequence), list(class_ids), timeout=SLOTS_LOG_TIMEOUT)
+    return sequence
+
+
+def _log_keys(since, until):
+    if not 0 < until - since <= SLOTS_LOG_WINDOW:
+        return None
+    return [slots_log_key(sequence) for sequence in range(since + 1, until + 1)]
+
+
+def _union(keys, entries):
+    # A missing entry was evicted, or is still being written
+    if keys is None or len(entries) < len(keys):
+        return None
+    return set().union(*entries.values())
+
+
+def changed_slots(since, until):
+    """
+    Return the ids of classes whose slots changed after sequence number
+    ``since`` up to ``until``, or None if the log doesn't cover them.
+    """
+    if since == until:
+        return set()
+    keys = _log_keys(since, until)
+    return _union(keys, get_cache().get_many(keys) if keys else {})
+
+
+async def achanged_slots(since, until):
+    """Async version of ``changed_slots``."""
+    if since == until:
+        return set()
+    keys = _log_keys(since, until)
+    return _union(keys, await get_cache().aget_many(keys) if keys else {})
+
+
+def make_key(version, query_params, timezone_name=''):
+    """Build the cache key for a page of the listing rendered in ``timezone_name``."""
+    query = '&'.join(
+        f'{name}={value}'
+        for name in sorted(query_params)
+        for value in query_params.getlist(name)
+    )
+    digest = hashlib.md5(f'{timezone_name}|{query}'.encode()).hexdigest()
+    return f'classes:{version}:{digest}'
+
+
+def make_entry(content, headers, classes=None, sequence=None, has_slots=False):
+    """
+    Build a cache entry for rendered content and its response headers.
+
+    Pages that render slot counts or are filtered on them pass the ids of
+    their ``classes``, in order, and the slot ``sequence`` number read
+    before the page was queried.
+    """
+    return {
+        'content': content,
+        'etag': f'"{hashlib.md5(content).hexdigest()}"',
+        'headers': headers,
+        'classes': classes,
+        'sequence': sequence,
+        'has_slots': has_slots,
+    }
+
+
+def needs_patch(entry, sequence):
+    """Return whether slot changes up to ``sequence`` may affect a cached page."""
+    return entry.get('sequence') is not None and entry['sequence'] != sequence
+
+
+def stale_classes(entry, changed):
+    """
+    Return the ids of the classes on a cached page whose slot counts must be
+    patched, given the ``changed`` ids from the log (None if unknown), or
+    None if the page must be rendered again.
+    """
+    if entry['has_slots']:
+        return None
+    if changed is None:
+        return set(entry['classes'])
+    return changed.intersection(entry['classes'])
+
+
+def patch_entry(entry, slots, sequence):
+    """Return a copy of ``entry`` with the ``{id: available_slots}`` counts patched in."""
+    content = entry['content']
+    if slots:
+        data = json.loads(content)
+        for item, class_id in zip(data, entry['classes']):
+            if class_id in slots:
+                item['available_slots'] = slots[class_id]
+        content = JSONRenderer().render(data)
+
+    patched = make_entry(content, entry['headers'], entry['classes'], sequence, entry['has_slots'])
+    patched['expires_at'] = entry['expires_at']
+    return patched
+
+
+def entry_timeout(first_start=None, timeout=None):
+    """
+    Return how long a page may be cached, in seconds: ``timeout`` (by
+    default the configured one), but no longer than until ``first_start``,
+    when the first class on the page starts.
+    """
+    timeout = get_timeout() if timeout is None else timeout
+    if first_start is not None:
+        timeout = min(timeout, first_start.timestamp() - time.time())
+    return max(timeout, 0)
+
+
+def get_entry(key):
+    """Return the cached entry for ``key``, or None."""
+    return get_cache().get(key)
+
+
+def _expiring(entry, timeout):
+    if timeout is None:
+        timeout = entry.get('expires_at', time.time() + get_timeout()) - time.time()
+    entry['expires_at'] = time.time() + timeout
+    return timeout
+
+
+def set_entry(key, entry, timeout=None):
+    """
+    Store a cache entry under ``key`` for ``timeout`` seconds, by default
+    until the entry it replaces expires or for the configured timeout.
+    """
+    timeout = _expiring(entry, timeout)
+    if timeout > 0:
+        get_cache().set(key, entry, timeout=timeout)
+
+
+async def aget_entry(key):
+    """Async version of ``get_entry``."""
+    return await get_cache().aget(key)
+
+
+async def aset_entry(key, entry, timeout=None):
+    """Async version of ``set_entry``."""
+    timeout = _expiring(entry, timeout)
+    if timeout > 0:
+        await get_cache().aset(key, entry, timeout=timeout)
+
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
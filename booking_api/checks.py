@@ -0,0 +1,66 @@
+"""
+System checks for the fitness booking API.
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+
+# Cache backends whose data only lives in the process that wrote it
+PROCESS_LOCAL_CACHES = frozenset([
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+])
+
+
+def is_process_local(alias):
+    """Return whether the cache ``alias`` is invisible to other processes."""
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    return backend in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    """
+    Check that the caches processes use to tell each other about changes
+    are shared between them.
+    """
+    errors = []
+    alias = getattr(settings, 'CLASSES_CACHE_ALIAS', 'default')
+    if not is_process_local(alias):
+        return errors
+
+    if getattr(settings, 'AVAILABILITY_INDEX_ENABLED', True):
+        errors.append(Error(
+            f"The availability index follows other processes through the '{alias}' cache, "
+            f"which is local to each process.",
+            hint="Point CLASSES_CACHE_ALIAS at a shared cache such as Redis, "
+                 "or set AVAILABILITY_INDEX_ENABLED = False.",
+            id='booking_api.E001',
+        ))
+    else:
+        errors.append(Warning(
+            f"Cached classes pages are invalidated through the '{alias}' cache, which is local to "
+            f"each process, so other processes serve them for up to CLASSES_CACHE_TIMEOUT seconds "
+            f"after a change.",
+            hint="Point CLASSES_CACHE_ALIAS at a shared cache such as Redis.",
+            id='booking_api.W001',
+        ))
+    return errors
+
+
+@register(Tags.caches, Tags.database, deploy=True)
+def check_replica_pin_cache(app_configs, **kwargs):
+    """
+    Check that clients pinned to the primary after a write stay pinned
+    whichever process serves their next read.
+    """
+    alias = getattr(settings, 'DATABASE_REPLICA_PIN_CACHE_ALIAS', 'default')
+    if not getattr(settings, 'DATABASE_REPLICAS', []) or not is_process_local(alias):
+        return []
+
+    return [Error(
+        f"Clients are pinned to the primary through the '{alias}' cache, which is local to each "
+        f"process, so their next read from another process can miss their own writes.",
+        hint="Point DATABASE_REPLICA_PIN_CACHE_ALIAS at a shared cache such as Redis.",
+        id='booking_api.E002',
+    )]
@@ -0,0 +1,206 @@
+"""
+Streaming exports of fitness classes and bookings.
+
+Rows are read with ``.iterator()`` in chunks and encoded one chunk at a
+time, so memory use stays flat however large the tables are. Exports can
+be incremental: ``since`` selects rows whose ``updated_at`` (classes) or
+``booking_time`` (bookings) is later than a previous export's resume point.
+
+Timestamps are taken when a row is written, not when its transaction
+commits, so a row can become visible after an export that started later
+than its timestamp. The resume point is therefore ``EXPORT_OVERLAP``
+seconds before the export started, and consecutive incremental exports
+overlap by that much: consumers should upsert rows by ``id``.
+
+Cancelled bookings are deleted, so incremental exports never report them;
+a full export shows which bookings still exist.
+
+Exports include every client's name and email, so the endpoints only serve
+staff users and requests with ``Authorization: Bearer <EXPORT_TOKEN>``.
+"""
+import csv
+import datetime
+import hmac
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import dateparse, timezone
+from rest_framework import serializers
+
+from .models import FitnessClass, Booking
+
+
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_OVERLAP = 60
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+FORMATS = tuple(CONTENT_TYPES)
+
+
+class ExportResource:
+    """An exportable model: the fields to write and the field ``since`` filters on."""
+
+    __slots__ = ('model', 'fields', 'since_field')
+
+    def __init__(self, model, fields, since_field):
+        self.model = model
+        self.fields = fields
+        self.since_field = since_field
+
+
+RESOURCES = {
+    'classes': ExportResource(
+        FitnessClass,
+        [
+            'id', 'name', 'class_type', 'datetime', 'instructor',
+            'total_slots', 'available_slots', 'created_at', 'updated_at',
+        ],
+        'updated_at',
+    ),
+    'bookings': ExportResource(
+        Booking,
+        ['id', 'fitness_class', 'client_name', 'client_email', 'booking_time'],
+        'booking_time',
+    ),
+}
+
+
+def has_token(request):
+    """Return whether the request carries the configured ``EXPORT_TOKEN``."""
+    token = getattr(settings, 'EXPORT_TOKEN', None)
+    scheme, _, value = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(value.encode(), token.encode())
+
+
+def can_export(request):
+    """Return whether the request may download exports: staff users and token holders."""
+    if has_token(request):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_active and user.is_staff
+
+
+async def acan_export(request):
+    """Async version of ``can_export``; loading the user may query the session."""
+    return await sync_to_async(can_export)(request)
+
+
+def parse_since(value):
+    """
+    Parse a ``since`` parameter into an aware datetime, or None if empty.
+
+    Raises ``ValueError`` if it is not an ISO 8601 datetime.
+    """
+    if not value:
+        return None
+
+    try:
+        since = dateparse.parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise ValueError("since must be an ISO 8601 datetime")
+
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def resume_point(until):
+    """
+    Return the ``since`` to pass to the export after one that read rows up
+    to ``until``: ``EXPORT_OVERLAP`` seconds earlier, to catch rows whose
+    transactions were still running.
+    """
+    return until - datetime.timedelta(seconds=getattr(settings, 'EXPORT_OVERLAP', DEFAULT_OVERLAP))
+
+
+def export_queryset(resource, since=None, until=None):
+    """
+    Return the rows of ``resource`` to export, as tuples of its fields.
+
+    Rows are ordered by the ``since`` field, so an interrupted export can be
+    resumed from the last row written.
+    """
+    resource = RESOURCES[resource]
+    queryset = resource.model.objects.all()
+    if since is not None:
+        queryset = queryset.filter(**{f'{resource.since_field}__gt': since})
+    if until is not None:
+        queryset = queryset.filter(**{f'{resource.since_field}__lte': until})
+
+    return queryset.order_by(resource.since_field, 'pk').values_list(*resource.fields)
+
+
+class _Echo:
+    """File-like object whose ``write`` returns what it was given, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+class RowEncoder:
+    """Encode chunks of exported rows as NDJSON or CSV text."""
+
+    def __init__(self, fields, export_format):
+        self.fields = fields
+        self.export_format = export_format
+        # Reuse DRF's field so datetimes are written exactly as the API renders them
+        self.to_datetime = serializers.DateTimeField().to_representation
+        self.writer = csv.writer(_Echo())
+
+    def _values(self, row):
+        return [
+            self.to_datetime(value) if isinstance(value, datetime.datetime) else value
+            for value in row
+        ]
+
+    def header(self):
+        """Return the text written before the first row."""
+        if self.export_format == 'csv':
+            return self.writer.writerow(self.fields)
+        return ''
+
+    def encode(self, rows):
+        """Return the text for a chunk of rows."""
+        if self.export_format == 'csv':
+            return ''.join(self.writer.writerow(self._values(row)) for row in rows)
+
+        return ''.join(
+            json.dumps(dict(zip(self.fields, self._values(row))), separators=(',', ':')) + '\n'
+            for row in rows
+        )
+
+
+def stream_export(resource, export_format='ndjson', since=None, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the export of ``resource`` as text, one chunk of rows at a time."""
+    encoder = RowEncoder(RESOURCES[resource].fields, export_format)
+    yield encoder.header()
+
+    chunk = []
+    for row in export_queryset(resource, since, until).iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield encoder.encode(chunk)
+            chunk = []
+    if chunk:
+        yield encoder.encode(chunk)
+
+
+async def astream_export(resource, export_format='ndjson', since=None, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Async version of ``stream_export``.
+
+    The sync generator is advanced one chunk at a time in the thread that
+    owns the database connection, since ``aiterator()`` can't run a
+    ``values_list()`` query from an async context in Django 4.2.
+    """
+    chunks = stream_export(resource, export_format, since, until, chunk_size)
+    next_chunk = sync_to_async(next)
+
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
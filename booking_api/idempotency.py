@@ -0,0 +1,302 @@
+"""
+Idempotency keys for booking requests.
+
+Clients on flaky networks retry requests whose response they never got.
+With an ``Idempotency-Key`` header, the first request with a key claims it
+by inserting an ``IdempotencyRecord`` and stores its response there once
+it has run. Retries with the same key get that response back, marked with
+``Idempotent-Replayed: true``, without running the view again:
+
+* Stored responses are also kept in the cache for
+  ``IDEMPOTENCY_CACHE_TIMEOUT`` seconds, so replays usually cost no query.
+  The table keeps them for ``IDEMPOTENCY_KEY_TTL`` seconds, across restarts
+  and cache evictions; ``manage.py purge_idempotency_keys`` removes expired
+  keys.
+* A retry that arrives while the first request is still running is not
+  run alongside it: it waits up to ``IDEMPOTENCY_WAIT_TIMEOUT`` seconds for
+  the first response and replays it, and gets a 409 with ``Retry-After`` if
+  the first request is still running then. A waiting sync retry holds a
+  worker thread, so the wait is short, and it checks the table less and
+  less often; async retries sleep on the event loop between checks
+  instead. A first request that hasn't finished within
+  ``IDEMPOTENCY_LEASE`` seconds is taken to have died, and the next retry
+  runs in its place.
+* Reusing a key for a different request is an error, and server errors are
+  not stored, so they can be retried with the same key.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyRecord
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+KEY_MAX_LENGTH = IdempotencyRecord._meta.get_field('key').max_length
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_CACHE_TIMEOUT = 60 * 60
+DEFAULT_LEASE = 30.0
+DEFAULT_WAIT_TIMEOUT = 2.0
+
+# How often a waiting retry checks for a response stored by another
+# process: first after POLL_INTERVAL seconds, then twice as long each time
+POLL_INTERVAL = 0.05
+MAX_POLL_INTERVAL = 0.5
+
+# Wakes retries waiting in this process when a response is stored
+_finished = threading.Condition()
+
+
+class IdempotencyError(Exception):
+    """Base class for requests that can't be run or replayed under their key."""
+
+    status_code = 400
+    message = "Invalid Idempotency-Key"
+    # Seconds to send in a Retry-After header, if the request may be retried
+    retry_after = None
+
+    def __init__(self, message=None):
+        super().__init__(message or self.message)
+
+
+class InvalidKey(IdempotencyError):
+    """The key is empty, too long or not printable."""
+
+    message = f"Idempotency-Key must be 1 to {KEY_MAX_LENGTH} printable characters"
+
+
+class KeyReused(IdempotencyError):
+    """The key was first used with a different request."""
+
+    status_code = 422
+    message = "Idempotency-Key was already used for a different request"
+
+
+class RequestInProgress(IdempotencyError):
+    """The first request with the key is still running."""
+
+    status_code = 409
+    message = "A request with this Idempotency-Key is still in progress; retry later"
+    retry_after = 1
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_cache():
+    """Return the cache that stored responses are kept in."""
+    return caches[_setting('IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def cache_key(key):
+    """Build the cache key of a stored response."""
+    return f'idempotency:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def fingerprint(request):
+    """Hash the method, path and body of a request."""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _stored(record):
+    return {
+        'fingerprint': record.fingerprint,
+        'status_code': record.status_code,
+        'data': record.response,
+    }
+
+
+def _replay(stored, request_fingerprint):
+    if stored['fingerprint'] != request_fingerprint:
+        raise KeyReused()
+    return stored
+
+
+def _cache(key, stored, expires_at):
+    timeout = min(_setting('IDEMPOTENCY_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT),
+                  (expires_at - timezone.now()).total_seconds())
+    if timeout > 0:
+        get_cache().set(cache_key(key), stored, timeout=timeout)
+
+
+def _wake():
+    with _finished:
+        _finished.notify_all()
+
+
+class Claim:
+    """
+    The right to run the request for a key; use it as a context manager.
+
+    Call ``complete()`` with the response. Leaving the block without it,
+    e.g. because the view raised, releases the key for a retry.
+    """
+
+    def __init__(self, key, request_fingerprint, locked_until, expires_at):
+        self.key = key
+        self.fingerprint = request_fingerprint
+        self.locked_until = locked_until
+        self.expires_at = expires_at
+        self.done = False
+
+    def _mine(self):
+        return IdempotencyRecord.objects.filter(
+            key=self.key, locked_until=self.locked_until, status_code__isnull=True
+        )
+
+    def complete(self, status_code, data):
+        """Store the response for replays; server errors release the key instead."""
+        if status_code >= 500:
+            self.release()
+            return
+
+        self.done = True
+        # Store plain JSON, so replays from the cache and the table match
+        data = json.loads(json.dumps(data, cls=JSONEncoder))
+        if self._mine().update(status_code=status_code, response=data):
+            _cache(self.key, {'fingerprint': self.fingerprint, 'status_code': status_code, 'data': data},
+                   self.expires_at)
+        _wake()
+
+    def release(self):
+        """Give up the key, so the next retry runs the request."""
+        self.done = True
+        self._mine().delete()
+        _wake()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.done:
+            self.release()
+
+    async def acomplete(self, status_code, data):
+        """Async version of ``complete``."""
+        await sync_to_async(self.complete)(status_code, data)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if not self.done:
+            await sync_to_async(self.release)()
+
+
+def _claim(key, request_fingerprint, record=None):
+    """
+    Claim the key, or take over an expired or abandoned ``record`` of it.
+
+    Returns the ``Claim``, or None if another request got there first.
+    """
+    now = timezone.now()
+    locked_until = now + datetime.timedelta(seconds=_setting('IDEMPOTENCY_LEASE', DEFAULT_LEASE))
+    expires_at = now + datetime.timedelta(seconds=_setting('IDEMPOTENCY_KEY_TTL', DEFAULT_TTL))
+    fields = {
+        'fingerprint': request_fingerprint,
+        'status_code': None,
+        'response': None,
+        'locked_until': locked_until,
+        'expires_at': expires_at,
+    }
+
+    if record is None:
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(key=key, **fields)
+        except IntegrityError:
+            return None
+    # locked_until changes with every claim, so only one request takes over
+    elif not IdempotencyRecord.objects.filter(pk=record.pk, locked_until=record.locked_until).update(**fields):
+        return None
+
+    return Claim(key, request_fingerprint, locked_until, expires_at)
+
+
+def begin(key, request_fingerprint, wait_timeout=None):
+    """
+    Start a request made with the idempotency ``key``.
+
+    Returns a ``Claim`` if the request should run, or the stored response
+    to replay as a dict with ``status_code`` and ``data``. While another
+    request with the key is running, waits up to ``wait_timeout`` seconds
+    (``IDEMPOTENCY_WAIT_TIMEOUT`` by default) for its response. Raises
+    ``IdempotencyError`` if the request can be neither run nor replayed.
+    """
+    if not key or len(key) > KEY_MAX_LENGTH or not key.isprintable():
+        raise InvalidKey()
+
+    stored = get_cache().get(cache_key(key))
+    if stored is not None:
+        return _replay(stored, request_fingerprint)
+
+    if wait_timeout is None:
+        wait_timeout = _setting('IDEMPOTENCY_WAIT_TIMEOUT', DEFAULT_WAIT_TIMEOUT)
+    deadline = time.monotonic() + wait_timeout
+    interval = POLL_INTERVAL
+    while True:
+        now = timezone.now()
+        record = IdempotencyRecord.objects.filter(key=key).first()
+
+        if record is not None and record.expires_at > now:
+            if record.status_code is not None:
+                stored = _stored(record)
+                _cache(key, stored, record.expires_at)
+                return _replay(stored, request_fingerprint)
+            if record.fingerprint != request_fingerprint:
+                raise KeyReused()
+            if record.locked_until > now:
+                # Wait for the running request to store its response
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RequestInProgress()
+                with _finished:
+                    _finished.wait(min(interval, remaining))
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                continue
+
+        claim = _claim(key, request_fingerprint, record)
+        if claim is not None:
+            return claim
+
+
+async def abegin(key, request_fingerprint):
+    """
+    Async version of ``begin``.
+
+    Waiting in ``begin`` would hold the thread the async views share for
+    database work, which the running request may need to finish, so each
+    check runs there without waiting and the retry sleeps on the event loop
+    in between.
+    """
+    deadline = time.monotonic() + _setting('IDEMPOTENCY_WAIT_TIMEOUT', DEFAULT_WAIT_TIMEOUT)
+    interval = POLL_INTERVAL
+    while True:
+        try:
+            return await sync_to_async(begin)(key, request_fingerprint, wait_timeout=0)
+        except RequestInProgress:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+
+def purge(now=None):
+    """Delete expired keys; return how many were deleted."""
+    return IdempotencyRecord.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
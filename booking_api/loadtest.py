@@ -0,0 +1,285 @@
+"""
+In-process load generator for the fitness booking API.
+
+Requests are driven straight through the ASGI or WSGI application, so no
+server or network is involved and the numbers reflect the Django stack
+itself.
+"""
+import asyncio
+import contextlib
+import io
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that counts queries across threads.
+
+    While started, it installs itself on every new database connection, so
+    it sees queries from WSGI worker threads and from the per-request
+    threads the ASGI handler runs sync code in.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.active = False
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active:
+            with self._lock:
+                self.count += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def start(self):
+        """Start counting queries."""
+        self.active = True
+        connection_created.connect(self._install)
+        for conn in connections.all(initialized_only=True):
+            self._install(sender=None, connection=conn)
+
+    def stop(self):
+        """Stop counting queries."""
+        self.active = False
+        connection_created.disconnect(self._install)
+
+
+def percentile(sorted_values, pct):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, elapsed, statuses, queries=None, sizes=None):
+    """Summarize request latencies (in seconds) and response sizes (in bytes) into a result dict."""
+    latencies = sorted(latencies)
+    result = {
+        'requests': len(latencies),
+        'elapsed_s': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'statuses': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+    }
+    if queries is not None and latencies:
+        result['queries_per_request'] = round(queries / len(latencies), 2)
+    if sizes:
+        result['response_bytes'] = round(sum(sizes) / len(sizes))
+    return result
+
+
+async def asgi_request(app, method, path, query_string='', body=b'', headers=()):
+    """
+    Send one HTTP request through an ASGI application.
+
+    Returns ``(status, body)``.
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query_string.encode(),
+        'root_path': '',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'content-length', str(len(body)).encode()),
+            *headers,
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    done = asyncio.Event()
+    sent_body = False
+    response = {'status': None, 'body': []}
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # Only report a disconnect once the response is complete
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+            if not message.get('more_body'):
+                done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    return response['status'], b''.join(response['body'])
+
+
+async def run_load(app, make_request, total, concurrency, count_queries=False):
+    """
+    Send ``total`` requests with at most ``concurrency`` in flight.
+
+    ``make_request(i)`` returns the keyword arguments for ``asgi_request``.
+    With ``count_queries``, the average number of queries per request is
+    included in the result.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = []
+    sizes = []
+
+    counter = QueryCounter()
+    if count_queries:
+        counter.start()
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            status_code, content = await asgi_request(app, **make_request(i))
+            latencies.append(time.perf_counter() - start)
+            statuses.append(status_code)
+            sizes.append(len(content))
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(i) for i in range(total)))
+    finally:
+        counter.stop()
+    elapsed = time.perf_counter() - start
+
+    return summarize(latencies, elapsed, statuses, counter.count if count_queries else None, sizes)
+
+
+def wsgi_request(app, method, path, query_string='', body=b'', headers=()):
+    """
+    Send one HTTP request through a WSGI application.
+
+    Returns ``(status, body)``.
+    """
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers:
+        name = name.decode().upper().replace('-', '_')
+        if name == 'CONTENT_TYPE':
+            environ[name] = value.decode()
+        else:
+            environ[f'HTTP_{name}'] = value.decode()
+
+    response = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+
+    chunks = app(environ, start_response)
+    try:
+        content = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            # Sends request_finished, which closes or recycles DB connections
+            chunks.close()
+    return response['status'], content
+
+
+def run_threaded_load(app, make_request, total, concurrency, count_queries=False):
+    """
+    Send ``total`` requests through a WSGI app from ``concurrency`` threads.
+
+    ``make_request(i)`` returns the keyword arguments for ``wsgi_request``.
+    With ``count_queries``, the average number of queries per request is
+    included in the result.
+    """
+    counter = QueryCounter()
+    if count_queries:
+        counter.start()
+
+    def one(i):
+        start = time.perf_counter()
+        status_code, content = wsgi_request(app, **make_request(i))
+        return time.perf_counter() - start, status_code, len(content)
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(one, range(total)))
+    finally:
+        counter.stop()
+    elapsed = time.perf_counter() - start
+
+    return summarize(
+        [latency for latency, _, _ in outcomes],
+        elapsed,
+        [code for _, code, _ in outcomes],
+        counter.count if count_queries else None,
+        [size for _, _, size in outcomes]
+    )
+
+
+@contextlib.contextmanager
+def scratch_database(settings_module=None, **extra_env):
+    """
+    Yield a ``manage(*command)`` function bound to a fresh, migrated database.
+
+    Commands run in subprocesses with ``SQLITE_PATH`` pointing at a
+    temporary file, so benchmarks never touch the configured database.
+    """
+    manage_py = str(settings.BASE_DIR / 'manage.py')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=settings_module or os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'fitness_booking.settings'
+            ),
+            SQLITE_PATH=os.path.join(tmpdir, 'benchmark.sqlite3'),
+            **extra_env,
+        )
+
+        def manage(*command):
+            completed = subprocess.run(
+                [sys.executable, manage_py, *command],
+                env=env, capture_output=True, text=True
+            )
+            if completed.returncode:
+                raise CommandError(f"{' '.join(command)} failed:\n{completed.stderr}")
+            return completed.stdout
+
+        manage('migrate', '--verbosity', '0')
+        yield manage
@@ -0,0 +1,240 @@
+"""
+Management command to benchmark the booking API end to end.
+"""
+from django.core.asgi import get_asgi_application
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+import asyncio
+import datetime
+import json
+import platform
+import uuid
+
+import django
+
+from booking_api.loadtest import run_load, run_threaded_load, scratch_database
+from booking_api.models import FitnessClass, Booking
+
+
+SCENARIOS = ('classes', 'filtered', 'bookings', 'book', 'timezone')
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED_METRICS = {
+    'throughput_rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'queries_per_request': False,
+    'response_bytes': False,
+}
+
+
+class Command(BaseCommand):
+    """Command to benchmark the API through the WSGI and ASGI applications."""
+
+    help = (
+        'Seed a scratch database and benchmark /api/classes/ (with and without filters), /api/bookings/, '
+        '/api/book/ and /api/timezone/ through the WSGI and ASGI apps'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=1000, help='Classes to seed')
+        parser.add_argument('--bookings-per-class', type=int, default=5, help='Bookings to seed per class')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the dataset')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once')
+        parser.add_argument(
+            '--server', choices=('wsgi', 'asgi', 'both'), default='both', help='Application(s) to drive'
+        )
+        parser.add_argument(
+            '--scenarios', default=','.join(SCENARIOS), help=f"Comma-separated scenarios ({', '.join(SCENARIOS)})"
+        )
+        parser.add_argument('--async-views', action='store_true', help='Route the API to the async views')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare the results against this JSON file')
+        parser.add_argument(
+            '--threshold', type=float, default=10.0, help='Percent change that counts as a regression'
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true', help='Exit with an error if any metric regressed'
+        )
+        parser.add_argument('--worker', action='store_true', help='Run the load in this process (internal)')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+        scenarios = options['scenarios'].split(',')
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        servers = ['wsgi', 'asgi'] if options['server'] == 'both' else [options['server']]
+
+        if options['worker']:
+            results = self._run_worker(servers, scenarios, options['requests'], options['concurrency'])
+            self.stdout.write(json.dumps(results))
+            return
+
+        extra_env = {'ASYNC_BOOKING_VIEWS': '1'} if options['async_views'] else {}
+        with scratch_database(**extra_env) as manage:
+            manage(
+                'seed_data',
+                '--classes', str(options['classes']),
+                '--bookings-per-class', str(options['bookings_per_class']),
+                '--seed', str(options['seed']),
+            )
+            output = manage(
+                'benchmark', '--worker',
+                '--server', options['server'],
+                '--scenarios', ','.join(scenarios),
+                '--requests', str(options['requests']),
+                '--concurrency', str(options['concurrency']),
+            )
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'platform': platform.platform(),
+            },
+            'parameters': {
+                name: options[name] for name in (
+                    'classes', 'bookings_per_class', 'seed', 'requests', 'concurrency', 'async_views'
+                )
+            },
+            'results': json.loads(output.strip().splitlines()[-1]),
+        }
+
+        self._print_results(report['results'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Wrote results to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = self._compare(baseline['results'], report['results'], options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{regressions} metric(s) regressed by more than {options['threshold']}%")
+
+    def _print_results(self, results):
+        """Print one line per server and scenario."""
+        for server, scenarios in results.items():
+            for scenario, result in scenarios.items():
+                self.stdout.write(
+                    f"{server:<5} {scenario:<9} {result['throughput_rps']:>8} req/s  "
+                    f"p50 {result['p50_ms']:>7} ms  p95 {result['p95_ms']:>7} ms  "
+                    f"p99 {result['p99_ms']:>7} ms  {result.get('queries_per_request', '-'):>5} q/req  "
+                    f"{result.get('response_bytes', '-'):>7} B  "
+                    f"{result['statuses']}"
+                )
+
+    def _compare(self, baseline, results, threshold):
+        """Print the change of each metric against a baseline; return the number of regressions."""
+        regressions = 0
+        self.stdout.write(f"Comparison against baseline (threshold {threshold}%):")
+
+        for server, scenarios in results.items():
+            for scenario, result in scenarios.items():
+                previous = baseline.get(server, {}).get(scenario)
+                if previous is None:
+                    continue
+
+                for metric, higher_is_better in COMPARED_METRICS.items():
+                    old, new = previous.get(metric), result.get(metric)
+                    if not old or new is None:
+                        continue
+
+                    change = (new - old) / old * 100
+                    regressed = (-change if higher_is_better else change) > threshold
+                    regressions += regressed
+
+                    line = f"  {server:<5} {scenario:<9} {metric:<20} {old:>9} -> {new:>9} ({change:+.1f}%)"
+                    self.stdout.write(self.style.ERROR(line + '  REGRESSION') if regressed else line)
+
+        return regressions
+
+    def _build_requests(self, label):
+        """Build the request factories for each scenario."""
+        class_ids = list(
+            FitnessClass.objects.filter(datetime__gt=timezone.now() + datetime.timedelta(days=1))
+            .filter(available_slots__gt=0)
+            .values_list('id', flat=True)
+        )
+        emails = list(
+            Booking.objects.values('client_email')
+            .annotate(total=Count('id'))
+            .order_by('-total')
+            .values_list('client_email', flat=True)[:100]
+        )
+        if not class_ids or not emails:
+            raise CommandError('The benchmark database has no bookable classes or bookings')
+
+        run_id = uuid.uuid4().hex[:8]
+        timezones = ['America/New_York', 'Europe/London', 'Asia/Kolkata']
+        class_types = [value for value, _ in FitnessClass.CLASS_TYPES]
+        today = timezone.localdate()
+
+        return {
+            'classes': lambda i: {
+                'method': 'GET',
+                'path': '/api/classes/',
+                # Vary the page size so requests are not all served from cache
+                'query_string': f'page_size={10 + i % 90}',
+            },
+            'filtered': lambda i: {
+                'method': 'GET',
+                'path': '/api/classes/',
+                # Open classes of one type in the next few days, varied to miss the cache
+                'query_string': (
+                    f'page_size={10 + i % 90}&class_type={class_types[i % len(class_types)]}'
+                    f'&has_slots=true&date_to={(today + datetime.timedelta(days=1 + i % 7)).isoformat()}'
+                ),
+            },
+            'bookings': lambda i: {
+                'method': 'GET',
+                'path': '/api/bookings/',
+                'query_string': f'email={emails[i % len(emails)]}',
+            },
+            'book': lambda i: {
+                'method': 'POST',
+                'path': '/api/book/',
+                'body': json.dumps({
+                    'class_id': class_ids[i % len(class_ids)],
+                    'client_name': 'Benchmark',
+                    'client_email': f'bench-{run_id}-{label}-{i}@example.com',
+                }).encode(),
+                'headers': [(b'content-type', b'application/json')],
+            },
+            'timezone': lambda i: {
+                'method': 'POST',
+                'path': '/api/timezone/',
+                'body': json.dumps({'timezone': timezones[i % len(timezones)]}).encode(),
+                'headers': [(b'content-type', b'application/json')],
+            },
+        }
+
+    def _run_worker(self, servers, scenarios, total, concurrency):
+        """Run every scenario through each application in this process."""
+        results = {}
+
+        for server in servers:
+            # Fresh emails per server, so bookings don't collide between runs
+            requests = self._build_requests(server)
+
+            for scenario in scenarios:
+                if server == 'wsgi':
+                    result = run_threaded_load(
+                        WSGIHandler(), requests[scenario], total, concurrency, count_queries=True
+                    )
+                else:
+                    result = asyncio.run(run_load(
+                        get_asgi_application(), requests[scenario], total, concurrency, count_queries=True
+                    ))
+                results.setdefault(server, {})[scenario] = result
+
+        return results
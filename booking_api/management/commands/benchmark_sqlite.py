@@ -0,0 +1,103 @@
+"""
+Management command to compare SQLite settings profiles under concurrent load.
+"""
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+import json
+import uuid
+
+from booking_api.loadtest import run_threaded_load, scratch_database
+from booking_api.models import FitnessClass
+
+
+# Settings modules to compare
+PROFILES = {
+    'default': 'fitness_booking.settings',
+    'production': 'fitness_booking.settings_production',
+}
+
+
+class Command(BaseCommand):
+    """Command to benchmark booking throughput for each SQLite settings profile."""
+    
+    help = 'Compare booking throughput of the default and production SQLite settings'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+        parser.add_argument('--classes', type=int, default=500, help='Classes in the benchmark database')
+        parser.add_argument('--profiles', default=','.join(PROFILES), help='Comma-separated profiles to run')
+        parser.add_argument('--worker', action='store_true', help='Run the load in this process (internal)')
+    
+    def handle(self, *args, **options):
+        """Handle the command."""
+        if options['worker']:
+            results = self._run_worker(options['requests'], options['concurrency'])
+            self.stdout.write(json.dumps(results))
+            return
+        
+        results = {}
+        for profile in options['profiles'].split(','):
+            if profile not in PROFILES:
+                raise CommandError(f"Unknown profile: {profile}")
+            results[profile] = self._run_profile(profile, options)
+            
+            for scenario, result in results[profile].items():
+                self.stdout.write(
+                    f"{profile:<11} {scenario:<8} {result['throughput_rps']:>8} req/s  "
+                    f"p50 {result['p50_ms']:>7} ms  p95 {result['p95_ms']:>7} ms  "
+                    f"p99 {result['p99_ms']:>7} ms  {result['statuses']}"
+                )
+        
+        self.stdout.write(json.dumps(results, indent=2))
+    
+    def _run_profile(self, profile, options):
+        """Create a fresh database for ``profile`` and run the worker against it."""
+        with scratch_database(PROFILES[profile]) as manage:
+            manage('seed_data', '--classes', str(options['classes']), '--bookings-per-class', '0', '--seed', '1')
+            output = manage(
+                'benchmark_sqlite', '--worker',
+                '--requests', str(options['requests']),
+                '--concurrency', str(options['concurrency'])
+            )
+        
+        return json.loads(output.strip().splitlines()[-1])
+    
+    def _run_worker(self, total, concurrency):
+        """Drive booking writes and mixed reads/writes through the WSGI app."""
+        class_ids = list(
+            FitnessClass.objects.filter(datetime__gt=timezone.now()).values_list('id', flat=True)
+        )
+        if not class_ids:
+            raise CommandError('No upcoming classes found')
+        
+        app = WSGIHandler()
+        run_id = uuid.uuid4().hex[:8]
+        
+        def book(i):
+            return {
+                'method': 'POST',
+                'path': '/api/book/',
+                'body': json.dumps({
+                    'class_id': class_ids[i % len(class_ids)],
+                    'client_name': 'Benchmark',
+                    'client_email': f'bench-{run_id}-{i}@example.com',
+                }).encode(),
+                'headers': [(b'content-type', b'application/json')],
+            }
+        
+        def mixed(i):
+            # Every other request reads back an earlier client's bookings
+            if i % 2:
+                return {
+                    'method': 'GET',
+                    'path': '/api/bookings/',
+                    'query_string': f'email=bench-{run_id}-{i - 1}@example.com',
+                }
+            return book(total + i)
+        
+        return {
+            'book': run_threaded_load(app, book, total, concurrency),
+            'mixed': run_threaded_load(app, mixed, total, concurrency),
+        }
@@ -0,0 +1,34 @@
+"""
+Management command to fold sharded slot counters back into their classes.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking_api import shards
+
+
+class Command(BaseCommand):
+    """Command to bring available_slots of sharded classes up to date with their shards."""
+
+    help = 'Copy the free slots of sharded classes from their shards into available_slots where they differ'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, help='Fold again every this many seconds until interrupted'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+        try:
+            while True:
+                started = time.monotonic()
+                class_ids = shards.unfolded()
+                folded = shards.fold(class_ids) if class_ids else 0
+                self.stdout.write(f"Folded the shards of {folded} classes")
+
+                if options['interval'] is None:
+                    break
+                time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,106 @@
+"""
+Management command to compare the sync and async views under ASGI.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.core.asgi import get_asgi_application
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import include, path
+from django.utils import timezone
+import asyncio
+import json
+import uuid
+
+from booking_api.loadtest import run_load
+from booking_api.models import FitnessClass, Booking
+from booking_api.urls import get_urlpatterns
+
+
+class URLConf:
+    """URL configuration routing the API to either the sync or async views."""
+    
+    def __init__(self, use_async):
+        self.urlpatterns = [path('api/', include(get_urlpatterns(use_async)))]
+
+
+class Command(BaseCommand):
+    """Command to load test the sync and async views through the ASGI app."""
+    
+    help = 'Compare latency and throughput of the sync and async views under ASGI'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once')
+        parser.add_argument('--book', action='store_true', help='Also load test POST /api/book/ (writes bookings)')
+        parser.add_argument('--no-cache', action='store_true', help='Bypass the classes listing cache')
+    
+    def handle(self, *args, **options):
+        """Handle the command."""
+        results = {}
+        
+        cache_settings = {}
+        if options['no_cache']:
+            cache_settings['CACHES'] = {
+                'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+            }
+        
+        for mode in ('sync', 'async'):
+            with override_settings(ROOT_URLCONF=URLConf(mode == 'async'), **cache_settings):
+                app = get_asgi_application()
+                # Built per mode so each one books into a class with free slots
+                scenarios = self._build_scenarios(options['book'])
+                for name, make_request in scenarios.items():
+                    result = asyncio.run(
+                        run_load(app, make_request, options['requests'], options['concurrency'])
+                    )
+                    results.setdefault(name, {})[mode] = result
+                    self.stdout.write(
+                        f"{name:<10} {mode:<6} {result['throughput_rps']:>8} req/s  "
+                        f"p50 {result['p50_ms']:>7} ms  p95 {result['p95_ms']:>7} ms  "
+                        f"p99 {result['p99_ms']:>7} ms  {result['statuses']}"
+                    )
+        
+        self.stdout.write(json.dumps(results, indent=2))
+    
+    def _build_scenarios(self, include_booking):
+        """Build the request factories for each scenario."""
+        busiest = (
+            Booking.objects.values('client_email')
+            .annotate(total=Count('id'))
+            .order_by('-total')
+            .first()
+        )
+        if busiest is None:
+            raise CommandError('No bookings found; run seed_data first')
+        
+        scenarios = {
+            'classes': lambda i: {'method': 'GET', 'path': '/api/classes/'},
+            'bookings': lambda i: {
+                'method': 'GET',
+                'path': '/api/bookings/',
+                'query_string': f"email={busiest['client_email']}",
+            },
+        }
+        
+        if include_booking:
+            fitness_class = (
+                FitnessClass.objects.filter(datetime__gt=timezone.now())
+                .order_by('-available_slots')
+                .first()
+            )
+            if fitness_class is None:
+                raise CommandError('No upcoming classes found; run seed_data first')
+            
+            run_id = uuid.uuid4().hex[:8]
+            scenarios['book'] = lambda i: {
+                'method': 'POST',
+                'path': '/api/book/',
+                'body': json.dumps({
+                    'class_id': fitness_class.id,
+                    'client_name': 'Load Test',
+                    'client_email': f'loadtest-{run_id}-{i}@example.com',
+                }).encode(),
+                'headers': [(b'content-type', b'application/json')],
+            }
+        
+        return scenarios
@@ -0,0 +1,17 @@
+"""
+Management command to delete expired idempotency keys.
+"""
+from django.core.management.base import BaseCommand
+
+from booking_api import idempotency
+
+
+class Command(BaseCommand):
+    """Command to delete idempotency keys past their expiry."""
+
+    help = 'Delete stored booking responses whose Idempotency-Key has expired'
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+        count = idempotency.purge()
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} expired idempotency keys'))
@@ -0,0 +1,17 @@
+"""
+Management command to rebuild the per-client booking summaries.
+"""
+from django.core.management.base import BaseCommand
+
+from booking_api import summaries
+
+
+class Command(BaseCommand):
+    """Command to rebuild the booking summary table from scratch."""
+
+    help = 'Rebuild the booking summaries used by GET /api/bookings/ from the bookings and classes'
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+        count = summaries.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} booking summaries'))
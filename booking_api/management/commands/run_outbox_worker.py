@@ -0,0 +1,66 @@
+"""
+Management command to deliver outbox messages.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from booking_api import outbox
+
+
+class Command(BaseCommand):
+    """Command to drain the outbox into a sink until interrupted."""
+
+    help = 'Deliver outbox messages (booking confirmations, audit records) to the configured sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=outbox.DEFAULT_BATCH_SIZE, help='Messages claimed at a time'
+        )
+        parser.add_argument('--workers', type=int, default=4, help='Pool workers that call the sink')
+        parser.add_argument(
+            '--pool', choices=('thread', 'process'), default='thread', help='Run the sink in threads or processes'
+        )
+        parser.add_argument(
+            '--lease', type=float, default=outbox.DEFAULT_LEASE,
+            help='Seconds a claimed batch has to be delivered before it is claimed again'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0, help='Seconds to wait when nothing is due'
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due')
+        parser.add_argument('--sink', help='Dotted path of the sink class (default: OUTBOX_SINK)')
+        parser.add_argument(
+            '--sink-option', action='append', default=[], metavar='NAME=VALUE',
+            help='Keyword argument for the sink, e.g. path=outbox.ndjson for FileSink'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be positive')
+
+        sink_options = {}
+        for option in options['sink_option']:
+            name, sep, value = option.partition('=')
+            if not sep:
+                raise CommandError(f"Invalid sink option: {option}")
+            sink_options[name] = value
+        if sink_options and not options['sink']:
+            raise CommandError('--sink-option needs --sink')
+
+        worker = outbox.OutboxWorker(
+            sink_path=options['sink'],
+            sink_options=sink_options or None,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            pool=options['pool'],
+            lease=options['lease'],
+        )
+        try:
+            delivered, failed = worker.run(options['poll_interval'], once=options['once'])
+        except KeyboardInterrupt:
+            delivered, failed = None, None
+        finally:
+            worker.close()
+
+        if delivered is not None:
+            self.stderr.write(f"Delivered {delivered} messages; {failed} delivery attempts failed")
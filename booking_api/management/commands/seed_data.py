@@ -1,147 +1,240 @@
 """
 Management command to seed the database with sample data.
 """
+import argparse
+
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 from django.utils import timezone
 import datetime
 import random
 
-from booking_api.models import FitnessClass, Booking
+from booking_api import summaries
+from booking_api.models import FitnessClass, Booking, BookingSummary, SlotShard, WaitlistEntry
+from booking_api.signals import classes_changed
+
+
+# Class names for each type
+CLASS_NAMES = {
+    'YOGA': ['Morning Yoga', 'Power Yoga', 'Relaxation Yoga', 'Yoga for Beginners'],
+    'ZUMBA': ['Zumba Dance', 'Zumba Fitness', 'High Energy Zumba'],
+    'HIIT': ['HIIT Workout', 'Intense HIIT', 'HIIT for Weight Loss'],
+    'PILATES': ['Core Pilates', 'Pilates for Flexibility', 'Power Pilates'],
+    'CYCLING': ['Cycling Class', 'Spin Session', 'Endurance Cycling']
+}
+
+# Instructors
+INSTRUCTORS = [
+    'John Smith', 'Jane Doe', 'Alice Johnson', 'Bob Williams',
+    'Eva Brown', 'Michael Davis', 'Sophia Wilson', 'Ethan Taylor'
+]
+
+# Client names
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer',
+    'Michael', 'Linda', 'William', 'Elizabeth', 'David', 'Barbara'
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Jones', 'Brown', 'Davis',
+    'Miller', 'Wilson', 'Moore', 'Taylor', 'Anderson', 'Thomas'
+]
+
+# Email domains
+EMAIL_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com']
+
+
+def positive_int(value):
+    """Parse a command line argument that must be a positive integer."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, not {value!r}")
+    return number
+
+
+def insert_rows(model, fields, rows, batch_size):
+    """
+    Insert ``rows`` of already adapted values for ``fields`` of ``model``.
+
+    One ``executemany`` per batch skips building and preparing a model
+    instance per row, which is most of ``bulk_create``'s cost at a million
+    rows. Returns the number of rows inserted.
+    """
+    qn = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {qn(model._meta.db_table)} "
+        f"({', '.join(qn(model._meta.get_field(name).column) for name in fields)}) "
+        f"VALUES ({', '.join(['%s'] * len(fields))})"
+    )
+    inserted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.executemany(sql, batch)
+            inserted += len(batch)
+    return inserted
 
 
 class Command(BaseCommand):
     """Command to seed the database with sample data."""
-    
+
     help = 'Seed the database with sample data'
-    
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--classes', type=int, default=None,
+            help='Number of classes to create (default: 3-5 per day for the next 14 days)'
+        )
+        parser.add_argument(
+            '--bookings-per-class', type=int, default=None,
+            help='Bookings per class, capped at its total slots (default: random 0-15)'
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a reproducible dataset')
+        parser.add_argument('--batch-size', type=positive_int, default=1000, help='Rows per bulk insert')
+
     def handle(self, *args, **options):
         """Handle the command."""
         self.stdout.write('Seeding database...')
-        
-        # Clear existing data
-        FitnessClass.objects.all().delete()
-        Booking.objects.all().delete()
-        
-        # Create fitness classes
-        self._create_fitness_classes()
-        
-        # Create bookings
-        self._create_bookings()
-        
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        with transaction.atomic():
+            # Clear existing data
+            self._clear()
+
+            # Create fitness classes
+            self._create_fitness_classes(options['classes'], options['bookings_per_class'])
+
+            # Create bookings
+            self._create_bookings()
+
+            # Bulk inserts don't send post_save, so announce the change ourselves
+            # and build the booking summaries in one pass
+            classes_changed.send(sender=FitnessClass)
+            summaries.rebuild()
+
         self.stdout.write(self.style.SUCCESS('Successfully seeded database!'))
-    
-    def _create_fitness_classes(self):
-        """Create sample fitness classes."""
-        # Class types
-        class_types = ['YOGA', 'ZUMBA', 'HIIT', 'PILATES', 'CYCLING']
-        
-        # Class names for each type
-        class_names = {
-            'YOGA': ['Morning Yoga', 'Power Yoga', 'Relaxation Yoga', 'Yoga for Beginners'],
-            'ZUMBA': ['Zumba Dance', 'Zumba Fitness', 'High Energy Zumba'],
-            'HIIT': ['HIIT Workout', 'Intense HIIT', 'HIIT for Weight Loss'],
-            'PILATES': ['Core Pilates', 'Pilates for Flexibility', 'Power Pilates'],
-            'CYCLING': ['Cycling Class', 'Spin Session', 'Endurance Cycling']
-        }
-        
-        # Instructors
-        instructors = [
-            'John Smith', 'Jane Doe', 'Alice Johnson', 'Bob Williams',
-            'Eva Brown', 'Michael Davis', 'Sophia Wilson', 'Ethan Taylor'
-        ]
-        
-        # Get current time
+
+    def _clear(self):
+        """
+        Empty the tables the command fills, children first.
+
+        Deleting through the ORM would load every row and send a
+        ``post_delete`` per class; the single ``classes_changed`` sent after
+        seeding covers them all.
+        """
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in (BookingSummary, WaitlistEntry, Booking, SlotShard, FitnessClass):
+                cursor.execute(f"DELETE FROM {qn(model._meta.db_table)}")
+
+    def _class_datetimes(self, count):
+        """Yield class start times, over the next 14 days."""
         now = timezone.now()
-        
-        # Create classes for the next 14 days
-        for day in range(1, 15):
-            # Create 3-5 classes per day
-            for _ in range(random.randint(3, 5)):
-                # Random class type
-                class_type = random.choice(class_types)
-                
-                # Random class name based on type
-                name = random.choice(class_names[class_type])
-                
-                # Random instructor
-                instructor = random.choice(instructors)
-                
-                # Random time between 6:00 and 20:00
-                hour = random.randint(6, 20)
-                minute = random.choice([0, 15, 30, 45])
-                
-                # Create datetime
-                class_datetime = now + datetime.timedelta(days=day)
-                class_datetime = class_datetime.replace(
-                    hour=hour, minute=minute, second=0, microsecond=0
-                )
-                
-                # Random total slots between 10 and 30
-                total_slots = random.randint(10, 30)
-                
-                # Create the class
-                FitnessClass.objects.create(
-                    name=name,
-                    class_type=class_type,
-                    datetime=class_datetime,
-                    instructor=instructor,
-                    total_slots=total_slots,
-                    available_slots=total_slots
-                )
-        
-        self.stdout.write(f'Created {FitnessClass.objects.count()} fitness classes')
-    
-    def _create_bookings(self):
-        """Create sample bookings."""
-        # Client names
-        first_names = [
-            'James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer',
-            'Michael', 'Linda', 'William', 'Elizabeth', 'David', 'Barbara'
-        ]
-        last_names = [
-            'Smith', 'Johnson', 'Williams', 'Jones', 'Brown', 'Davis',
-            'Miller', 'Wilson', 'Moore', 'Taylor', 'Anderson', 'Thomas'
+
+        if count is None:
+            # 3-5 classes per day for the next 14 days
+            days = [day for day in range(1, 15) for _ in range(self.random.randint(3, 5))]
+        else:
+            days = (self.random.randint(1, 14) for _ in range(count))
+
+        for day in days:
+            # Random time between 6:00 and 20:00
+            hour = self.random.randint(6, 20)
+            minute = self.random.choice([0, 15, 30, 45])
+
+            class_datetime = now + datetime.timedelta(days=day)
+            yield class_datetime.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    def _create_fitness_classes(self, count, bookings_per_class):
+        """
+        Create sample fitness classes.
+
+        The number of bookings for each class is decided up front, so
+        ``available_slots`` is computed once and never updated afterwards.
+        """
+        class_types = list(CLASS_NAMES)
+        adapt = connection.ops.adapt_datetimefield_value
+        now = adapt(timezone.now())
+        fields = [
+            'name', 'class_type', 'datetime', 'instructor', 'total_slots', 'available_slots',
+            'slot_shards', 'created_at', 'updated_at',
         ]
-        
-        # Email domains
-        email_domains = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com']
-        
-        # Get all classes
-        classes = FitnessClass.objects.all()
-        
-        # Create bookings
+        batch = []
+        created = 0
+
+        for class_datetime in self._class_datetimes(count):
+            class_type = self.random.choice(class_types)
+
+            # Random total slots between 10 and 30
+            total_slots = self.random.randint(10, 30)
+
+            if bookings_per_class is None:
+                booked = self.random.randint(0, min(15, total_slots))
+            else:
+                booked = min(bookings_per_class, total_slots)
+
+            batch.append((
+                self.random.choice(CLASS_NAMES[class_type]),
+                class_type,
+                adapt(class_datetime),
+                self.random.choice(INSTRUCTORS),
+                total_slots,
+                total_slots - booked,
+                0,
+                now,
+                now,
+            ))
+
+            if len(batch) >= self.batch_size:
+                created += insert_rows(FitnessClass, fields, batch, self.batch_size)
+                batch = []
+
+        if batch:
+            created += insert_rows(FitnessClass, fields, batch, self.batch_size)
+
+        self.stdout.write(f'Created {created} fitness classes')
+
+    def _client(self, taken):
+        """Return a random client name and an email not in ``taken``."""
+        first_name = self.random.choice(FIRST_NAMES)
+        last_name = self.random.choice(LAST_NAMES)
+        email_username = f"{first_name.lower()}.{last_name.lower()}"
+        email_domain = self.random.choice(EMAIL_DOMAINS)
+
+        client_email = f"{email_username}@{email_domain}"
+        while client_email in taken:
+            # Add a number to keep the email unique within the class
+            client_email = f"{email_username}{self.random.randint(1, 99999)}@{email_domain}"
+
+        taken.add(client_email)
+        return f"{first_name} {last_name}", client_email
+
+    def _create_bookings(self):
+        """Create sample bookings to fill each class's booked slots."""
+        classes = list(
+            FitnessClass.objects.order_by('pk').values_list('id', 'total_slots', 'available_slots')
+        )
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        fields = ['fitness_class', 'client_name', 'client_email', 'booking_time']
+        batch = []
         bookings_count = 0
-        
-        for fitness_class in classes:
-            # Create 0-15 bookings per class
-            for _ in range(random.randint(0, min(15, fitness_class.total_slots))):
-                # Random client name
-                first_name = random.choice(first_names)
-                last_name = random.choice(last_names)
-                client_name = f"{first_name} {last_name}"
-                
-                # Random client email
-                email_username = f"{first_name.lower()}.{last_name.lower()}"
-                email_domain = random.choice(email_domains)
-                client_email = f"{email_username}@{email_domain}"
-                
-                # Create the booking if there are available slots
-                if fitness_class.has_available_slots():
-                    # Check if this email has already booked this class
-                    if not Booking.objects.filter(
-                        fitness_class=fitness_class, 
-                        client_email=client_email
-                    ).exists():
-                        Booking.objects.create(
-                            fitness_class=fitness_class,
-                            client_name=client_name,
-                            client_email=client_email
-                        )
-                        
-                        # Update available slots
-                        fitness_class.available_slots -= 1
-                        fitness_class.save()
-                        
-                        bookings_count += 1
-        
-        self.stdout.write(f'Created {bookings_count} bookings')
\ No newline at end of file
+
+        for class_id, total_slots, available_slots in classes:
+            taken = set()
+            for _ in range(total_slots - available_slots):
+                client_name, client_email = self._client(taken)
+                batch.append((class_id, client_name, client_email, now))
+
+            if len(batch) >= self.batch_size:
+                bookings_count += insert_rows(Booking, fields, batch, self.batch_size)
+                batch = []
+
+        if batch:
+            bookings_count += insert_rows(Booking, fields, batch, self.batch_size)
+
+        self.stdout.write(f'Created {bookings_count} bookings')
@@ -0,0 +1,38 @@
+"""
+Management command to split the slots of busy classes across counter shards.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from booking_api import shards
+from booking_api.models import FitnessClass
+
+
+class Command(BaseCommand):
+    """Command to shard, reshard or unshard the slot counters of classes."""
+
+    help = 'Split the slots of the given classes across counter shards, so concurrent bookings of them update different rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_ids', nargs='+', type=int, help='Classes to shard')
+        parser.add_argument(
+            '--shards', type=int, default=4, help='Number of shards; 0 or 1 merges the shards back'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+        if options['shards'] < 0:
+            raise CommandError('--shards must not be negative')
+
+        for class_id in options['class_ids']:
+            try:
+                fitness_class = shards.shard_class(class_id, options['shards'])
+            except FitnessClass.DoesNotExist:
+                raise CommandError(f"Fitness class not found: {class_id}")
+
+            if fitness_class.slot_shards:
+                self.stdout.write(
+                    f"Split {fitness_class.available_slots} free slots of class {class_id} "
+                    f"across {fitness_class.slot_shards} shards"
+                )
+            else:
+                self.stdout.write(f"Class {class_id} now counts its {fitness_class.available_slots} free slots in one row")
@@ -0,0 +1,47 @@
+"""
+Management command to refresh SQLite read replicas from the primary.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from booking_api import routing
+
+
+class Command(BaseCommand):
+    """Command to copy the primary database onto each read replica."""
+
+    help = 'Copy the primary SQLite database onto the read replicas in DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='Copy again every this many seconds until interrupted; keep it below DATABASE_REPLICA_MAX_LAG'
+        )
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+        replicas = routing.get_replicas()
+        if not replicas:
+            raise CommandError('No read replicas configured; set SQLITE_REPLICA_PATHS')
+
+        databases = [connections[alias] for alias in [DEFAULT_DB_ALIAS, *replicas]]
+        if any(database.vendor != 'sqlite' for database in databases):
+            raise CommandError('sync_replicas only copies SQLite databases')
+
+        source = databases[0].settings_dict['NAME']
+        try:
+            while True:
+                started = time.monotonic()
+                for alias in replicas:
+                    routing.copy_database(source, connections[alias].settings_dict['NAME'])
+                self.stdout.write(
+                    f"Copied {source} to {len(replicas)} replicas in {time.monotonic() - started:.2f}s"
+                )
+
+                if options['interval'] is None:
+                    break
+                time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
+        except KeyboardInterrupt:
+            pass
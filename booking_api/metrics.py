@@ -0,0 +1,220 @@
+"""
+Per-request latency and query instrumentation for the fitness booking API.
+
+``RequestMetricsMiddleware`` starts a ``RequestMetrics`` for every request
+and stores it in a context variable. A database execute wrapper, installed
+on every connection, adds each query's count and time to it, and views
+mark their stages with ``stage()``. When the response is ready the numbers
+are written to a ``Server-Timing`` header and folded into in-process
+histograms, which ``/api/metrics/`` exposes in Prometheus text format.
+"""
+import bisect
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+
+
+# Histogram buckets, in seconds and in queries
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('booking_request_metrics', default=None)
+
+
+class Histogram:
+    """A Prometheus-style histogram with fixed buckets."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Thread-safe collection of labelled histograms, counters and gauges."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def define(self, name, help_text, buckets, kind='histogram'):
+        """Register a metric family, by default a histogram with ``buckets``."""
+        with self._lock:
+            self._metrics.setdefault(name, (kind, help_text, buckets, {}))
+
+    def define_counter(self, name, help_text):
+        """Register a counter family."""
+        self.define(name, help_text, None, kind='counter')
+
+    def define_gauge(self, name, help_text):
+        """Register a gauge family."""
+        self.define(name, help_text, None, kind='gauge')
+
+    def observe(self, name, labels, value):
+        """Add an observation to the histogram ``name`` with ``labels``."""
+        kind, help_text, buckets, series = self._metrics[name]
+        with self._lock:
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels=(), amount=1):
+        """Add ``amount`` to the counter or gauge ``name`` with ``labels``."""
+        kind, help_text, buckets, series = self._metrics[name]
+        with self._lock:
+            series[labels] = series.get(labels, 0) + amount
+
+    def clear(self):
+        """Drop every observation."""
+        with self._lock:
+            for _, _, _, series in self._metrics.values():
+                series.clear()
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, buckets, series) in sorted(self._metrics.items()):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, histogram in sorted(series.items()):
+                    label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                    prefix = f'{label_text},' if label_text else ''
+                    if kind != 'histogram':
+                        # Counters and gauges are stored as plain numbers
+                        lines.append(f'{name}{{{label_text}}} {histogram}')
+                        continue
+
+                    cumulative = 0
+                    for bound, count in zip(buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label_text}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+registry.define(
+    'booking_http_request_duration_seconds', 'Wall time of API requests.', DURATION_BUCKETS
+)
+registry.define(
+    'booking_http_request_db_queries', 'Database queries per API request.', QUERY_BUCKETS
+)
+registry.define(
+    'booking_http_request_db_duration_seconds', 'Database time per API request.', DURATION_BUCKETS
+)
+registry.define(
+    'booking_stage_duration_seconds', 'Wall time of each stage of a view.', DURATION_BUCKETS
+)
+registry.define(
+    'booking_stage_db_queries', 'Database queries in each stage of a view.', QUERY_BUCKETS
+)
+
+
+class RequestMetrics:
+    """Timings collected for one request."""
+
+    __slots__ = ('start', 'queries', 'db_time', 'stages')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.stages = []
+
+
+def begin():
+    """Start collecting metrics for the current request."""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end(token):
+    """Stop collecting metrics for the current request."""
+    _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper that adds each query to the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install(connection):
+    """Install the query recorder on a database connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a stage of the current request, e.g. ``with stage('validate'):``."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+
+    queries, db_time, start = metrics.queries, metrics.db_time, time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.stages.append((
+            name,
+            time.perf_counter() - start,
+            metrics.queries - queries,
+            metrics.db_time - db_time,
+        ))
+
+
+def finish(metrics, request, response):
+    """Add the Server-Timing header to ``response`` and record the request."""
+    total = time.perf_counter() - metrics.start
+
+    timings = [
+        f'total;dur={total * 1000:.2f}',
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+    ]
+    timings.extend(
+        f'{name};dur={duration * 1000:.2f};desc="{queries} queries"'
+        for name, duration, queries, _ in metrics.stages
+    )
+    response['Server-Timing'] = ', '.join(timings)
+
+    # Label by route name rather than path to keep the number of series bounded
+    match = getattr(request, 'resolver_match', None)
+    view = match.url_name if match and match.url_name else 'unmatched'
+    labels = (('method', request.method), ('status', str(response.status_code)), ('view', view))
+
+    registry.observe('booking_http_request_duration_seconds', labels, total)
+    registry.observe('booking_http_request_db_queries', labels, metrics.queries)
+    registry.observe('booking_http_request_db_duration_seconds', labels, metrics.db_time)
+    for name, duration, queries, _ in metrics.stages:
+        stage_labels = (('stage', name), ('view', view))
+        registry.observe('booking_stage_duration_seconds', stage_labels, duration)
+        registry.observe('booking_stage_db_queries', stage_labels, queries)
+
+    return response
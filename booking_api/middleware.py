@@ -0,0 +1,43 @@
+"""
+Middleware for the fitness booking API.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, query count and database time for every request.
+    
+    Adds a ``Server-Timing`` header to each response and feeds the
+    histograms served at ``/api/metrics/``. Works under WSGI and ASGI.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        
+        request_metrics, token = metrics.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end(token)
+        return metrics.finish(request_metrics, request, response)
+    
+    async def __acall__(self, request):
+        request_metrics, token = metrics.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end(token)
+        return metrics.finish(request_metrics, request, response)
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['client_email', 'booking_time'], name='booking_email_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['datetime'], name='fitnessclass_datetime_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(condition=models.Q(('available_slots__gt', 0)), fields=['datetime'], name='fitnessclass_open_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_summaries(apps, schema_editor):
+    """Copy the existing bookings into the new summary table."""
+    Booking = apps.get_model('booking_api', 'Booking')
+    BookingSummary = apps.get_model('booking_api', 'BookingSummary')
+    db_alias = schema_editor.connection.alias
+
+    rows = Booking.objects.using(db_alias).values(
+        'id', 'fitness_class_id', 'client_name', 'client_email', 'booking_time',
+        'fitness_class__name', 'fitness_class__class_type', 'fitness_class__datetime',
+        'fitness_class__instructor', 'fitness_class__total_slots', 'fitness_class__available_slots',
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(BookingSummary(
+            booking_id=row['id'],
+            fitness_class_id=row['fitness_class_id'],
+            client_name=row['client_name'],
+            client_email=row['client_email'],
+            booking_time=row['booking_time'],
+            class_name=row['fitness_class__name'],
+            class_type=row['fitness_class__class_type'],
+            class_datetime=row['fitness_class__datetime'],
+            instructor=row['fitness_class__instructor'],
+            total_slots=row['fitness_class__total_slots'],
+            available_slots=row['fitness_class__available_slots'],
+        ))
+        if len(batch) >= 2000:
+            BookingSummary.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    BookingSummary.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0002_add_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSummary',
+            fields=[
+                ('booking', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='booking_api.booking')),
+                ('client_name', models.CharField(max_length=100)),
+                ('client_email', models.EmailField(max_length=254)),
+                ('booking_time', models.DateTimeField()),
+                ('class_name', models.CharField(max_length=100)),
+                ('class_type', models.CharField(choices=[('YOGA', 'Yoga'), ('ZUMBA', 'Zumba'), ('HIIT', 'HIIT'), ('PILATES', 'Pilates'), ('CYCLING', 'Cycling')], max_length=20)),
+                ('class_datetime', models.DateTimeField()),
+                ('instructor', models.CharField(max_length=100)),
+                ('total_slots', models.PositiveIntegerField()),
+                ('available_slots', models.PositiveIntegerField()),
+                ('fitness_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_summaries', to='booking_api.fitnessclass')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['client_email', 'booking_time'], name='summary_email_time_idx')],
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0003_booking_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booking_time'], name='booking_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['updated_at'], name='fitnessclass_updated_idx'),
+        ),
+    ]
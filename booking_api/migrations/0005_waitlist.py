@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0004_add_export_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_name', models.CharField(max_length=100)),
+                ('client_email', models.EmailField(max_length=254)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fitness_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='booking_api.fitnessclass')),
+            ],
+            options={
+                'ordering': ['id'],
+                'unique_together': {('fitness_class', 'client_email')},
+            },
+        ),
+    ]
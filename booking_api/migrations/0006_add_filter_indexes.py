@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0005_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['class_type', 'datetime'], name='fitnessclass_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['instructor', 'datetime'], name='fitnessclass_instructor_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0007_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='slot_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SlotShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('available', models.PositiveIntegerField()),
+                ('fitness_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='booking_api.fitnessclass')),
+            ],
+            options={
+                'unique_together': {('fitness_class', 'number')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_api', '0009_idempotency'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bookingsummary',
+            name='available_slots',
+        ),
+    ]
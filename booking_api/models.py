@@ -2,8 +2,10 @@
 Models for the fitness booking API.
 """
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
-import pytz
+
+from .signals import classes_changed
 
 
 class FitnessClass(models.Model):
@@ -23,30 +25,32 @@ class FitnessClass(models.Model):
     instructor = models.CharField(max_length=100)
     total_slots = models.PositiveIntegerField(default=20)
     available_slots = models.PositiveIntegerField(default=20)
+    # Number of SlotShard counters the slots are split across; 0 means
+    # available_slots is the counter itself
+    slot_shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Upcoming classes are filtered and ordered on datetime
+            models.Index(fields=['datetime'], name='fitnessclass_datetime_idx'),
+            # Upcoming classes that can still be booked
+            models.Index(
+                fields=['datetime'],
+                name='fitnessclass_open_idx',
+                condition=models.Q(available_slots__gt=0),
+            ),
+            # Upcoming classes filtered by type or instructor
+            models.Index(fields=['class_type', 'datetime'], name='fitnessclass_type_idx'),
+            models.Index(fields=['instructor', 'datetime'], name='fitnessclass_instructor_idx'),
+            # Incremental exports of changed classes
+            models.Index(fields=['updated_at'], name='fitnessclass_updated_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.class_type} class by {self.instructor} on {self.datetime}"
     
-    def update_timezone(self, timezone_str):
-        """Update the class datetime to a different timezone."""
-        if not timezone_str in pytz.all_timezones:
-            raise ValueError(f"Invalid timezone: {timezone_str}")
-        
-        # Get the current timezone from settings
-        current_tz = pytz.timezone(timezone.get_current_timezone_name())
-        
-        # Convert to the new timezone
-        new_tz = pytz.timezone(timezone_str)
-        
-        # Localize the datetime to the current timezone first, then convert
-        current_datetime = current_tz.localize(self.datetime.replace(tzinfo=None))
-        new_datetime = current_datetime.astimezone(new_tz)
-        
-        self.datetime = new_datetime
-        self.save()
-    
     def is_upcoming(self):
         """Check if the class is in the future."""
         return self.datetime > timezone.now()
@@ -60,11 +64,49 @@ class FitnessClass(models.Model):
         if not self.has_available_slots():
             return False
         
+        if self.slot_shards:
+            from .shards import take
+            
+            # available_slots is folded back from the shards shortly after the commit
+            return take(self.pk, shard_count=self.slot_shards)
+        
+        # Decrement in the database so concurrent bookings can't overbook
+        now = timezone.now()
+        updated = FitnessClass.objects.filter(
+            pk=self.pk, available_slots__gt=0, slot_shards=0
+        ).update(available_slots=F('available_slots') - 1, updated_at=now)
+        
+        if not updated:
+            self.available_slots = 0
+            return False
+        
         self.available_slots -= 1
-        self.save()
+        self.updated_at = now
+        classes_changed.send(sender=FitnessClass, class_ids=[self.pk], fields=['available_slots'])
         return True
 
 
+class SlotShard(models.Model):
+    """
+    One of the counters the slots of a busy class are split across.
+    
+    Bookings take slots from a random shard, so concurrent bookings of the
+    class update different rows. See ``booking_api.shards``.
+    """
+    
+    fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE, related_name='shards')
+    number = models.PositiveSmallIntegerField()
+    # This shard's share of total_slots; available never exceeds it
+    capacity = models.PositiveIntegerField()
+    available = models.PositiveIntegerField()
+    
+    class Meta:
+        unique_together = ('fitness_class', 'number')
+    
+    def __str__(self):
+        return f"Shard {self.number} of class {self.fitness_class_id}"
+
+
 class Booking(models.Model):
     """Model representing a booking for a fitness class."""
     
@@ -76,6 +118,131 @@ class Booking(models.Model):
     class Meta:
         # One client can't book the same class twice
         unique_together = ('fitness_class', 'client_email')
+        indexes = [
+            # Bookings are looked up by email, newest first
+            models.Index(fields=['client_email', 'booking_time'], name='booking_email_time_idx'),
+            # Incremental exports of new bookings
+            models.Index(fields=['booking_time'], name='booking_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.client_name} booked {self.fitness_class.name}"
+
+
+class WaitlistEntry(models.Model):
+    """Model representing a client waiting for a slot in a full fitness class."""
+    
+    fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE, related_name='waitlist')
+    client_name = models.CharField(max_length=100)
+    client_email = models.EmailField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        # One client can only wait once for the same class
+        unique_together = ('fitness_class', 'client_email')
+        # Clients are promoted first come, first served. SQLite indexes carry
+        # the rowid, so the fitness_class index already serves this order.
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.client_name} waiting for {self.fitness_class_id}"
+
+
+class BookingSummary(models.Model):
+    """
+    Read model of a booking with the fields of its class copied in.
+    
+    Lets a client's bookings be listed with one indexed lookup and no join.
+    Slot counts change with every booking, so they are not copied: they are
+    read from the classes when the bookings are listed. Rows are maintained
+    by ``booking_api.summaries`` and should not be written directly.
+    """
+    
+    booking = models.OneToOneField(
+        Booking, on_delete=models.CASCADE, primary_key=True, related_name='summary'
+    )
+    fitness_class = models.ForeignKey(
+        FitnessClass, on_delete=models.CASCADE, related_name='booking_summaries'
+    )
+    client_name = models.CharField(max_length=100)
+    client_email = models.EmailField()
+    booking_time = models.DateTimeField()
+    class_name = models.CharField(max_length=100)
+    class_type = models.CharField(max_length=20, choices=FitnessClass.CLASS_TYPES)
+    class_datetime = models.DateTimeField()
+    instructor = models.CharField(max_length=100)
+    total_slots = models.PositiveIntegerField()
+    
+    class Meta:
+        indexes = [
+            # A client's bookings, newest first
+            models.Index(fields=['client_email', 'booking_time'], name='summary_email_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.client_name} booked {self.class_name}"
+
+
+class OutboxMessage(models.Model):
+    """
+    A side effect of a write, such as a booking confirmation, waiting to be sent.
+    
+    Messages are written in the same transaction as the change they describe
+    and delivered by the outbox worker after the commit. See
+    ``booking_api.outbox``.
+    """
+    
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # When the message can next be claimed; claims and retries push it back
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    # Token of the claim currently delivering the message
+    claimed_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    # Set when the message ran out of attempts and won't be retried
+    failed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Messages due for delivery, oldest first
+            models.Index(
+                fields=['available_at', 'id'],
+                name='outbox_due_idx',
+                condition=models.Q(failed_at__isnull=True),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic} message {self.pk}"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    The stored outcome of a request made with an ``Idempotency-Key`` header.
+    
+    The row is created when the first request with the key starts, which
+    claims the key, and completed with its response. See
+    ``booking_api.idempotency``.
+    """
+    
+    key = models.CharField(max_length=255, unique=True)
+    # Hash of the method, path and body the key was first used with
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is still running
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # A running request that hasn't finished by then is taken to have died
+    locked_until = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            # Purging expired keys
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.client_name} booked {self.fitness_class.name}"
\ No newline at end of file
+        return f"Idempotency key {self.key}"
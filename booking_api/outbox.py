@@ -0,0 +1,332 @@
+"""
+Transactional outbox for side effects of bookings.
+
+Writes that need something to happen elsewhere, like sending a booking
+confirmation or recording an audit entry, add an ``OutboxMessage`` in the
+same transaction as the change itself. The message exists exactly when the
+change was committed, and the request never waits for the downstream work.
+
+``OutboxWorker``, run by ``manage.py run_outbox_worker``, drains the table:
+
+* It claims a batch of due messages with a conditional UPDATE that stamps
+  them with a claim token and pushes ``available_at`` out by a lease, so
+  concurrent workers never claim the same message and a crashed worker's
+  messages become due again when the lease runs out.
+* The batch is split across a thread or process pool and handed to a
+  ``Sink``. If a sink call fails, its messages are retried one by one so a
+  single bad message can't hold back the rest.
+* Delivered messages are deleted. Failed ones are retried with exponential
+  backoff and jitter, up to ``OUTBOX_MAX_ATTEMPTS`` attempts, then kept with
+  ``failed_at`` set for inspection.
+
+Delivery is at least once: a message is only deleted after its sink call
+returned, so a crash in between sends it again. Sinks should be idempotent,
+e.g. by keying on the message ``id``.
+"""
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboxMessage
+
+
+BOOKING_CREATED = 'booking.created'
+BOOKING_CANCELLED = 'booking.cancelled'
+
+DEFAULT_SINK = 'booking_api.outbox.ConsoleSink'
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_LEASE = 30.0
+
+# Retry delays, in seconds: BACKOFF_BASE * 2 ** (attempts - 1), capped
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+
+# Fields of a message handed to sinks
+MESSAGE_FIELDS = ('id', 'topic', 'payload', 'attempts', 'created_at')
+
+
+def enqueue(topic, payloads):
+    """
+    Add one message per payload to the outbox.
+
+    Call this inside the transaction that makes the change, so the messages
+    are committed or rolled back with it.
+    """
+    OutboxMessage.objects.bulk_create([
+        OutboxMessage(topic=topic, payload=payload) for payload in payloads
+    ])
+
+
+def booking_payload(booking, **extra):
+    """Build the payload that describes a booking."""
+    return {
+        'booking_id': booking.pk,
+        'class_id': booking.fitness_class_id,
+        'client_name': booking.client_name,
+        'client_email': booking.client_email,
+        'booking_time': booking.booking_time.isoformat() if booking.booking_time else None,
+        **extra,
+    }
+
+
+def bookings_created(bookings, source='api'):
+    """Add a ``booking.created`` message for each of ``bookings``."""
+    enqueue(BOOKING_CREATED, [booking_payload(booking, source=source) for booking in bookings])
+
+
+def booking_cancelled(booking, promoted=None):
+    """Add a ``booking.cancelled`` message, noting the booking the slot went to."""
+    enqueue(BOOKING_CANCELLED, [
+        booking_payload(booking, promoted_booking_id=promoted.pk if promoted else None)
+    ])
+
+
+class Sink:
+    """
+    Destination of outbox messages.
+
+    ``send()`` gets a list of message dicts with the keys in
+    ``MESSAGE_FIELDS`` and must raise if any of them was not delivered.
+    Sinks are called from several threads at once and, with a process pool,
+    are built in each worker process, so they should be cheap to create.
+    """
+
+    def send(self, messages):
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the sink."""
+
+
+class _JSONLinesSink(Sink):
+    """Base class for sinks that write each message as a line of JSON."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def encode(self, messages):
+        return ''.join(json.dumps(message, default=str, separators=(',', ':')) + '\n' for message in messages)
+
+
+class ConsoleSink(_JSONLinesSink):
+    """Write messages to stdout as JSON lines, for local development."""
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream
+
+    def send(self, messages):
+        stream = self.stream or sys.stdout
+        with self.lock:
+            stream.write(self.encode(messages))
+            stream.flush()
+
+
+class FileSink(_JSONLinesSink):
+    """Append messages to a file as JSON lines, for testing and audit trails."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def send(self, messages):
+        text = self.encode(messages)
+        with self.lock, open(self.path, 'a') as f:
+            f.write(text)
+
+
+def get_sink(path=None, options=None):
+    """Build a sink from a dotted path, defaulting to ``OUTBOX_SINK`` in settings."""
+    if path is None:
+        path = getattr(settings, 'OUTBOX_SINK', DEFAULT_SINK)
+        options = getattr(settings, 'OUTBOX_SINK_OPTIONS', {}) if options is None else options
+    return import_string(path)(**(options or {}))
+
+
+def backoff(attempts):
+    """Return the delay before retrying a message that failed ``attempts`` times."""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    # Jitter so messages that failed together don't retry together
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(batch_size, lease=DEFAULT_LEASE, now=None):
+    """
+    Claim up to ``batch_size`` due messages, oldest first.
+
+    Returns ``(token, messages)``. The messages stay claimed for ``lease``
+    seconds; after that they are due again and may be delivered twice.
+    """
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    due = OutboxMessage.objects.filter(failed_at__isnull=True, available_at__lte=now)
+
+    ids = list(due.order_by('available_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return token, []
+
+    # Only rows that are still due are claimed, so concurrent workers split them
+    due.filter(pk__in=ids).update(
+        claimed_by=token,
+        available_at=now + datetime.timedelta(seconds=lease),
+        attempts=F('attempts') + 1,
+    )
+    messages = list(
+        OutboxMessage.objects.filter(pk__in=ids, claimed_by=token)
+        .order_by('available_at', 'id')
+        .values(*MESSAGE_FIELDS)
+    )
+    return token, messages
+
+
+def complete(token, ids):
+    """Delete delivered messages that are still held by the claim ``token``."""
+    return OutboxMessage.objects.filter(pk__in=ids, claimed_by=token).delete()[0]
+
+
+def fail(token, message, error, max_attempts=None, now=None):
+    """Schedule a retry of a message, or give up on it after ``max_attempts``."""
+    now = now or timezone.now()
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+    messages = OutboxMessage.objects.filter(pk=message['id'], claimed_by=token)
+    if message['attempts'] >= max_attempts:
+        messages.update(failed_at=now, last_error=error)
+    else:
+        retry_at = now + datetime.timedelta(seconds=backoff(message['attempts']))
+        messages.update(available_at=retry_at, last_error=error)
+
+
+def deliver(messages, sink=None):
+    """
+    Send ``messages`` to ``sink``; return ``(delivered_ids, {id: error})``.
+
+    Runs in pool workers. Without a ``sink``, the one built for this worker
+    process by ``_init_process`` is used.
+    """
+    sink = sink or _process_sink
+    try:
+        sink.send(messages)
+        return [message['id'] for message in messages], {}
+    except Exception:
+        if len(messages) == 1:
+            raise
+
+    # Retry one by one so only the failing messages are held back
+    delivered, errors = [], {}
+    for message in messages:
+        try:
+            sink.send([message])
+            delivered.append(message['id'])
+        except Exception as e:
+            errors[message['id']] = f"{type(e).__name__}: {e}"
+    return delivered, errors
+
+
+_process_sink = None
+
+
+def _init_process(sink_path, sink_options):
+    """Build the sink of a pool worker process."""
+    global _process_sink
+    _process_sink = get_sink(sink_path, sink_options)
+
+
+class OutboxWorker:
+    """
+    Drains the outbox into a sink through a thread or process pool.
+
+    The sink is built from ``sink_path`` and ``sink_options``; a thread pool
+    can also be given a ready-made ``sink``.
+    """
+
+    def __init__(self, sink_path=None, sink_options=None, batch_size=DEFAULT_BATCH_SIZE, workers=4,
+                 pool='thread', lease=DEFAULT_LEASE, max_attempts=None, sink=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+        if pool == 'process':
+            # Sinks are built in each process rather than pickled
+            self.sink = None
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_process, initargs=(sink_path, sink_options)
+            )
+        else:
+            self.sink = sink or get_sink(sink_path, sink_options)
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def run_once(self):
+        """
+        Claim and deliver one batch; return ``(delivered, failed)`` counts.
+
+        Results are recorded from this thread, so the pool never touches the
+        database.
+        """
+        token, messages = claim(self.batch_size, self.lease)
+        if not messages:
+            return 0, 0
+
+        # One slice per pool worker, keeping each slice in outbox order
+        size = -(-len(messages) // self.workers)
+        slices = [messages[i:i + size] for i in range(0, len(messages), size)]
+        futures = [(part, self.executor.submit(deliver, part, self.sink)) for part in slices]
+
+        delivered, errors = [], {}
+        for part, future in futures:
+            try:
+                part_delivered, part_errors = future.result()
+            except Exception as e:
+                # The whole slice is lost, so every message in it is retried
+                error = f"{type(e).__name__}: {e}"
+                part_delivered, part_errors = [], {message['id']: error for message in part}
+            delivered.extend(part_delivered)
+            errors.update(part_errors)
+
+        complete(token, delivered)
+        by_id = {message['id']: message for message in messages}
+        for message_id, error in errors.items():
+            fail(token, by_id[message_id], error, self.max_attempts)
+
+        return len(delivered), len(errors)
+
+    def run(self, poll_interval=1.0, once=False, stop=None):
+        """
+        Deliver batches until stopped; return the total ``(delivered, failed)``.
+
+        Sleeps ``poll_interval`` seconds whenever a batch comes back short.
+        With ``once``, returns as soon as nothing is due instead.
+        """
+        totals = [0, 0]
+        while stop is None or not stop.is_set():
+            delivered, failed = self.run_once()
+            totals[0] += delivered
+            totals[1] += failed
+
+            if delivered + failed < self.batch_size:
+                if once:
+                    break
+                if stop is not None:
+                    stop.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+        return tuple(totals)
+
+    def close(self):
+        """Shut the pool down and close the sink."""
+        self.executor.shutdown()
+        if self.sink is not None:
+            self.sink.close()
@@ -0,0 +1,107 @@
+"""
+Keyset (cursor) pagination helpers for the fitness booking API.
+
+Pages are ordered on ``(datetime, id)`` and the cursor is an opaque token
+that encodes the last row of the previous page, so fetching page N costs
+the same as fetching page 1 and no COUNT query is needed.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token cannot be decoded."""
+
+
+def encode_cursor(datetime_value, pk):
+    """Encode the position of a row into an opaque cursor token."""
+    payload = json.dumps([datetime_value.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token into a ``(datetime, id)`` tuple."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        datetime_str, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        datetime_value = parse_datetime(datetime_str)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise InvalidCursor("Invalid cursor")
+
+    # Cursors are always encoded with an offset, and a naive datetime can't
+    # be compared with the aware ones rows are ordered on
+    if datetime_value is None or timezone.is_naive(datetime_value) or not isinstance(pk, int):
+        raise InvalidCursor("Invalid cursor")
+    return datetime_value, pk
+
+
+def get_page_size(value):
+    """
+    Resolve the requested page size.
+
+    Falls back to ``CLASSES_PAGE_SIZE`` and is capped at
+    ``CLASSES_MAX_PAGE_SIZE``. Raises ``ValueError`` for non-positive values.
+    """
+    default = getattr(settings, 'CLASSES_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    maximum = getattr(settings, 'CLASSES_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    if value in (None, ''):
+        return default
+
+    try:
+        page_size = int(value)
+    except (TypeError, ValueError):
+        page_size = 0
+    if page_size < 1:
+        raise ValueError("page_size must be a positive integer")
+    return min(page_size, maximum)
+
+
+def keyset_queryset(queryset, cursor):
+    """
+    Order ``queryset`` on ``(datetime, id)`` and skip past ``cursor``.
+    """
+    queryset = queryset.order_by('datetime', 'id')
+    if cursor:
+        last_datetime, last_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(datetime__gt=last_datetime) | Q(datetime=last_datetime, id__gt=last_id)
+        )
+    return queryset
+
+
+def split_page(rows, page_size):
+    """Trim the extra look-ahead row and build the next cursor, if any."""
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.datetime, last.id)
+    return rows, next_cursor
+
+
+def paginate_by_datetime(queryset, cursor, page_size):
+    """
+    Return one page of ``queryset`` and the cursor for the next page.
+
+    The queryset is ordered on ``(datetime, id)`` and one extra row is
+    fetched to find out whether another page exists.
+    """
+    queryset = keyset_queryset(queryset, cursor)
+    return split_page(list(queryset[:page_size + 1]), page_size)
+
+
+async def apaginate_by_datetime(queryset, cursor, page_size):
+    """Async version of ``paginate_by_datetime``."""
+    queryset = keyset_queryset(queryset, cursor)
+    rows = [row async for row in queryset[:page_size + 1]]
+    return split_page(rows, page_size)
@@ -0,0 +1,478 @@
+"""
+Slot reservation engine for the fitness booking API.
+
+A reservation is a conditional decrement of ``available_slots`` followed by
+the booking insert, both inside one short transaction. The decrement only
+matches rows that still have free slots, so concurrent requests can never
+overbook a class, and duplicate bookings are rejected by the
+``unique_together`` constraint on ``Booking`` rather than a pre-check query.
+
+Every created or cancelled booking also adds an outbox message in the same
+transaction, for the confirmations and audit records sent by the outbox
+worker.
+
+Busy classes can split their slots across several counter rows instead of
+``available_slots``; see ``booking_api.shards``. The functions here pick
+the right counter for each class.
+
+Clients can wait for a slot in a full class. Cancelling a booking hands its
+slot straight to the first client on the waitlist in the same transaction,
+and only returns it to ``available_slots`` when nobody is waiting.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from . import outbox, shards, summaries
+from .models import FitnessClass, Booking, WaitlistEntry
+from .signals import classes_changed
+
+
+class ReservationError(Exception):
+    """Base class for reservation failures."""
+
+    message = "Unable to book this class"
+
+    def __init__(self, class_id, message=None):
+        self.class_id = class_id
+        super().__init__(message or self.message)
+
+
+class ClassNotFound(ReservationError):
+    """The requested fitness class does not exist."""
+
+    message = "Fitness class not found"
+
+
+class ClassNotUpcoming(ReservationError):
+    """The requested fitness class has already started or ended."""
+
+    message = "Cannot book a class that has already started or ended"
+
+
+class ClassFull(ReservationError):
+    """The requested fitness class has no available slots."""
+
+    message = "No available slots for this class"
+
+
+class AlreadyBooked(ReservationError):
+    """The client has already booked the requested fitness class."""
+
+    message = "You have already booked this class"
+
+
+class BatchAborted(ReservationError):
+    """The booking was valid but another booking in its batch failed."""
+
+    message = "Not booked because another booking in the batch failed"
+
+
+class AlreadyWaitlisted(ReservationError):
+    """The client is already on the waitlist of the requested fitness class."""
+
+    message = "You are already on the waitlist for this class"
+
+
+class SlotsAvailable(ReservationError):
+    """The requested fitness class still has free slots, so it can't be waited for."""
+
+    message = "This class has available slots; book it instead"
+
+
+class BookingNotFound(ReservationError):
+    """The booking to cancel does not exist or belongs to another client."""
+
+    message = "Booking not found"
+
+
+def decrement_slots(class_id, count=1, now=None, fitness_class=None):
+    """
+    Atomically take ``count`` slots from a class.
+
+    Returns True if the slots were taken. The UPDATE only matches upcoming
+    classes with enough free slots, so it is safe under concurrent writers.
+
+    Sharded classes take the slots from their shards instead. Passing the
+    loaded ``fitness_class`` tells which kind of class it is; otherwise a
+    sharded class costs one more query to find out.
+    """
+    now = now or timezone.now()
+    if fitness_class is not None and fitness_class.slot_shards:
+        return fitness_class.datetime > now and shards.take(class_id, count, fitness_class.slot_shards)
+
+    updated = FitnessClass.objects.filter(
+        pk=class_id,
+        datetime__gt=now,
+        available_slots__gte=count,
+        slot_shards=0,
+    ).update(
+        available_slots=F('available_slots') - count,
+        updated_at=now,
+    )
+    if updated:
+        classes_changed.send(sender=FitnessClass, class_ids=[class_id], fields=['available_slots'])
+        return True
+
+    if fitness_class is None:
+        shard_count = FitnessClass.objects.filter(
+            pk=class_id, datetime__gt=now, slot_shards__gt=0
+        ).values_list('slot_shards', flat=True).first()
+        if shard_count:
+            return shards.take(class_id, count, shard_count)
+    return False
+
+
+def decrement_slot(class_id, now=None, fitness_class=None):
+    """Atomically take one slot from a class."""
+    return decrement_slots(class_id, 1, now, fitness_class)
+
+
+def _failure_for(class_id, now):
+    """Work out why a conditional decrement matched no rows."""
+    fitness_class = (
+        FitnessClass.objects.filter(pk=class_id)
+        .only('datetime', 'available_slots')
+        .first()
+    )
+    if fitness_class is None:
+        return ClassNotFound(class_id)
+    if fitness_class.datetime <= now:
+        return ClassNotUpcoming(class_id)
+    return ClassFull(class_id)
+
+
+def reserve_slot(class_id, client_name, client_email, fitness_class=None):
+    """
+    Reserve a slot in a class and create the booking.
+
+    The happy path costs one UPDATE and three INSERTs in a single
+    transaction: the slot decrement, the booking, its summary and its outbox
+    message. The summary and the message are written in the same
+    transaction so they can never disagree with the booking.
+    Raises a ``ReservationError`` subclass if the booking cannot be made; in
+    that case no slot is consumed.
+
+    If the caller has already loaded the class, passing it as
+    ``fitness_class`` attaches it to the booking and updates its slot count
+    in memory, so serializing the booking needs no further queries.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            if not decrement_slot(class_id, now, fitness_class):
+                raise _failure_for(class_id, now)
+
+            booking = Booking.objects.create(
+                fitness_class_id=class_id,
+                client_name=client_name,
+                client_email=client_email,
+            )
+            outbox.bookings_created([booking])
+    except IntegrityError:
+        # The unique constraint fired; the decrement was rolled back with it
+        raise AlreadyBooked(class_id)
+
+    if fitness_class is not None:
+        fitness_class.available_slots -= 1
+        fitness_class.updated_at = now
+        booking.fitness_class = fitness_class
+
+    return booking
+
+
+def _take_up_to(fitness_class, wanted, now):
+    """
+    Take as many of ``wanted`` slots as are free, returning the number taken.
+
+    Retries with a fresh slot count if a concurrent booking got there first.
+    """
+    start = fitness_class.datetime
+    if fitness_class.slot_shards:
+        # Try the whole batch first, so the first statement is the shard
+        # UPDATE rather than a read SQLite would have to upgrade to a write
+        available = wanted
+    else:
+        available = fitness_class.available_slots
+
+    while available > 0 and start > now:
+        count = min(wanted, available)
+        if decrement_slots(fitness_class.pk, count, now, fitness_class):
+            return count
+        if fitness_class.slot_shards:
+            available = shards.available(fitness_class.pk)
+            continue
+        available, start = (
+            FitnessClass.objects.filter(pk=fitness_class.pk)
+            .values_list('available_slots', 'datetime')
+            .first()
+        ) or (0, now)
+    return 0
+
+
+def _drop_booked(class_id, indexes, items, results):
+    """
+    Mark the items of a class whose clients have since booked it as
+    ``AlreadyBooked``; return the indexes of the others.
+    """
+    emails = {items[index]['client_email'] for index in indexes}
+    booked = set(
+        Booking.objects.filter(fitness_class_id=class_id, client_email__in=emails)
+        .values_list('client_email', flat=True)
+    )
+    if not booked:
+        # The conflict wasn't a duplicate booking, so retrying won't help
+        for index in indexes:
+            results[index] = ReservationError(
+                class_id, "Booking conflicted with a concurrent booking; please retry"
+            )
+        return []
+
+    remaining = []
+    for index in indexes:
+        if items[index]['client_email'] in booked:
+            results[index] = AlreadyBooked(class_id)
+        else:
+            remaining.append(index)
+    return remaining
+
+
+def reserve_batch(items, all_or_nothing=True):
+    """
+    Reserve slots and create bookings for many requests at once.
+
+    ``items`` is a list of dicts with ``class_id``, ``client_name`` and
+    ``client_email``. All classes are loaded with one query and existing
+    bookings are checked with another; then each class gets a single
+    conditional decrement and all bookings are written with ``bulk_create``.
+
+    Returns a list aligned with ``items`` holding either the created
+    ``Booking`` or the ``ReservationError`` explaining why it was not made.
+    In all-or-nothing mode nothing is written unless every item succeeds;
+    in best-effort mode each class is reserved in its own savepoint and
+    gets as many bookings as it has free slots, and clients booked by a
+    concurrent request in the meantime fail on their own.
+    """
+    now = timezone.now()
+    results = [None] * len(items)
+
+    class_ids = {item['class_id'] for item in items}
+    classes = FitnessClass.objects.in_bulk(class_ids)
+    existing = set(
+        Booking.objects.filter(
+            fitness_class_id__in=class_ids,
+            client_email__in={item['client_email'] for item in items},
+        ).values_list('fitness_class_id', 'client_email')
+    )
+
+    # Validate every item and group the valid ones by class
+    pending = {}
+    for index, item in enumerate(items):
+        class_id = item['class_id']
+        key = (class_id, item['client_email'])
+        fitness_class = classes.get(class_id)
+
+        if fitness_class is None:
+            results[index] = ClassNotFound(class_id)
+        elif fitness_class.datetime <= now:
+            results[index] = ClassNotUpcoming(class_id)
+        elif key in existing:
+            results[index] = AlreadyBooked(class_id)
+        else:
+            existing.add(key)
+            pending.setdefault(class_id, []).append(index)
+
+    def abort(error_for):
+        # Nothing was written: give every pending item an error
+        for class_id, indexes in pending.items():
+            for index in indexes:
+                results[index] = error_for(class_id)
+        return results
+
+    if all_or_nothing and any(results):
+        return abort(BatchAborted)
+
+    def build(class_id, indexes):
+        return [
+            Booking(
+                fitness_class=classes[class_id],
+                client_name=items[index]['client_name'],
+                client_email=items[index]['client_email'],
+            )
+            for index in indexes
+        ]
+
+    if all_or_nothing:
+        try:
+            with transaction.atomic():
+                bookings = []
+                for class_id, indexes in pending.items():
+                    if not decrement_slots(class_id, len(indexes), now, classes[class_id]):
+                        raise ClassFull(class_id)
+                    bookings.extend(zip(indexes, build(class_id, indexes)))
+
+                Booking.objects.bulk_create([booking for _, booking in bookings])
+                summaries.add_bookings(booking.pk for _, booking in bookings)
+                outbox.bookings_created(booking for _, booking in bookings)
+        except ClassFull as e:
+            return abort(lambda class_id: ClassFull(class_id) if class_id == e.class_id else BatchAborted(class_id))
+        except IntegrityError:
+            # A concurrent request booked one of these first
+            return abort(lambda class_id: ReservationError(
+                class_id, "Booking conflicted with a concurrent booking; please retry"
+            ))
+
+        for class_id, indexes in pending.items():
+            classes[class_id].available_slots -= len(indexes)
+        for index, booking in bookings:
+            results[index] = booking
+        return results
+
+    with transaction.atomic():
+        for class_id, indexes in pending.items():
+            while indexes:
+                try:
+                    with transaction.atomic():
+                        taken = _take_up_to(classes[class_id], len(indexes), now)
+                        booked, full = indexes[:taken], indexes[taken:]
+                        bookings = Booking.objects.bulk_create(build(class_id, booked))
+                        summaries.add_bookings(booking.pk for booking in bookings)
+                        outbox.bookings_created(bookings)
+                except IntegrityError:
+                    # A concurrent request booked some of these clients first;
+                    # retry the class without them
+                    indexes = _drop_booked(class_id, indexes, items, results)
+                    continue
+
+                classes[class_id].available_slots -= taken
+                for index, booking in zip(booked, bookings):
+                    results[index] = booking
+                for index in full:
+                    results[index] = ClassFull(class_id)
+                break
+
+    return results
+
+
+def join_waitlist(class_id, client_name, client_email):
+    """
+    Put a client on the waitlist of a full class.
+
+    Returns ``(entry, position)``, where position 1 is next in line. Raises a
+    ``ReservationError`` subclass if the client should book instead or is
+    already booked or waiting.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        fitness_class = (
+            FitnessClass.objects.filter(pk=class_id)
+            .annotate(already_booked=Exists(
+                Booking.objects.filter(fitness_class=OuterRef('pk'), client_email=client_email)
+            ))
+            .only('datetime', 'available_slots', 'slot_shards')
+            .first()
+        )
+        if fitness_class is None:
+            raise ClassNotFound(class_id)
+        if fitness_class.datetime <= now:
+            raise ClassNotUpcoming(class_id)
+        if fitness_class.already_booked:
+            raise AlreadyBooked(class_id)
+        if fitness_class.slot_shards:
+            # available_slots only catches up with the shards after each commit
+            free = shards.available(class_id)
+        else:
+            free = fitness_class.available_slots
+        if free > 0:
+            raise SlotsAvailable(class_id)
+
+        try:
+            with transaction.atomic():
+                entry = WaitlistEntry.objects.create(
+                    fitness_class_id=class_id,
+                    client_name=client_name,
+                    client_email=client_email,
+                )
+        except IntegrityError:
+            raise AlreadyWaitlisted(class_id)
+
+        position = WaitlistEntry.objects.filter(fitness_class_id=class_id, pk__lte=entry.pk).count()
+
+    return entry, position
+
+
+def _promote_next(class_id):
+    """
+    Turn the first waitlist entry of a class into a booking.
+
+    Returns the new booking, or None if nobody is waiting. Entries that can't
+    be promoted, because the client booked the class some other way, are
+    dropped and the next one is tried.
+    """
+    while True:
+        entry = WaitlistEntry.objects.filter(fitness_class_id=class_id).order_by('pk').first()
+        if entry is None:
+            return None
+
+        # Only the transaction that deletes the entry gets to promote it
+        if not WaitlistEntry.objects.filter(pk=entry.pk).delete()[0]:
+            continue
+
+        try:
+            with transaction.atomic():
+                booking = Booking.objects.create(
+                    fitness_class_id=class_id,
+                    client_name=entry.client_name,
+                    client_email=entry.client_email,
+                )
+        except IntegrityError:
+            continue
+
+        outbox.bookings_created([booking], source='waitlist')
+        return booking
+
+
+def cancel_booking(booking_id, client_email):
+    """
+    Cancel a booking and give its slot to the next client on the waitlist.
+
+    Everything happens in one transaction: the booking is deleted, and the
+    first waiting client, in FIFO order, is booked into the freed slot. If
+    nobody is waiting, or the class has already started, the slot is
+    returned to ``available_slots`` instead. Returns the promoted booking or
+    None. Raises ``BookingNotFound`` if the booking does not exist or was
+    made with another email.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        booking = (
+            Booking.objects.filter(pk=booking_id, client_email=client_email)
+            .select_related('fitness_class')
+            .first()
+        )
+        if booking is None:
+            raise BookingNotFound(None)
+
+        # A concurrent cancellation of the same booking deletes nothing
+        if not Booking.objects.filter(pk=booking.pk).delete()[0]:
+            raise BookingNotFound(booking.fitness_class_id)
+
+        class_id = booking.fitness_class_id
+        promoted = None
+        if booking.fitness_class.datetime > now:
+            promoted = _promote_next(class_id)
+            if promoted is not None:
+                # The slot changed hands, so the loaded class is still current
+                promoted.fitness_class = booking.fitness_class
+
+        if promoted is None and booking.fitness_class.slot_shards:
+            shards.release(class_id)
+        elif promoted is None:
+            FitnessClass.objects.filter(
+                pk=class_id, available_slots__lt=F('total_slots')
+            ).update(available_slots=F('available_slots') + 1, updated_at=now)
+            classes_changed.send(sender=FitnessClass, class_ids=[class_id], fields=['available_slots'])
+
+        outbox.booking_cancelled(booking, promoted)
+
+    return promoted
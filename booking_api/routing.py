@@ -0,0 +1,172 @@
+"""
+Database routing between the primary and its read replicas.
+
+Every write, and every read by default, goes to the ``default`` database.
+The read-only listing endpoints opt in to replicas with ``replica_reads()``,
+which sends the reads in its block to one of ``DATABASE_REPLICAS`` chosen at
+random.
+
+Replicas lag behind the primary by up to ``DATABASE_REPLICA_MAX_LAG``
+seconds, so clients that just booked or cancelled are pinned to the primary
+for that long: responses to writes set a cookie, and the client emails are
+recorded in the ``DATABASE_REPLICA_PIN_CACHE_ALIAS`` cache for API clients
+that don't keep cookies. That cache must be shared between processes, or a
+client whose next request lands on another process reads a stale replica.
+Pinned clients always see their own writes.
+
+Async views use ``ais_pinned()`` and ``areplica_reads()``, which don't block
+the event loop on the cache.
+
+For local development, replicas are SQLite files listed in
+``SQLITE_REPLICA_PATHS`` and refreshed from the primary by
+``manage.py sync_replicas``.
+"""
+import contextlib
+import contextvars
+import hashlib
+import random
+import sqlite3
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+
+DEFAULT_MAX_LAG = 10
+PIN_COOKIE = 'read_primary'
+
+# Replica alias used by reads in the current context, if any
+_replica = contextvars.ContextVar('replica', default=None)
+
+
+def get_replicas():
+    """Return the aliases of the configured read replicas."""
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def get_max_lag():
+    """Return how many seconds replicas may be behind the primary."""
+    return getattr(settings, 'DATABASE_REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+
+
+def get_pin_cache():
+    """Return the cache that records the client emails pinned to the primary."""
+    return caches[getattr(settings, 'DATABASE_REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def pin_key(email):
+    """Build the cache key that pins a client email to the primary."""
+    return f'replica:pin:{hashlib.md5(email.encode()).hexdigest()}'
+
+
+def _set_pin_cookie(response, emails):
+    """Set the pin cookie on ``response``; return the emails to pin in the cache."""
+    response.set_cookie(PIN_COOKIE, '1', max_age=get_max_lag(), samesite='Lax')
+    return {pin_key(email): True for email in emails if email}
+
+
+def pin_to_primary(response, emails=()):
+    """Send the reads of the client behind ``response`` to the primary for a while."""
+    if not get_replicas():
+        return
+    pins = _set_pin_cookie(response, emails)
+    if pins:
+        get_pin_cache().set_many(pins, timeout=get_max_lag())
+
+
+async def apin_to_primary(response, emails=()):
+    """Async version of ``pin_to_primary``."""
+    if not get_replicas():
+        return
+    pins = _set_pin_cookie(response, emails)
+    if pins:
+        await get_pin_cache().aset_many(pins, timeout=get_max_lag())
+
+
+def is_pinned(request, email=None):
+    """Return whether the client made a write recently enough to need the primary."""
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    return bool(email) and get_pin_cache().get(pin_key(email)) is not None
+
+
+async def ais_pinned(request, email=None):
+    """Async version of ``is_pinned``."""
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    return bool(email) and await get_pin_cache().aget(pin_key(email)) is not None
+
+
+@contextlib.contextmanager
+def _reads_from(alias):
+    """Send the reads in the block to the database ``alias``."""
+    token = _replica.set(alias)
+    try:
+        yield alias
+    finally:
+        _replica.reset(token)
+
+
+@contextlib.contextmanager
+def replica_reads(request, email=None):
+    """
+    Send the reads in the block to a replica; yield its alias.
+
+    Yields None, leaving reads on the primary, when there are no replicas
+    or the client is pinned to the primary.
+    """
+    replicas = get_replicas()
+    if not replicas or is_pinned(request, email):
+        yield None
+        return
+
+    with _reads_from(random.choice(replicas)) as alias:
+        yield alias
+
+
+@contextlib.asynccontextmanager
+async def areplica_reads(request, email=None):
+    """Async version of ``replica_reads``."""
+    replicas = get_replicas()
+    if not replicas or await ais_pinned(request, email):
+        yield None
+        return
+
+    with _reads_from(random.choice(replicas)) as alias:
+        yield alias
+
+
+class PrimaryReplicaRouter:
+    """Route writes to the primary, and reads to a replica inside ``replica_reads()``."""
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema with the data from the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+def copy_database(source, target):
+    """
+    Copy the SQLite database ``source`` onto ``target`` with the backup API.
+
+    The copy is taken from one consistent snapshot of the source, and
+    readers of the target see either the old or the new copy.
+    """
+    source_connection = sqlite3.connect(source, uri=True)
+    try:
+        target_connection = sqlite3.connect(target, uri=True, timeout=30)
+        try:
+            source_connection.backup(target_connection)
+        finally:
+            target_connection.close()
+    finally:
+        source_connection.close()
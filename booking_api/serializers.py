@@ -1,12 +1,41 @@
 """
 Serializers for the fitness booking API.
 """
+from django.conf import settings
+from django.db import models
+from django.db.models import Exists, OuterRef
 from rest_framework import serializers
-from .models import FitnessClass, Booking
+from .models import FitnessClass, Booking, WaitlistEntry
 
 
-class FitnessClassSerializer(serializers.ModelSerializer):
-    """Serializer for the FitnessClass model."""
+class TimezoneDateTimeField(serializers.DateTimeField):
+    """
+    DateTimeField that renders in the ``timezone`` from the serializer context.
+    
+    Falls back to the current timezone when the context has none.
+    """
+    
+    def default_timezone(self):
+        tz = self.context.get('timezone')
+        return tz if tz is not None else super().default_timezone()
+
+
+class TimezoneModelSerializer(serializers.ModelSerializer):
+    """ModelSerializer whose datetime fields render in the context's ``timezone``."""
+    
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.DateTimeField: TimezoneDateTimeField,
+    }
+
+
+class FitnessClassSerializer(TimezoneModelSerializer):
+    """
+    Serializer for the FitnessClass model.
+    
+    Accepts an optional ``fields`` argument to only render a subset of fields,
+    and a ``timezone`` in the context to render datetimes in.
+    """
     
     class Meta:
         model = FitnessClass
@@ -14,9 +43,18 @@ class FitnessClassSerializer(serializers.ModelSerializer):
             'id', 'name', 'class_type', 'datetime', 
             'instructor', 'total_slots', 'available_slots'
         ]
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        
+        # Drop any fields that were not requested
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(TimezoneModelSerializer):
     """Serializer for the Booking model."""
     
     class_details = FitnessClassSerializer(source='fitness_class', read_only=True)
@@ -62,26 +100,217 @@ class BookingSerializer(serializers.ModelSerializer):
         return booking
 
 
-class BookingCreateSerializer(serializers.Serializer):
-    """Serializer for booking creation requests."""
+class BookingItemSerializer(serializers.Serializer):
+    """Serializer for the fields of a booking request, without database checks."""
     
     class_id = serializers.IntegerField()
     client_name = serializers.CharField(max_length=100)
     client_email = serializers.EmailField()
+
+
+class BookingCreateSerializer(BookingItemSerializer):
+    """
+    Serializer for booking creation requests.
+    
+    Validation loads the class with a single query, annotated with whether
+    the client has already booked it. The class is returned in
+    ``validated_data['fitness_class']`` and the duplicate status in
+    ``validated_data['already_booked']``, so the view does not load either
+    again.
+    """
+    
+    def validate(self, data):
+        """Validate the class is bookable, in one query."""
+        fitness_class = (
+            FitnessClass.objects.filter(pk=data['class_id'])
+            .annotate(already_booked=Exists(
+                Booking.objects.filter(fitness_class=OuterRef('pk'), client_email=data['client_email'])
+            ))
+            .first()
+        )
+        # Kept for admission control, which learns from the class even when
+        # validation fails
+        self.fitness_class = fitness_class
+        
+        if fitness_class is None:
+            raise serializers.ValidationError({"class_id": "Class not found."})
+        
+        # Check if the class is in the past
+        if not fitness_class.is_upcoming():
+            raise serializers.ValidationError({"class_id": "Cannot book a class that has already started or ended."})
+        
+        # Check if there are available slots
+        if not fitness_class.has_available_slots():
+            raise serializers.ValidationError({"class_id": "No available slots for this class."})
+        
+        data['fitness_class'] = fitness_class
+        data['already_booked'] = fitness_class.already_booked
+        return data
+
+
+class BookingListSerializer:
+    """
+    Fast read-only serializer for booking listings.
+    
+    Builds the same output as ``BookingSerializer`` straight from ``.values()``
+    rows, so a whole listing is fetched with a single joined query and no
+    model instances or per-field serializer calls. Datetimes are rendered in
+    ``timezone``, or the current timezone if it is not given.
+    """
+    
+    booking_fields = ['id', 'fitness_class_id', 'client_name', 'client_email', 'booking_time']
+    class_fields = [
+        'name', 'class_type', 'datetime', 
+        'instructor', 'total_slots', 'available_slots'
+    ]
+    
+    def __init__(self, queryset, timezone=None):
+        self.queryset = queryset
+        # Reuse DRF's field so datetimes are rendered exactly like ModelSerializer
+        self.datetime_field = serializers.DateTimeField(default_timezone=timezone)
     
-    def validate_class_id(self, value):
-        """Validate the class_id field."""
-        try:
-            fitness_class = FitnessClass.objects.get(pk=value)
-            
-            # Check if the class is in the past
-            if not fitness_class.is_upcoming():
-                raise serializers.ValidationError("Cannot book a class that has already started or ended.")
-            
-            # Check if there are available slots
-            if not fitness_class.has_available_slots():
-                raise serializers.ValidationError("No available slots for this class.")
-            
-            return value
-        except FitnessClass.DoesNotExist:
-            raise serializers.ValidationError("Class not found.")
\ No newline at end of file
+    @classmethod
+    def value_fields(cls):
+        """Return the field names to pass to ``.values()``."""
+        return cls.booking_fields + [f'fitness_class__{name}' for name in cls.class_fields]
+    
+    def to_representation(self, row):
+        """Turn a ``.values()`` row into the serialized booking."""
+        to_datetime = self.datetime_field.to_representation
+        class_id = row['fitness_class_id']
+        return {
+            'id': row['id'],
+            'fitness_class': class_id,
+            'client_name': row['client_name'],
+            'client_email': row['client_email'],
+            'booking_time': to_datetime(row['booking_time']),
+            'class_details': {
+                'id': class_id,
+                'name': row['fitness_class__name'],
+                'class_type': row['fitness_class__class_type'],
+                'datetime': to_datetime(row['fitness_class__datetime']),
+                'instructor': row['fitness_class__instructor'],
+                'total_slots': row['fitness_class__total_slots'],
+                'available_slots': row['fitness_class__available_slots'],
+            },
+        }
+    
+    @property
+    def data(self):
+        """Return the serialized bookings as a list of dicts."""
+        return [
+            self.to_representation(row)
+            for row in self.queryset.values(*self.value_fields())
+        ]
+    
+    async def adata(self):
+        """Async version of ``data``."""
+        return [
+            self.to_representation(row)
+            async for row in self.queryset.values(*self.value_fields())
+        ]
+
+
+class BookingSummarySerializer(BookingListSerializer):
+    """
+    Fast read-only serializer for ``BookingSummary`` rows.
+    
+    Builds the same output as ``BookingSerializer``, but the class fields
+    are read from the summary row itself, so no join is needed. Slot counts
+    aren't kept on summaries, so they are read from the distinct classes
+    with one more primary-key query.
+    """
+    
+    booking_fields = ['booking_id', 'fitness_class_id', 'client_name', 'client_email', 'booking_time']
+    class_fields = [
+        'class_name', 'class_type', 'class_datetime', 
+        'instructor', 'total_slots'
+    ]
+    
+    @classmethod
+    def value_fields(cls):
+        """Return the field names to pass to ``.values()``."""
+        return cls.booking_fields + cls.class_fields
+    
+    def to_representation(self, row):
+        """Turn a ``.values()`` row, with its class's ``available_slots`` added, into the serialized booking."""
+        to_datetime = self.datetime_field.to_representation
+        class_id = row['fitness_class_id']
+        return {
+            'id': row['booking_id'],
+            'fitness_class': class_id,
+            'client_name': row['client_name'],
+            'client_email': row['client_email'],
+            'booking_time': to_datetime(row['booking_time']),
+            'class_details': {
+                'id': class_id,
+                'name': row['class_name'],
+                'class_type': row['class_type'],
+                'datetime': to_datetime(row['class_datetime']),
+                'instructor': row['instructor'],
+                'total_slots': row['total_slots'],
+                'available_slots': row['available_slots'],
+            },
+        }
+    
+    @staticmethod
+    def slots_query(rows):
+        """Return a query for the ``(id, available_slots)`` of the classes in ``rows``."""
+        return FitnessClass.objects.filter(
+            pk__in={row['fitness_class_id'] for row in rows}
+        ).values_list('id', 'available_slots')
+    
+    def represent(self, rows, slots):
+        """Serialize ``rows`` with the ``{class id: available_slots}`` in ``slots``."""
+        for row in rows:
+            row['available_slots'] = slots.get(row['fitness_class_id'], 0)
+        return [self.to_representation(row) for row in rows]
+    
+    @property
+    def data(self):
+        """Return the serialized bookings as a list of dicts."""
+        rows = list(self.queryset.values(*self.value_fields()))
+        if not rows:
+            return []
+        return self.represent(rows, dict(self.slots_query(rows)))
+    
+    async def adata(self):
+        """Async version of ``data``."""
+        rows = [row async for row in self.queryset.values(*self.value_fields())]
+        if not rows:
+            return []
+        return self.represent(rows, {class_id: slots async for class_id, slots in self.slots_query(rows)})
+
+
+class BatchBookingCreateSerializer(serializers.Serializer):
+    """Serializer for batch booking requests."""
+    
+    MODE_ALL_OR_NOTHING = 'all_or_nothing'
+    MODE_BEST_EFFORT = 'best_effort'
+    MODES = (MODE_ALL_OR_NOTHING, MODE_BEST_EFFORT)
+    
+    bookings = BookingItemSerializer(many=True, allow_empty=False)
+    mode = serializers.ChoiceField(choices=MODES, default=MODE_ALL_OR_NOTHING)
+    
+    def validate_bookings(self, value):
+        """Validate the number of bookings in the batch."""
+        max_items = getattr(settings, 'BATCH_BOOKING_MAX_ITEMS', 100)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"A batch can contain at most {max_items} bookings.")
+        return value
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    """Serializer for the WaitlistEntry model."""
+    
+    class Meta:
+        model = WaitlistEntry
+        fields = ['id', 'fitness_class', 'client_name', 'client_email', 'created_at']
+        read_only_fields = ['created_at']
+
+
+class BookingCancelSerializer(serializers.Serializer):
+    """Serializer for booking cancellation requests."""
+    
+    booking_id = serializers.IntegerField()
+    client_email = serializers.EmailField()
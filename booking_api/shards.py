@@ -0,0 +1,271 @@
+"""
+Sharded slot counters for busy fitness classes.
+
+Every booking of a class normally decrements its ``available_slots``, so
+bookings of a popular class all wait on that one row. A sharded class
+instead splits its slots across ``slot_shards`` ``SlotShard`` rows. Each
+shard holds a share of ``total_slots`` as its ``capacity``, and a booking
+takes a slot from a random shard with some left, trying the others when
+that one runs out. Every decrement is conditional, and no shard goes below
+zero or above its capacity, so the class can never be overbooked. A
+booking first decrements up to ``TAKE_ATTEMPTS`` shards picked at random by
+number, without reading them, so its first statement is a write: SQLite
+takes the write lock straight away instead of upgrading a read lock, which
+fails with "database is locked" under concurrent bookings. Only if those
+shards are empty does it read which shards have room and try each of them
+once, so a booking never retries without bound.
+
+``available_slots`` is then a cached sum of the shards. Rather than after
+every booking, which would make each one update the class row again, it is
+folded back at most once per ``SLOT_FOLD_DELAY`` seconds per process: commits
+that change a shard queue the class, and a timer folds every queued class
+with one UPDATE and sends the usual ``classes_changed`` signal, which keeps
+the listing cache, availability index and booking summaries in step. Listings
+can therefore show a sharded class's count up to ``SLOT_FOLD_DELAY`` seconds
+late. ``manage.py fold_slots`` folds any class a process left queued when it
+exited.
+
+Sharding pays off on databases with row-level locks, such as PostgreSQL
+or MySQL. SQLite locks the whole database for every write, so it gains
+nothing there.
+"""
+import logging
+import random
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import FitnessClass, SlotShard
+from .signals import classes_changed
+
+
+DEFAULT_FOLD_DELAY = 1.0
+
+# Random shards a booking tries before it reads which ones have room
+TAKE_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+class _NotEnoughSlots(Exception):
+    """Raised to roll back a take that was spread over several shards."""
+
+
+def split(total, count):
+    """Split ``total`` into ``count`` near-equal parts, larger parts first."""
+    return [total // count + (number < total % count) for number in range(count)]
+
+
+def available(class_id):
+    """Return the free slots of a sharded class, summed over its shards."""
+    return SlotShard.objects.filter(fitness_class_id=class_id).aggregate(
+        total=Coalesce(Sum('available'), 0)
+    )['total']
+
+
+def _totals():
+    return (
+        SlotShard.objects.filter(fitness_class=OuterRef('pk'))
+        .values('fitness_class')
+        .annotate(total=Sum('available'))
+        .values('total')
+    )
+
+
+def fold(class_ids):
+    """Copy the sum of the shards into ``available_slots`` of sharded classes."""
+    class_ids = list(class_ids)
+    updated = FitnessClass.objects.filter(pk__in=class_ids, slot_shards__gt=0).update(
+        available_slots=Coalesce(Subquery(_totals()), 0),
+        updated_at=timezone.now(),
+    )
+    if updated:
+        classes_changed.send(sender=FitnessClass, class_ids=class_ids, fields=['available_slots'])
+    return updated
+
+
+def unfolded():
+    """Return the ids of sharded classes whose ``available_slots`` is behind their shards."""
+    return [
+        class_id
+        for class_id, available, total in FitnessClass.objects.filter(slot_shards__gt=0)
+        .annotate(total=Coalesce(Subquery(_totals()), 0))
+        .values_list('id', 'available_slots', 'total')
+        if available != total
+    ]
+
+
+def get_fold_delay():
+    """Return how many seconds shard changes wait to be folded; 0 folds after every commit."""
+    return getattr(settings, 'SLOT_FOLD_DELAY', DEFAULT_FOLD_DELAY)
+
+
+class _FoldQueue:
+    """The sharded classes this process changed and has not folded yet."""
+
+    def __init__(self):
+        self.class_ids = set()
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, class_id):
+        """Queue a class to be folded, starting the timer if none is running."""
+        delay = get_fold_delay()
+        if delay <= 0:
+            fold([class_id])
+            return
+
+        with self.lock:
+            self.class_ids.add(class_id)
+            if self.timer is None:
+                self.timer = threading.Timer(delay, self._flush_later)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Fold every queued class now; return how many were updated."""
+        with self.lock:
+            class_ids, self.class_ids = self.class_ids, set()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        return fold(class_ids) if class_ids else 0
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to fold sharded slot counts; run manage.py fold_slots")
+        finally:
+            # The timer thread opened its own connection
+            connections.close_all()
+
+
+_folds = _FoldQueue()
+
+
+def flush_folds():
+    """Fold the classes queued by this process now instead of when the timer fires."""
+    return _folds.flush()
+
+
+def _fold_on_commit(class_id):
+    # robust: the booking is committed, so a failed fold must not fail it
+    transaction.on_commit(lambda: _folds.add(class_id), robust=True)
+
+
+def _decrement(count, **shard):
+    """Take ``count`` slots from the shard matching ``shard`` if it has them."""
+    return bool(SlotShard.objects.filter(available__gte=count, **shard).update(available=F('available') - count))
+
+
+def take(class_id, count=1, shard_count=None):
+    """
+    Take ``count`` slots from the shards of a class; return whether they were taken.
+
+    Slots come from one random shard that has enough of them, or, if none
+    has, from several shards at once. ``shard_count`` is the class's
+    ``slot_shards``, if the caller has loaded it. Call this inside the
+    transaction that books the slots.
+    """
+    if shard_count is None:
+        shard_count = FitnessClass.objects.filter(pk=class_id).values_list('slot_shards', flat=True).first() or 0
+
+    # Guess a few shard numbers first, so the first statement is an UPDATE
+    for number in random.sample(range(shard_count), min(TAKE_ATTEMPTS, shard_count)):
+        if _decrement(count, fitness_class_id=class_id, number=number):
+            _fold_on_commit(class_id)
+            return True
+
+    # The guesses found no room, so try each shard that has some once
+    shards = list(
+        SlotShard.objects.filter(fitness_class_id=class_id, available__gt=0)
+        .values_list('pk', 'available')
+    )
+    random.shuffle(shards)
+    for pk, free in shards:
+        if free >= count and _decrement(count, pk=pk):
+            _fold_on_commit(class_id)
+            return True
+
+    if count == 1 or sum(free for _, free in shards) < count:
+        return False
+
+    # No single shard has enough, so spread the slots over several in a
+    # savepoint that is rolled back unless all of them are taken
+    try:
+        with transaction.atomic():
+            wanted = count
+            for pk, _ in shards:
+                free = SlotShard.objects.filter(pk=pk).values_list('available', flat=True).first() or 0
+                taken = min(wanted, free)
+                if taken and SlotShard.objects.filter(pk=pk, available__gte=taken).update(
+                    available=F('available') - taken
+                ):
+                    wanted -= taken
+                if not wanted:
+                    break
+            if wanted:
+                raise _NotEnoughSlots(class_id)
+    except _NotEnoughSlots:
+        return False
+
+    _fold_on_commit(class_id)
+    return True
+
+
+def release(class_id):
+    """
+    Give a slot back to a random shard of a class that has room for it.
+
+    Returns False if every shard is already at capacity.
+    """
+    shards = list(
+        SlotShard.objects.filter(fitness_class_id=class_id, available__lt=F('capacity'))
+        .values_list('pk', flat=True)
+    )
+    random.shuffle(shards)
+
+    for pk in shards:
+        if SlotShard.objects.filter(pk=pk, available__lt=F('capacity')).update(available=F('available') + 1):
+            _fold_on_commit(class_id)
+            return True
+    return False
+
+
+def shard_class(class_id, count):
+    """
+    Split the slots of a class across ``count`` shards, or merge them back
+    into ``available_slots`` with a ``count`` of 0 or 1.
+
+    Existing shards are locked and summed first, so bookings made while the
+    class is resharded are neither lost nor counted twice. Returns the
+    updated class.
+    """
+    count = 0 if count <= 1 else count
+    with transaction.atomic():
+        fitness_class = FitnessClass.objects.select_for_update().get(pk=class_id)
+        if fitness_class.slot_shards:
+            shards = list(SlotShard.objects.select_for_update().filter(fitness_class_id=class_id))
+            free = sum(shard.available for shard in shards)
+            SlotShard.objects.filter(fitness_class_id=class_id).delete()
+        else:
+            free = fitness_class.available_slots
+
+        if count:
+            SlotShard.objects.bulk_create([
+                SlotShard(fitness_class_id=class_id, number=number, capacity=capacity, available=shard_free)
+                for number, (capacity, shard_free) in enumerate(zip(
+                    split(fitness_class.total_slots, count), split(free, count)
+                ))
+            ])
+
+        fitness_class.slot_shards = count
+        fitness_class.available_slots = free
+        fitness_class.save(update_fields=['slot_shards', 'available_slots', 'updated_at'])
+
+    return fitness_class
@@ -0,0 +1,117 @@
+"""
+Signals for the fitness booking API.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from . import admission, cache, metrics
+
+
+# Sent when fitness classes are written without save(), e.g. by queryset
+# updates that change available_slots or bulk timezone conversions. Senders
+# pass the changed ``class_ids`` and ``fields`` when they know them; None
+# means any class or field.
+classes_changed = Signal()
+
+# Changes to only these fields are patched into cached pages
+SLOT_FIELDS = frozenset(['available_slots'])
+
+
+@receiver(post_save, sender='booking_api.FitnessClass')
+@receiver(post_delete, sender='booking_api.FitnessClass')
+@receiver(classes_changed)
+def invalidate_classes_cache(sender, instance=None, class_ids=None, fields=None, created=False, **kwargs):
+    """Invalidate the cached classes listing when classes change."""
+    if instance is not None and not created and kwargs.get('signal') is post_save:
+        class_ids, fields = [instance.pk], kwargs.get('update_fields')
+    
+    if class_ids is not None and fields is not None and SLOT_FIELDS.issuperset(fields):
+        # Publish slot changes again once they are visible, so a page
+        # patched by a concurrent reader before the commit is patched again
+        cache.publish_slot_changes(class_ids)
+        transaction.on_commit(lambda: cache.publish_slot_changes(class_ids))
+        return
+    
+    cache.invalidate()
+    
+    # Invalidate again once the write is visible, so a page cached by a
+    # concurrent reader before the commit is not served afterwards
+    transaction.on_commit(cache.invalidate)
+
+
+@receiver(post_save, sender='booking_api.FitnessClass')
+@receiver(classes_changed)
+def refresh_booking_summaries(sender, instance=None, class_ids=None, fields=None, created=False, **kwargs):
+    """Copy changed class fields onto the booking summaries of the class."""
+    # Imported here because the summaries module imports the models
+    from . import summaries
+    
+    if created or kwargs.get('raw'):
+        return
+    if instance is not None:
+        class_ids, fields = [instance.pk], kwargs.get('update_fields')
+    summaries.refresh_classes(class_ids, fields)
+
+
+@receiver(post_save, sender='booking_api.FitnessClass')
+@receiver(post_delete, sender='booking_api.FitnessClass')
+@receiver(classes_changed)
+def update_availability_index(sender, instance=None, class_ids=None, fields=None, created=False, **kwargs):
+    """Mark changed classes in the in-memory availability index."""
+    # Imported here because the availability module imports the models
+    from . import availability
+    
+    if instance is not None:
+        # New and deleted classes change the order, so they need a rebuild
+        deleted = kwargs.get('signal') is post_delete
+        update_fields = kwargs.get('update_fields')
+        if created or deleted or update_fields is None:
+            class_ids, fields = None, None
+        else:
+            class_ids, fields = [instance.pk], update_fields
+    
+    availability.changed(class_ids, fields)
+    
+    # Again once the write is visible, so a patch or rebuild that ran before
+    # the commit does not keep the old values
+    transaction.on_commit(lambda: availability.changed(class_ids, fields))
+
+
+@receiver(post_save, sender='booking_api.FitnessClass')
+@receiver(post_delete, sender='booking_api.FitnessClass')
+def reset_admission(sender, instance, **kwargs):
+    """Forget the slot budget of an edited, new or deleted class."""
+    admission.forget(instance.pk)
+
+
+@receiver(post_save, sender='booking_api.Booking')
+def save_booking_summary(sender, instance, created, raw=False, **kwargs):
+    """Add or replace the summary of a saved booking."""
+    from . import summaries
+    
+    if raw:
+        return
+    if not created:
+        summaries.remove_bookings([instance.pk])
+    summaries.add_bookings([instance.pk])
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Apply ``SQLITE_PRAGMAS`` from settings to every new SQLite connection."""
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    """Record the queries of every connection in the request metrics."""
+    metrics.install(connection)
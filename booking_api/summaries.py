@@ -0,0 +1,108 @@
+"""
+Per-client booking summaries for the fitness booking API.
+
+``BookingSummary`` is a read model of ``Booking`` with the fields of each
+booking's class copied onto the row, so listing a client's bookings is a
+single indexed lookup with no join. Rows are added when bookings are
+created, removed with their booking by the ``CASCADE`` foreign key, and
+refreshed whenever their class is edited. ``rebuild()`` recreates the whole
+table from the source tables.
+
+Slot counts are left out: every booking changes them, and copying them
+would rewrite every summary of the class inside the booking transaction.
+``BookingSummarySerializer`` reads them from the classes instead.
+"""
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import FitnessClass, Booking, BookingSummary
+
+
+# Summary field -> the FitnessClass field it is copied from
+CLASS_FIELDS = {
+    'class_name': 'name',
+    'class_type': 'class_type',
+    'class_datetime': 'datetime',
+    'instructor': 'instructor',
+    'total_slots': 'total_slots',
+}
+
+# Summary field -> the Booking field it is copied from
+BOOKING_FIELDS = {
+    'booking_id': 'id',
+    'fitness_class_id': 'fitness_class_id',
+    'client_name': 'client_name',
+    'client_email': 'client_email',
+    'booking_time': 'booking_time',
+}
+
+
+def _insert_sql(booking_count=None):
+    """
+    Build an ``INSERT ... SELECT`` that copies bookings into the summary table.
+
+    With ``booking_count``, only that many bookings, given by id, are copied.
+    The ORM has no ``INSERT ... SELECT``, and doing it in one statement means
+    the class fields are read and written under the same write lock.
+    """
+    qn = connection.ops.quote_name
+    columns = [*BOOKING_FIELDS, *CLASS_FIELDS]
+    selected = [f'b.{qn(name)}' for name in BOOKING_FIELDS.values()]
+    selected += [f'c.{qn(name)}' for name in CLASS_FIELDS.values()]
+
+    sql = (
+        f"INSERT INTO {qn(BookingSummary._meta.db_table)} ({', '.join(map(qn, columns))}) "
+        f"SELECT {', '.join(selected)} "
+        f"FROM {qn(Booking._meta.db_table)} b "
+        f"INNER JOIN {qn(FitnessClass._meta.db_table)} c ON c.{qn('id')} = b.{qn('fitness_class_id')}"
+    )
+    if booking_count is not None:
+        sql += f" WHERE b.{qn('id')} IN ({', '.join(['%s'] * booking_count)})"
+    return sql
+
+
+def add_bookings(booking_ids):
+    """Add the summaries of newly created bookings."""
+    booking_ids = list(booking_ids)
+    if not booking_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(_insert_sql(len(booking_ids)), booking_ids)
+
+
+def remove_bookings(booking_ids):
+    """Remove the summaries of bookings, e.g. before re-adding changed ones."""
+    BookingSummary.objects.filter(booking_id__in=list(booking_ids)).delete()
+
+
+def refresh_classes(class_ids=None, fields=None):
+    """
+    Copy the current class fields onto the summaries of ``class_ids``.
+
+    ``None`` refreshes every summary; ``fields`` limits the refresh to the
+    given ``FitnessClass`` fields, and changes to fields that aren't copied
+    cost nothing. This is one ``UPDATE`` whatever the number of rows, with
+    the new values read by correlated subqueries.
+    """
+    summaries = BookingSummary.objects.all()
+    if class_ids is not None:
+        summaries = summaries.filter(fitness_class_id__in=list(class_ids))
+
+    fitness_class = FitnessClass.objects.filter(pk=OuterRef('fitness_class_id'))
+    values = {
+        field: Subquery(fitness_class.values(source)[:1])
+        for field, source in CLASS_FIELDS.items()
+        if fields is None or source in fields
+    }
+    if values:
+        summaries.update(**values)
+
+
+def rebuild():
+    """Recreate every booking summary from scratch; return the number of rows."""
+    with transaction.atomic():
+        BookingSummary.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(_insert_sql())
+            return cursor.rowcount
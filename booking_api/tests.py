@@ -1,14 +1,53 @@
 """
 Tests for the fitness booking API.
 """
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, router, transaction
+from django.db.models import Count, F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
+import base64
 import datetime
+import io
 import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
 
-from .models import FitnessClass, Booking
+from . import admission
+from . import availability
+from . import cache as classes_cache
+from . import exports
+from . import idempotency
+from . import metrics
+from . import outbox
+from . import routing
+from . import shards
+from . import timezones
+from .checks import check_replica_pin_cache, check_shared_caches
+from .loadtest import percentile, summarize
+from .models import (
+    FitnessClass, Booking, BookingSummary, IdempotencyRecord, OutboxMessage, SlotShard, WaitlistEntry
+)
+from .pagination import paginate_by_datetime
+from .serializers import FitnessClassSerializer, BookingSerializer, BookingListSerializer, BookingSummarySerializer
+from .signals import classes_changed, configure_sqlite_connection
+from .urls import get_urlpatterns
+from .views import upcoming_classes
+from .reservations import (
+    reserve_slot, reserve_batch, cancel_booking, AlreadyBooked, ClassFull, ClassNotFound, ClassNotUpcoming
+)
 
 
 class FitnessClassModelTests(TestCase):
@@ -139,6 +178,49 @@ class APITests(TestCase):
         
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
     
+    def test_create_booking_statements(self):
+        """
+        Test the statement budget of a booking: one query to validate it, then
+        one UPDATE and three INSERTs in the booking transaction.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/book/', {
+                'class_id': self.future_class.id,
+                'client_name': 'New User',
+                'client_email': 'new@example.com'
+            }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['class_details']['available_slots'], 18)
+        
+        # Ignore the savepoints the test transaction adds around the write
+        statements = [
+            query['sql'].split()[:3] for query in queries.captured_queries
+            if 'SAVEPOINT' not in query['sql']
+        ]
+        # Validation reads the class once; the rest is the booking transaction
+        self.assertEqual([statement[0] for statement in statements], [
+            'SELECT', 'UPDATE', 'INSERT', 'INSERT', 'INSERT'
+        ])
+        # The booking, its summary and its outbox message
+        self.assertEqual([statement[2] for statement in statements[2:]], [
+            f'"{Booking._meta.db_table}"',
+            f'"{BookingSummary._meta.db_table}"',
+            f'"{OutboxMessage._meta.db_table}"',
+        ])
+    
+    def test_create_booking_duplicate(self):
+        """Test that a duplicate booking is rejected without writing."""
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/book/', {
+                'class_id': self.future_class.id,
+                'client_name': 'Test Client',
+                'client_email': 'test@example.com'
+            }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"error": "You have already booked this class"})
+    
     def test_get_bookings(self):
         """Test the GET /bookings endpoint."""
         # Get bookings for an email that has bookings
@@ -161,4 +243,1966 @@ class APITests(TestCase):
         # Try to get bookings without providing an email
         response = self.client.get('/api/bookings/')
         
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ReservationTests(TestCase):
+    """Test cases for the slot reservation engine."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.fitness_class = FitnessClass.objects.create(
+            name="Intense HIIT",
+            class_type="HIIT",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Jane Smith",
+            total_slots=2,
+            available_slots=2
+        )
+    
+    def test_reserve_slot(self):
+        """Test that a reservation decrements slots and creates a booking."""
+        # Savepoint, UPDATE, INSERT and release, plus an INSERT for the
+        # booking summary and an INSERT into the outbox
+        with self.assertNumQueries(6):
+            booking = reserve_slot(self.fitness_class.id, 'New User', 'new@example.com')
+        
+        self.assertEqual(booking.fitness_class_id, self.fitness_class.id)
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 1)
+    
+    def test_reserve_slot_never_overbooks(self):
+        """Test that a full class rejects further reservations."""
+        reserve_slot(self.fitness_class.id, 'User One', 'one@example.com')
+        reserve_slot(self.fitness_class.id, 'User Two', 'two@example.com')
+        
+        with self.assertRaises(ClassFull):
+            reserve_slot(self.fitness_class.id, 'User Three', 'three@example.com')
+        
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertEqual(Booking.objects.filter(fitness_class=self.fitness_class).count(), 2)
+    
+    def test_duplicate_booking_releases_slot(self):
+        """Test that a duplicate booking does not consume a slot."""
+        reserve_slot(self.fitness_class.id, 'New User', 'new@example.com')
+        
+        with self.assertRaises(AlreadyBooked):
+            reserve_slot(self.fitness_class.id, 'New User', 'new@example.com')
+        
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 1)
+    
+    def test_reserve_slot_failures(self):
+        """Test missing and past classes."""
+        with self.assertRaises(ClassNotFound):
+            reserve_slot(self.fitness_class.id + 100, 'New User', 'new@example.com')
+        
+        self.fitness_class.datetime = timezone.now() - datetime.timedelta(hours=1)
+        self.fitness_class.save()
+        with self.assertRaises(ClassNotUpcoming):
+            reserve_slot(self.fitness_class.id, 'New User', 'new@example.com')
+
+
+@override_settings(SLOT_FOLD_DELAY=0)
+class ShardedSlotTests(TestCase):
+    """Test cases for classes whose slots are split across counter shards."""
+    
+    def setUp(self):
+        """Set up a class with 7 slots across 3 shards."""
+        self.fitness_class = FitnessClass.objects.create(
+            name="Spin Sprint",
+            class_type="CYCLING",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Mike Johnson",
+            total_slots=7,
+            available_slots=7
+        )
+        shards.shard_class(self.fitness_class.id, 3)
+    
+    def shard_counts(self):
+        return list(
+            SlotShard.objects.filter(fitness_class=self.fitness_class)
+            .order_by('number').values_list('capacity', 'available')
+        )
+    
+    def book(self, count, prefix='client'):
+        with self.captureOnCommitCallbacks(execute=True):
+            for number in range(count):
+                reserve_slot(self.fitness_class.id, 'Client', f'{prefix}{number}@example.com')
+    
+    def test_shard_class(self):
+        """Test that the slots are split evenly and merged back."""
+        self.assertEqual(self.shard_counts(), [(3, 3), (2, 2), (2, 2)])
+        
+        self.book(2)
+        fitness_class = shards.shard_class(self.fitness_class.id, 0)
+        self.assertEqual((fitness_class.slot_shards, fitness_class.available_slots), (0, 5))
+        self.assertFalse(SlotShard.objects.exists())
+    
+    def test_bookings_never_overbook(self):
+        """Test that bookings drain every shard, then fail, and the count is folded back."""
+        self.book(7)
+        
+        with self.assertRaises(ClassFull):
+            reserve_slot(self.fitness_class.id, 'Client', 'late@example.com')
+        
+        self.assertEqual([available for _, available in self.shard_counts()], [0, 0, 0])
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertEqual(Booking.objects.filter(fitness_class=self.fitness_class).count(), 7)
+    
+    def test_take_starts_with_update(self):
+        """Test that a booking decrements a shard before reading any, without a subquery on the shards."""
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            self.assertTrue(shards.take(self.fitness_class.id, shard_count=3))
+        statements = [query['sql'] for query in queries.captured_queries if 'slotshard' in query['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('UPDATE'))
+        self.assertNotIn('SELECT', statements[0])
+    
+    def test_take_is_bounded(self):
+        """Test that a booking stops after a few guesses and one pass over the shards with room."""
+        SlotShard.objects.filter(fitness_class=self.fitness_class).exclude(number=2).update(available=0)
+        with unittest.mock.patch('random.sample', return_value=[0, 1]):
+            with self.assertNumQueries(4):
+                self.assertTrue(shards.take(self.fitness_class.id, shard_count=3))
+        
+        SlotShard.objects.filter(fitness_class=self.fitness_class).update(available=0)
+        with self.assertNumQueries(shards.TAKE_ATTEMPTS + 1):
+            self.assertFalse(shards.take(self.fitness_class.id, shard_count=3))
+    
+    @override_settings(SLOT_FOLD_DELAY=60)
+    def test_folds_are_coalesced(self):
+        """Test that bookings queue their class and one flush folds them all."""
+        self.addCleanup(shards.flush_folds)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            for number in range(3):
+                fitness_class = FitnessClass.objects.get(pk=self.fitness_class.id)
+                reserve_slot(fitness_class.id, 'Client', f'client{number}@example.com', fitness_class)
+        self.assertFalse(any(
+            query['sql'].startswith('UPDATE "booking_api_fitnessclass"') for query in queries.captured_queries
+        ))
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 7)
+        
+        self.assertEqual(shards.flush_folds(), 1)
+        self.assertEqual(shards.flush_folds(), 0)
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 4)
+    
+    def test_fold_slots_command(self):
+        """Test that fold_slots folds the classes whose count is behind their shards."""
+        SlotShard.objects.filter(fitness_class=self.fitness_class, number=0).update(available=1)
+        self.assertEqual(shards.unfolded(), [self.fitness_class.id])
+        
+        out = io.StringIO()
+        call_command('fold_slots', stdout=out)
+        self.assertIn('1 classes', out.getvalue())
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 5)
+        self.assertEqual(shards.unfolded(), [])
+    
+    def test_batch_spans_shards(self):
+        """Test that a batch larger than any shard takes slots from several."""
+        items = [
+            {'class_id': self.fitness_class.id, 'client_name': 'Client', 'client_email': f'c{n}@example.com'}
+            for n in range(6)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            results = reserve_batch(items[:5])
+        self.assertTrue(all(isinstance(result, Booking) for result in results))
+        self.assertEqual(shards.available(self.fitness_class.id), 2)
+        
+        # Not enough slots left: nothing is taken from any shard
+        counts = self.shard_counts()
+        results = reserve_batch([{**item, 'client_email': f'x{n}@example.com'} for n, item in enumerate(items[:3])])
+        self.assertIsInstance(results[0], ClassFull)
+        self.assertEqual(self.shard_counts(), counts)
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 2)
+    
+    def test_cancel_returns_slot_to_a_shard(self):
+        """Test that cancellations never fill a shard past its capacity."""
+        self.book(7)
+        bookings = list(Booking.objects.filter(fitness_class=self.fitness_class))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            for booking in bookings:
+                cancel_booking(booking.id, booking.client_email)
+        
+        self.assertEqual(self.shard_counts(), [(3, 3), (2, 2), (2, 2)])
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 7)
+    
+    def test_booking_through_api(self):
+        """Test that the booking endpoint books sharded classes."""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post('/api/book/', {
+                'class_id': self.fitness_class.id,
+                'client_name': 'Jane Smith',
+                'client_email': 'jane@example.com'
+            }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['class_details']['available_slots'], 6)
+        self.assertEqual(shards.available(self.fitness_class.id), 6)
+
+
+@override_settings(ADMISSION_REFRESH_INTERVAL=60)
+class AdmissionControlTests(TestCase):
+    """Test cases for admission control of booking requests."""
+    
+    def setUp(self):
+        """Set up a class with 2 slots."""
+        self.client = APIClient()
+        admission.clear()
+        self.addCleanup(admission.clear)
+        metrics.registry.clear()
+        
+        self.fitness_class = FitnessClass.objects.create(
+            name="Power Yoga",
+            class_type="YOGA",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="John Doe",
+            total_slots=2,
+            available_slots=2
+        )
+    
+    def book(self, email):
+        return self.client.post('/api/book/', {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Client',
+            'client_email': email
+        }, format='json')
+    
+    def test_sold_out_rejected_without_queries(self):
+        """Test that requests for a sold out class never reach the database."""
+        self.assertEqual(self.book('one@example.com').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.book('two@example.com').status_code, status.HTTP_201_CREATED)
+        
+        with self.assertNumQueries(0):
+            response = self.book('three@example.com')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['error'], "No available slots for this class")
+        self.assertIn(
+            'booking_admission_decisions_total{decision="sold_out"} 1', metrics.registry.render()
+        )
+    
+    def test_failed_requests_give_tokens_back(self):
+        """Test that a request rejected for another reason doesn't use up a slot."""
+        self.book('one@example.com')
+        self.assertEqual(self.book('one@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.book('two@example.com').status_code, status.HTTP_201_CREATED)
+        
+        with self.assertNumQueries(0):
+            self.book('three@example.com')
+    
+    @override_settings(ADMISSION_REFRESH_INTERVAL=0)
+    def test_budget_is_relearned(self):
+        """Test that slots freed by a cancellation are seen after the refresh interval."""
+        self.book('one@example.com')
+        self.book('two@example.com')
+        self.assertEqual(self.book('three@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        
+        booking = Booking.objects.get(client_email='one@example.com')
+        cancel_booking(booking.id, booking.client_email)
+        self.assertEqual(self.book('three@example.com').status_code, status.HTTP_201_CREATED)
+    
+    @override_settings(ADMISSION_MAX_WRITERS=1, ADMISSION_QUEUE_TIMEOUT=0.05)
+    def test_writers_are_bounded(self):
+        """Test that requests beyond the writer bound queue, then time out."""
+        ticket = admission.admit(self.fitness_class.id)
+        with self.assertRaises(admission.Overloaded):
+            admission.admit(self.fitness_class.id)
+        
+        response = self.book('one@example.com')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        
+        # A queued request is let in when the running one finishes
+        with override_settings(ADMISSION_QUEUE_TIMEOUT=5):
+            admitted = []
+            waiter = threading.Thread(target=lambda: admitted.append(admission.admit(self.fitness_class.id)))
+            waiter.start()
+            gate = admission._controller.gate(self.fitness_class.id)
+            while not gate.waiting:
+                time.sleep(0.001)
+            with ticket:
+                pass
+            waiter.join()
+        
+        self.assertEqual(len(admitted), 1)
+        rendered = metrics.registry.render()
+        self.assertIn('booking_admission_decisions_total{decision="timed_out"} 2', rendered)
+        self.assertIn('booking_admission_decisions_total{decision="queued"} 1', rendered)
+        self.assertIn('booking_admission_queued{} 0', rendered)
+    
+    @override_settings(ADMISSION_QUEUE_TIMEOUT=5)
+    def test_queued_requests_rejected_when_sold_out(self):
+        """Test that requests waiting for the last slot are rejected once it is booked."""
+        tickets = [admission.admit(self.fitness_class.id) for _ in range(2)]
+        for ticket in tickets:
+            ticket.learn(2)
+        
+        errors = []
+        
+        def wait():
+            try:
+                admission.admit(self.fitness_class.id)
+            except admission.SoldOut as e:
+                errors.append(e)
+        
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        gate = admission._controller.gate(self.fitness_class.id)
+        while not gate.waiting:
+            time.sleep(0.001)
+        for ticket in tickets:
+            with ticket:
+                ticket.booked()
+        waiter.join(1)
+        
+        self.assertEqual(len(errors), 1)
+
+
+class IdempotencyTests(TestCase):
+    """Test cases for Idempotency-Key support on POST /api/book/."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        idempotency.get_cache().clear()
+        
+        self.fitness_class = FitnessClass.objects.create(
+            name="Morning Pilates",
+            class_type="PILATES",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Sophia Wilson",
+            total_slots=10,
+            available_slots=10
+        )
+        self.data = {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Jane Smith',
+            'client_email': 'jane@example.com'
+        }
+    
+    def book(self, key, data=None):
+        return self.client.post('/api/book/', data or self.data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+    
+    def test_retry_replays_response(self):
+        """Test that a retry gets the original response without any queries."""
+        first = self.book('retry-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        
+        with self.assertNumQueries(0):
+            second = self.book('retry-1')
+        
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+    
+    def test_replay_from_table(self):
+        """Test that responses outlive the cache, errors included."""
+        self.fitness_class.available_slots = 0
+        self.fitness_class.save()
+        first = self.book('full-1')
+        self.assertEqual(first.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        idempotency.get_cache().clear()
+        with self.assertNumQueries(1):
+            second = self.book('full-1')
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(second.json(), first.json())
+    
+    def test_invalid_keys(self):
+        """Test that reused and malformed keys are rejected."""
+        self.book('reused-1')
+        response = self.book('reused-1', {**self.data, 'client_email': 'other@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        response = self.book('x' * 256)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Booking.objects.filter(client_email='other@example.com').exists())
+    
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.05)
+    def test_in_flight_and_released_keys(self):
+        """Test retries while the first request runs, after a server error and after its lease."""
+        claim = idempotency.begin('flight-1', 'fingerprint')
+        self.assertIsInstance(claim, idempotency.Claim)
+        with self.assertRaises(idempotency.RequestInProgress):
+            idempotency.begin('flight-1', 'fingerprint')
+        
+        # Retries that outwait the timeout are told to come back
+        self.book('flight-2')
+        IdempotencyRecord.objects.filter(key='flight-2').update(
+            status_code=None, response=None, locked_until=timezone.now() + datetime.timedelta(minutes=1)
+        )
+        idempotency.get_cache().clear()
+        response = self.book('flight-2')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+        
+        # Server errors are not stored, so the retry runs again
+        with claim:
+            claim.complete(503, {'error': 'busy'})
+        self.assertIsInstance(idempotency.begin('flight-1', 'fingerprint'), idempotency.Claim)
+        
+        # A request that outlived its lease is taken over
+        IdempotencyRecord.objects.update(locked_until=timezone.now())
+        self.assertIsInstance(idempotency.begin('flight-1', 'fingerprint'), idempotency.Claim)
+    
+    def test_purge(self):
+        """Test that expired keys are purged."""
+        self.book('old-1')
+        self.book('new-1', {**self.data, 'client_email': 'new@example.com'})
+        IdempotencyRecord.objects.filter(key='old-1').update(expires_at=timezone.now())
+        
+        out = io.StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertEqual(list(IdempotencyRecord.objects.values_list('key', flat=True)), ['new-1'])
+
+
+class IdempotencyConcurrencyTests(TransactionTestCase):
+    """Test cases for retries that arrive while the first request is running."""
+    
+    def test_retry_waits_for_first_response(self):
+        """Test that an in-flight duplicate waits for the first result."""
+        idempotency.get_cache().clear()
+        claim = idempotency.begin('wait-1', 'fingerprint')
+        
+        results = []
+        
+        def retry():
+            try:
+                results.append(idempotency.begin('wait-1', 'fingerprint'))
+            finally:
+                connection.close()
+        
+        waiter = threading.Thread(target=retry)
+        waiter.start()
+        time.sleep(0.1)
+        with claim:
+            claim.complete(201, {'id': 1})
+        waiter.join(5)
+        
+        self.assertEqual(results, [{'fingerprint': 'fingerprint', 'status_code': 201, 'data': {'id': 1}}])
+    
+    def test_concurrent_requests_share_one_booking(self):
+        """Test that a duplicate request sent while the first is booking gets the first's response."""
+        idempotency.get_cache().clear()
+        fitness_class = FitnessClass.objects.create(
+            name="Morning Pilates",
+            class_type="PILATES",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Sophia Wilson",
+            total_slots=10,
+            available_slots=10
+        )
+        data = {'class_id': fitness_class.id, 'client_name': 'Jane Smith', 'client_email': 'jane@example.com'}
+        started = threading.Event()
+        
+        def slow_reserve(*args):
+            started.set()
+            time.sleep(0.2)
+            return reserve_slot(*args)
+        
+        responses = {}
+        
+        def book(name):
+            try:
+                responses[name] = APIClient().post('/api/book/', data, format='json', HTTP_IDEMPOTENCY_KEY='same-1')
+            finally:
+                connection.close()
+        
+        with unittest.mock.patch('booking_api.views.reserve_slot', side_effect=slow_reserve):
+            first = threading.Thread(target=book, args=('first',))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=book, args=('second',))
+            second.start()
+            first.join(5)
+            second.join(5)
+        
+        self.assertEqual(responses['first'].status_code, status.HTTP_201_CREATED)
+        self.assertEqual(responses['second'].status_code, status.HTTP_201_CREATED)
+        self.assertEqual(responses['second'].json(), responses['first'].json())
+        self.assertEqual(responses['second'][idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class ClassListPaginationTests(TestCase):
+    """Test cases for keyset pagination on the GET /classes endpoint."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        
+        # Two classes share a start time to exercise the id tie-breaker
+        start = timezone.now() + datetime.timedelta(days=1)
+        self.classes = [
+            FitnessClass.objects.create(
+                name=f"Class {i}",
+                class_type="YOGA",
+                datetime=start + datetime.timedelta(hours=i // 2),
+                instructor="John Doe"
+            )
+            for i in range(5)
+        ]
+    
+    def test_pages_cover_all_classes(self):
+        """Test that following the cursor returns every class exactly once."""
+        seen = []
+        params = {'page_size': 2}
+        
+        while True:
+            response = self.client.get('/api/classes/', params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in response.json())
+            
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                break
+            params['cursor'] = cursor
+        
+        self.assertEqual(seen, [c.id for c in self.classes])
+    
+    def test_fields_projection(self):
+        """Test that only the requested fields are returned."""
+        response = self.client.get('/api/classes/', {'fields': 'id,name'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.json()[0]), {'id', 'name'})
+        
+        response = self.client.get('/api/classes/', {'fields': 'id,created_at'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_invalid_parameters(self):
+        """Test that malformed cursors and page sizes are rejected."""
+        response = self.client.get('/api/classes/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get('/api/classes/', {'page_size': '0'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class ClassListFilterTests(TestCase):
+    """Test cases for the filters on the GET /classes endpoint."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        availability.clear()
+        self.addCleanup(availability.clear)
+        
+        self.start = timezone.now() + datetime.timedelta(days=1)
+        types = ['YOGA', 'HIIT', 'PILATES']
+        instructors = ['Jane Smith', 'John Doe']
+        self.classes = [
+            FitnessClass.objects.create(
+                name=f"Class {i}",
+                class_type=types[i % 3],
+                datetime=self.start + datetime.timedelta(days=i // 3),
+                instructor=instructors[i % 2],
+                total_slots=5,
+                available_slots=i % 3 and 5
+            )
+            for i in range(12)
+        ]
+    
+    def get_ids(self, params):
+        """Return the class ids listed for ``params`` with and without the index."""
+        results = []
+        for enabled in (True, False):
+            with override_settings(AVAILABILITY_INDEX_ENABLED=enabled):
+                classes_cache.invalidate()
+                response = self.client.get('/api/classes/', {'page_size': 100, **params})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                results.append([item['id'] for item in response.json()])
+        
+        self.assertEqual(results[0], results[1])
+        return results[0]
+    
+    def test_filters(self):
+        """Test each filter, alone and combined."""
+        day = (self.start + datetime.timedelta(days=1)).date()
+        cases = [
+            ({'class_type': 'HIIT'}, lambda c: c.class_type == 'HIIT'),
+            ({'instructor': 'John Doe'}, lambda c: c.instructor == 'John Doe'),
+            ({'has_slots': 'true'}, lambda c: c.available_slots > 0),
+            ({'has_slots': 'false'}, lambda c: True),
+            (
+                {'date_from': day.isoformat(), 'date_to': day.isoformat()},
+                lambda c: timezone.localtime(c.datetime).date() == day
+            ),
+            (
+                {'class_type': 'YOGA', 'instructor': 'Jane Smith', 'has_slots': '1'},
+                lambda c: c.class_type == 'YOGA' and c.instructor == 'Jane Smith' and c.available_slots > 0
+            ),
+        ]
+        for params, predicate in cases:
+            with self.subTest(params=params):
+                self.assertEqual(self.get_ids(params), [c.id for c in self.classes if predicate(c)])
+    
+    def test_filtered_pages(self):
+        """Test that the cursor keeps the filters of the first page."""
+        response = self.client.get('/api/classes/', {'class_type': 'PILATES', 'page_size': 2})
+        ids = [item['id'] for item in response.json()]
+        
+        response = self.client.get('/api/classes/', {'class_type': 'PILATES', 'page_size': 2, 'cursor': response['X-Next-Cursor']})
+        ids += [item['id'] for item in response.json()]
+        
+        self.assertEqual(ids, [c.id for c in self.classes if c.class_type == 'PILATES'])
+    
+    def test_invalid_filters(self):
+        """Test that malformed filters are rejected without a query."""
+        invalid = [
+            {'class_type': 'BOXING'},
+            {'instructor': ' '},
+            {'instructor': 'x' * 101},
+            {'date_from': 'tomorrow'},
+            {'date_to': '2024-02-30'},
+            {'date_from': '2024-05-02', 'date_to': '2024-05-01'},
+            {'has_slots': 'maybe'},
+        ]
+        for params in invalid:
+            with self.subTest(params=params):
+                with self.assertNumQueries(0):
+                    response = self.client.get('/api/classes/', params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Query plans are checked against SQLite")
+class QueryPlanTests(TestCase):
+    """Test that the hot query paths are served by indexes."""
+    
+    def test_upcoming_classes_use_datetime_index(self):
+        """Test the upcoming classes query plan."""
+        plan = FitnessClass.objects.filter(datetime__gt=timezone.now()).order_by('datetime').explain()
+        self.assertIn('fitnessclass_datetime_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_open_classes_use_partial_index(self):
+        """Test the upcoming classes with free slots query plan."""
+        plan = FitnessClass.objects.filter(
+            datetime__gt=timezone.now(), available_slots__gt=0
+        ).order_by('datetime').explain()
+        self.assertIn('fitnessclass_open_idx', plan)
+    
+    def test_filtered_classes_use_composite_indexes(self):
+        """Test the upcoming classes by type and by instructor query plans."""
+        upcoming = FitnessClass.objects.filter(datetime__gt=timezone.now()).order_by('datetime')
+        
+        plan = upcoming.filter(class_type='YOGA').explain()
+        self.assertIn('fitnessclass_type_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        
+        plan = upcoming.filter(instructor='John Doe').explain()
+        self.assertIn('fitnessclass_instructor_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_bookings_by_email_use_composite_index(self):
+        """Test the bookings by email query plan."""
+        plan = Booking.objects.filter(client_email='test@example.com').order_by('-booking_time').explain()
+        self.assertIn('booking_email_time_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class BookingListQueryTests(TestCase):
+    """Test cases for the query cost of the GET /bookings endpoint."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        
+        start = timezone.now() + datetime.timedelta(days=1)
+        for i in range(10):
+            fitness_class = FitnessClass.objects.create(
+                name=f"Class {i}",
+                class_type="PILATES",
+                datetime=start + datetime.timedelta(hours=i),
+                instructor="Jane Smith"
+            )
+            Booking.objects.create(
+                fitness_class=fitness_class,
+                client_name="Heavy User",
+                client_email="heavy@example.com"
+            )
+    
+    def test_constant_query_count(self):
+        """Test that listing bookings costs the same two queries regardless of count."""
+        # The summaries, and the slot counts of their classes
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/bookings/', {'email': 'heavy@example.com'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 10)
+    
+    def test_matches_model_serializer(self):
+        """Test that the flattened output matches BookingSerializer."""
+        bookings = Booking.objects.filter(client_email='heavy@example.com').order_by('-booking_time')
+        
+        expected = BookingSerializer(bookings, many=True).data
+        self.assertEqual(BookingListSerializer(bookings).data, expected)
+
+
+class WaitlistTests(TestCase):
+    """Test cases for the waitlist and booking cancellation."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        self.fitness_class = FitnessClass.objects.create(
+            name="Power Yoga",
+            class_type="YOGA",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Alice Johnson",
+            total_slots=1,
+            available_slots=1
+        )
+        self.booking = reserve_slot(self.fitness_class.id, 'Booked', 'booked@example.com')
+    
+    def _join(self, email):
+        return self.client.post('/api/waitlist/', {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Waiting',
+            'client_email': email
+        }, format='json')
+    
+    def _cancel(self, booking_id, email):
+        return self.client.post('/api/book/cancel/', {
+            'booking_id': booking_id,
+            'client_email': email
+        }, format='json')
+    
+    def test_join_waitlist(self):
+        """Test joining the waitlist of a full class in FIFO positions."""
+        response = self._join('first@example.com')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['position'], 1)
+        
+        self.assertEqual(self._join('second@example.com').json()['position'], 2)
+        
+        # Already waiting, already booked
+        self.assertEqual(self._join('first@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._join('booked@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_join_class_with_slots(self):
+        """Test that classes with free slots must be booked instead."""
+        self.fitness_class.available_slots = 1
+        self.fitness_class.total_slots = 2
+        self.fitness_class.save()
+        
+        response = self._join('first@example.com')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(WaitlistEntry.objects.count(), 0)
+    
+    def test_cancel_promotes_first_waiting(self):
+        """Test that a cancellation books the first client on the waitlist."""
+        self._join('first@example.com')
+        self._join('second@example.com')
+        
+        response = self._cancel(self.booking.id, 'booked@example.com')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['promoted']['client_email'], 'first@example.com')
+        self.assertEqual(
+            list(Booking.objects.values_list('client_email', flat=True)), ['first@example.com']
+        )
+        self.assertEqual(
+            list(WaitlistEntry.objects.values_list('client_email', flat=True)), ['second@example.com']
+        )
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertTrue(BookingSummary.objects.filter(client_email='first@example.com').exists())
+    
+    def test_cancel_skips_unpromotable_entries(self):
+        """Test that waiting clients who already hold a booking are skipped."""
+        self._join('holder@example.com')
+        self._join('next@example.com')
+        
+        # The first waiting client got a booking some other way meanwhile
+        Booking.objects.create(
+            fitness_class=self.fitness_class, client_name='Holder', client_email='holder@example.com'
+        )
+        
+        promoted = cancel_booking(self.booking.id, 'booked@example.com')
+        
+        self.assertEqual(promoted.client_email, 'next@example.com')
+        self.assertFalse(WaitlistEntry.objects.exists())
+    
+    def test_cancel_without_waitlist_frees_slot(self):
+        """Test that a cancellation with nobody waiting frees the slot."""
+        response = self._cancel(self.booking.id, 'booked@example.com')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.json()['promoted'])
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 1)
+        self.assertFalse(BookingSummary.objects.exists())
+    
+    def test_cancel_requires_matching_email(self):
+        """Test that a booking can only be cancelled with its email."""
+        self.assertEqual(
+            self._cancel(self.booking.id, 'someone@example.com').status_code, status.HTTP_404_NOT_FOUND
+        )
+        self.assertEqual(
+            self._cancel(self.booking.id + 100, 'booked@example.com').status_code, status.HTTP_404_NOT_FOUND
+        )
+        self.assertTrue(Booking.objects.filter(pk=self.booking.id).exists())
+
+
+class ListSink(outbox.Sink):
+    """Outbox sink that keeps messages in memory, failing for chosen booking ids."""
+    
+    def __init__(self, failing=()):
+        self.messages = []
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+    
+    def send(self, messages):
+        if any(message['payload']['booking_id'] in self.failing for message in messages):
+            raise ConnectionError("sink unavailable")
+        with self.lock:
+            self.messages.extend(messages)
+
+
+class OutboxTests(TestCase):
+    """Test cases for the booking outbox and its worker."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.fitness_class = FitnessClass.objects.create(
+            name="Power Yoga",
+            class_type="YOGA",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Jane Smith",
+            total_slots=5,
+            available_slots=5
+        )
+    
+    def book(self, count):
+        return [
+            reserve_slot(self.fitness_class.id, f'Client {i}', f'client{i}@example.com')
+            for i in range(count)
+        ]
+    
+    def worker(self, sink, **kwargs):
+        worker = outbox.OutboxWorker(sink=sink, **kwargs)
+        self.addCleanup(worker.close)
+        return worker
+    
+    def test_messages_written_with_bookings(self):
+        """Test that bookings and cancellations add messages in their transaction."""
+        booking, = self.book(1)
+        with self.assertRaises(AlreadyBooked):
+            reserve_slot(self.fitness_class.id, 'Client 0', 'client0@example.com')
+        
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.topic, outbox.BOOKING_CREATED)
+        self.assertEqual(message.payload['booking_id'], booking.id)
+        self.assertEqual(message.payload['source'], 'api')
+        
+        cancel_booking(booking.id, 'client0@example.com')
+        self.assertEqual(
+            list(OutboxMessage.objects.values_list('topic', flat=True)),
+            [outbox.BOOKING_CREATED, outbox.BOOKING_CANCELLED]
+        )
+    
+    def test_worker_delivers_in_batches(self):
+        """Test that the worker delivers every message once and deletes it."""
+        bookings = self.book(5)
+        sink = ListSink()
+        worker = self.worker(sink, batch_size=2, workers=2)
+        
+        self.assertEqual(worker.run(once=True), (5, 0))
+        self.assertEqual(
+            sorted(message['payload']['booking_id'] for message in sink.messages),
+            [booking.id for booking in bookings]
+        )
+        self.assertFalse(OutboxMessage.objects.exists())
+    
+    def test_failures_are_retried_with_backoff(self):
+        """Test that a failing message is retried later without holding back the others."""
+        bookings = self.book(3)
+        sink = ListSink(failing=[bookings[1].id])
+        worker = self.worker(sink, batch_size=10, workers=1, max_attempts=2)
+        
+        self.assertEqual(worker.run_once(), (2, 1))
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.available_at, timezone.now())
+        self.assertIn('sink unavailable', message.last_error)
+        
+        # Not due yet, then given up on after the last attempt
+        self.assertEqual(worker.run_once(), (0, 0))
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(worker.run_once(), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 2)
+        self.assertIsNotNone(message.failed_at)
+        self.assertEqual(worker.run_once(), (0, 0))
+    
+    def test_lost_slice_is_retried_in_full(self):
+        """Test that every message of a slice whose delivery raised is retried."""
+        self.book(3)
+        worker = self.worker(ListSink(), batch_size=10, workers=1)
+        
+        with unittest.mock.patch.object(outbox, 'deliver', side_effect=RuntimeError('worker died')):
+            self.assertEqual(worker.run_once(), (0, 3))
+        for message in OutboxMessage.objects.all():
+            self.assertEqual(message.attempts, 1)
+            self.assertGreater(message.available_at, timezone.now())
+            self.assertEqual(message.last_error, 'RuntimeError: worker died')
+    
+    def test_expired_claim_is_delivered_again(self):
+        """Test at-least-once delivery when a worker dies holding a claim."""
+        self.book(1)
+        token, messages = outbox.claim(10, lease=0)
+        self.assertEqual(len(messages), 1)
+        
+        # The lease has run out, so another worker claims the message
+        new_token, messages = outbox.claim(10)
+        self.assertEqual(messages[0]['attempts'], 2)
+        self.assertEqual(outbox.complete(token, [messages[0]['id']]), 0)
+        self.assertEqual(outbox.complete(new_token, [messages[0]['id']]), 1)
+    
+    def test_command_with_file_sink(self):
+        """Test the worker command delivering to a file."""
+        self.book(2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'outbox.ndjson')
+            call_command(
+                'run_outbox_worker', '--once', '--sink', 'booking_api.outbox.FileSink',
+                '--sink-option', f'path={path}', stderr=io.StringIO()
+            )
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        
+        self.assertEqual([line['topic'] for line in lines], [outbox.BOOKING_CREATED] * 2)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class BookingSummaryTests(TestCase):
+    """Test cases for the denormalized booking summaries."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        self.fitness_class = FitnessClass.objects.create(
+            name="Spin Session",
+            class_type="CYCLING",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Eva Brown",
+            total_slots=10,
+            available_slots=10
+        )
+        reserve_slot(self.fitness_class.id, 'Regular', 'regular@example.com')
+        reserve_slot(self.fitness_class.id, 'Other', 'other@example.com')
+    
+    def assertSummariesMatch(self, email):
+        """Assert that the summaries of ``email`` match the source tables."""
+        bookings = Booking.objects.filter(client_email=email).order_by('-booking_time')
+        summaries = BookingSummary.objects.filter(client_email=email).order_by('-booking_time')
+        self.assertEqual(BookingSummarySerializer(summaries).data, BookingSerializer(bookings, many=True).data)
+    
+    def test_maintained_on_booking(self):
+        """Test that new bookings update the summaries of the class."""
+        self.assertSummariesMatch('regular@example.com')
+        
+        summary = BookingSummary.objects.get(client_email='regular@example.com')
+        self.assertEqual(summary.class_name, "Spin Session")
+    
+    def test_booking_leaves_summaries_alone(self):
+        """Test that slot changes don't rewrite the summaries of the class."""
+        with CaptureQueriesContext(connection) as queries:
+            reserve_slot(self.fitness_class.id, 'Third', 'third@example.com')
+        
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('bookingsummary', updates[0])
+        self.assertSummariesMatch('regular@example.com')
+    
+    def test_maintained_on_class_change(self):
+        """Test that class saves and queryset updates reach the summaries."""
+        self.fitness_class.instructor = "Bob Williams"
+        self.fitness_class.save()
+        FitnessClass.objects.update(datetime=F('datetime') + datetime.timedelta(hours=1))
+        classes_changed.send(sender=FitnessClass, fields=['datetime'])
+        
+        self.assertSummariesMatch('regular@example.com')
+        self.assertSummariesMatch('other@example.com')
+    
+    def test_removed_with_booking(self):
+        """Test that deleting a booking or its class removes its summary."""
+        Booking.objects.filter(client_email='regular@example.com').delete()
+        self.assertFalse(BookingSummary.objects.filter(client_email='regular@example.com').exists())
+        
+        self.fitness_class.delete()
+        self.assertFalse(BookingSummary.objects.exists())
+    
+    def test_endpoint_single_lookup(self):
+        """Test that the endpoint reads the summaries with one indexed query, and slot counts with one more."""
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/bookings/', {'email': 'regular@example.com'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['class_details']['available_slots'], 8)
+        
+        plan = BookingSummary.objects.filter(client_email='x@example.com').order_by('-booking_time').explain()
+        self.assertIn('summary_email_time_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+    
+    def test_rebuild_command(self):
+        """Test rebuilding the summaries from scratch."""
+        BookingSummary.objects.all().delete()
+        out = io.StringIO()
+        
+        call_command('rebuild_booking_summaries', stdout=out)
+        
+        self.assertIn('Rebuilt 2 booking summaries', out.getvalue())
+        self.assertSummariesMatch('regular@example.com')
+
+
+class AvailabilityIndexTests(TestCase):
+    """Test cases for the in-memory availability index."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        availability.clear()
+        self.addCleanup(availability.clear)
+        
+        now = timezone.now()
+        types = ['YOGA', 'ZUMBA', 'HIIT']
+        instructors = ['Jane Smith', 'John Doe']
+        FitnessClass.objects.bulk_create([
+            FitnessClass(
+                name=f"Class {i}",
+                class_type=types[i % 3],
+                # Pairs of classes share a start time to exercise the id tie-break
+                datetime=now + datetime.timedelta(hours=i // 2 - 2),
+                instructor=instructors[i % 2],
+                total_slots=5,
+                available_slots=i % 4
+            )
+            for i in range(30)
+        ])
+        self.now = now
+    
+    def search_ids(self, index, **filters):
+        return [index.class_ids[position] for position in index.search(**filters)]
+    
+    def test_matches_database(self):
+        """Test that searches return the same classes as the equivalent queries."""
+        index = availability.get_index()
+        window = (self.now + datetime.timedelta(hours=2), self.now + datetime.timedelta(hours=8))
+        cases = [
+            ({}, {}),
+            ({'class_type': 'YOGA'}, {'class_type': 'YOGA'}),
+            ({'instructor': 'John Doe'}, {'instructor': 'John Doe'}),
+            ({'class_type': 'HIIT', 'instructor': 'Jane Smith'}, {'class_type': 'HIIT', 'instructor': 'Jane Smith'}),
+            ({'has_slots': True}, {'available_slots__gt': 0}),
+            ({'start': window[0], 'end': window[1]}, {'datetime__gte': window[0], 'datetime__lt': window[1]}),
+            ({'class_type': 'PILATES'}, {'class_type': 'PILATES'}),
+        ]
+        for filters, lookups in cases:
+            with self.subTest(filters=filters):
+                expected = list(
+                    FitnessClass.objects.filter(datetime__gt=self.now, **lookups)
+                    .order_by('datetime', 'id').values_list('id', flat=True)
+                )
+                self.assertEqual(self.search_ids(index, now=self.now, **filters), expected)
+    
+    def test_pages_match_database(self):
+        """Test that index pages and cursors match keyset pagination."""
+        index = availability.get_index()
+        fields = FitnessClassSerializer.Meta.fields
+        cursor = None
+        while True:
+            page, next_cursor = index.page(cursor, 4)
+            expected, expected_cursor = paginate_by_datetime(upcoming_classes(fields), cursor, 4)
+            self.assertEqual(
+                FitnessClassSerializer(page, many=True).data,
+                FitnessClassSerializer(expected, many=True).data
+            )
+            self.assertEqual(next_cursor, expected_cursor)
+            if not next_cursor:
+                break
+            cursor = next_cursor
+    
+    def test_listing_without_queries(self):
+        """Test that the listing is served from a warm index without queries."""
+        availability.get_index()
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/classes/?page_size=100')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), FitnessClass.objects.filter(datetime__gt=self.now).count())
+    
+    def test_booking_patches_slots(self):
+        """Test that booking a class patches its slot count in place."""
+        index = availability.get_index()
+        fitness_class = FitnessClass.objects.filter(datetime__gt=timezone.now(), available_slots=3).first()
+        reserve_slot(fitness_class.id, 'Regular', 'regular@example.com')
+        
+        with self.assertNumQueries(1):
+            self.assertIs(availability.get_index(), index)
+        self.assertEqual(index.available_slots[index.positions[fitness_class.id]], 2)
+    
+    def test_class_change_rebuilds(self):
+        """Test that other changes to classes rebuild the index."""
+        index = availability.get_index()
+        fitness_class = FitnessClass.objects.filter(datetime__gt=timezone.now()).first()
+        fitness_class.instructor = "Eva Brown"
+        fitness_class.save()
+        
+        rebuilt = availability.get_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(self.search_ids(rebuilt, instructor="Eva Brown"), [fitness_class.id])
+    
+    @override_settings(AVAILABILITY_CHECK_INTERVAL=0)
+    def test_version_check(self):
+        """Test that a change made by another process is picked up by the version check."""
+        index = availability.get_index()
+        self.assertIs(availability.get_index(), index)
+        
+        classes_cache.invalidate(availability.VERSION_KEY)
+        self.assertIsNot(availability.get_index(), index)
+    
+    @override_settings(AVAILABILITY_CHECK_INTERVAL=0)
+    def test_slot_changes_from_other_processes(self):
+        """Test that slot changes logged by another process are patched in without a rebuild."""
+        index = availability.get_index()
+        fitness_class = FitnessClass.objects.filter(datetime__gt=timezone.now(), available_slots=3).first()
+        position = index.positions[fitness_class.id]
+        
+        # Another process books the class and logs the change in the cache
+        FitnessClass.objects.filter(pk=fitness_class.pk).update(available_slots=2)
+        classes_cache.publish_slot_changes([fitness_class.id])
+        self.assertIs(availability.get_index(), index)
+        self.assertEqual(index.available_slots[position], 2)
+        
+        # When the log no longer covers the missed changes, every count is reloaded
+        FitnessClass.objects.filter(pk=fitness_class.pk).update(available_slots=1)
+        sequence = classes_cache.get_slot_sequence()
+        classes_cache.get_cache().set(classes_cache.SLOTS_SEQUENCE_KEY, sequence + classes_cache.SLOTS_LOG_WINDOW + 1)
+        self.assertIs(availability.get_index(), index)
+        self.assertEqual(index.available_slots[position], 1)
+    
+    def test_shared_cache_check(self):
+        """Test that deployments are told to share the cache the index follows other processes through."""
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        
+        with override_settings(CACHES=local):
+            self.assertEqual([error.id for error in check_shared_caches(None)], ['booking_api.E001'])
+            with override_settings(AVAILABILITY_INDEX_ENABLED=False):
+                self.assertEqual([error.id for error in check_shared_caches(None)], ['booking_api.W001'])
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_caches(None), [])
+    
+    def test_naive_cursor_rejected(self):
+        """Test that a cursor without an offset is a 400 from the index and the database alike."""
+        cursor = base64.urlsafe_b64encode(b'["2030-01-01T00:00:00",1]').decode()
+        self.assertIsNotNone(availability.get_index())
+        response = self.client.get('/api/classes/', {'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        with override_settings(AVAILABILITY_INDEX_ENABLED=False):
+            response = self.client.get('/api/classes/', {'cursor': cursor, 'page_size': 7})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_falls_back_to_database(self):
+        """Test that the listing uses the database when the index is unavailable."""
+        with override_settings(AVAILABILITY_INDEX_ENABLED=False):
+            self.assertIsNone(availability.get_index())
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/classes/?page_size=100')
+            self.assertEqual(len(response.json()), FitnessClass.objects.filter(datetime__gt=self.now).count())
+        
+        # A reader that finds another thread rebuilding does not wait for it
+        availability._holder.lock.acquire()
+        try:
+            self.assertIsNone(availability.get_index())
+        finally:
+            availability._holder.lock.release()
+
+
+@override_settings(EXPORT_TOKEN='export-secret')
+class ExportTests(TestCase):
+    """Test cases for the streaming exports."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer export-secret')
+        self.fitness_class = FitnessClass.objects.create(
+            name="Core Pilates",
+            class_type="PILATES",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Sophia Wilson",
+            total_slots=10,
+            available_slots=10
+        )
+        for i in range(5):
+            reserve_slot(self.fitness_class.id, f'Client {i}', f'client{i}@example.com')
+    
+    def test_requires_staff_or_token(self):
+        """Test that anonymous clients and wrong tokens can't export client details."""
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/api/export/bookings/').status_code, status.HTTP_403_FORBIDDEN)
+        anonymous.credentials(HTTP_AUTHORIZATION='Bearer guess')
+        self.assertEqual(anonymous.get('/api/export/bookings/').status_code, status.HTTP_403_FORBIDDEN)
+        
+        with override_settings(ROOT_URLCONF=AsyncURLConf):
+            self.assertEqual(APIClient().get('/api/export/bookings/').status_code, status.HTTP_403_FORBIDDEN)
+        
+        staff = APIClient()
+        staff.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(staff.get('/api/export/classes/').status_code, status.HTTP_200_OK)
+    
+    def test_ndjson_export(self):
+        """Test streaming bookings as NDJSON in chunks."""
+        response = self.client.get('/api/export/bookings/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        expected = BookingSerializer(Booking.objects.order_by('booking_time', 'pk'), many=True).data
+        self.assertEqual(
+            rows,
+            [{key: booking[key] for key in rows[0]} for booking in expected]
+        )
+    
+    def test_csv_export(self):
+        """Test streaming classes as CSV."""
+        response = self.client.get('/api/export/classes/', {'format': 'csv'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'name', 'class_type'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Core Pilates', lines[1])
+    
+    def test_incremental_export(self):
+        """Test that since= returns only rows written after a previous export, overlapping it a little."""
+        Booking.objects.update(booking_time=timezone.now() - datetime.timedelta(hours=1))
+        response = self.client.get('/api/export/bookings/')
+        b''.join(response.streaming_content)
+        until = response['X-Export-Until']
+        
+        # A booking whose transaction started before the export but committed after it
+        slow = reserve_slot(self.fitness_class.id, 'Slow Client', 'slow@example.com')
+        Booking.objects.filter(pk=slow.pk).update(booking_time=timezone.now() - datetime.timedelta(seconds=1))
+        reserve_slot(self.fitness_class.id, 'Late Client', 'late@example.com')
+        
+        response = self.client.get('/api/export/bookings/', {'since': until})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['client_email'] for row in rows], ['slow@example.com', 'late@example.com'])
+    
+    def test_chunked_iteration(self):
+        """Test that rows are encoded a chunk at a time."""
+        chunks = list(exports.stream_export('bookings', chunk_size=2))
+        
+        # Header, then chunks of 2, 2 and 1 rows
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [0, 2, 2, 1])
+    
+    def test_invalid_parameters(self):
+        """Test that unknown exports and invalid parameters are rejected."""
+        self.assertEqual(self.client.get('/api/export/users/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            self.client.get('/api/export/bookings/', {'format': 'xml'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get('/api/export/bookings/', {'since': 'yesterday'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+    
+    def test_export_command(self):
+        """Test the export_data management command."""
+        out = io.StringIO()
+        
+        call_command('export_data', 'bookings', '--format', 'csv', stdout=out, stderr=io.StringIO())
+        
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'id,fitness_class,client_name,client_email,booking_time')
+        self.assertEqual(len(lines), 6)
+
+
+class TimezoneRenderingTests(TestCase):
+    """Test cases for rendering datetimes in the client's timezone."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        availability.clear()
+        self.addCleanup(availability.clear)
+        
+        self.fitness_class = FitnessClass.objects.create(
+            name="Evening Zumba",
+            class_type="ZUMBA",
+            datetime=datetime.datetime(2030, 1, 15, 18, 0, tzinfo=datetime.timezone.utc),
+            instructor="Jane Smith"
+        )
+        reserve_slot(self.fitness_class.id, 'Regular', 'regular@example.com')
+    
+    def test_query_parameter_and_header(self):
+        """Test that tz and Accept-Timezone choose the rendering timezone, per request."""
+        response = self.client.get('/api/classes/', {'tz': 'America/New_York'})
+        self.assertEqual(response.json()[0]['datetime'], '2030-01-15T13:00:00-05:00')
+        
+        # Cached pages are kept apart per timezone
+        response = self.client.get('/api/classes/', HTTP_ACCEPT_TIMEZONE='Asia/Tokyo')
+        self.assertEqual(response.json()[0]['datetime'], '2030-01-16T03:00:00+09:00')
+        self.assertIn('Accept-Timezone', response['Vary'])
+        
+        response = self.client.get('/api/classes/')
+        self.assertEqual(response.json()[0]['datetime'], '2030-01-15T23:30:00+05:30')
+        
+        response = self.client.get('/api/bookings/', {'email': 'regular@example.com', 'tz': 'Europe/London'})
+        self.assertEqual(response.json()[0]['class_details']['datetime'], '2030-01-15T18:00:00Z')
+        booking_time = datetime.datetime.fromisoformat(response.json()[0]['booking_time'].replace('Z', '+00:00'))
+        london = timezones.get_timezone('Europe/London')
+        self.assertEqual(booking_time.utcoffset(), booking_time.astimezone(london).utcoffset())
+    
+    def test_date_filters_use_request_timezone(self):
+        """Test that bare dates in filters are days in the requested timezone."""
+        params = {'date_from': '2030-01-16', 'date_to': '2030-01-16'}
+        
+        response = self.client.get('/api/classes/', {**params, 'tz': 'Asia/Tokyo'})
+        self.assertEqual(len(response.json()), 1)
+        
+        response = self.client.get('/api/classes/', {**params, 'tz': 'America/New_York'})
+        self.assertEqual(response.json(), [])
+    
+    def test_timezone_lookup(self):
+        """Test that zones are validated and cached."""
+        self.assertTrue(timezones.is_valid_timezone('Asia/Kolkata'))
+        self.assertFalse(timezones.is_valid_timezone('Mars/Olympus_Mons'))
+        self.assertIs(timezones.get_timezone('Asia/Kolkata'), timezones.get_timezone('Asia/Kolkata'))
+        with self.assertRaises(ValueError):
+            timezones.get_timezone('Mars/Olympus_Mons')
+    
+    def test_invalid_timezone(self):
+        """Test that unknown timezones are rejected."""
+        response = self.client.get('/api/classes/', {'tz': 'Mars/Olympus_Mons'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.post('/api/timezone/', {'timezone': 'Mars/Olympus_Mons'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.get('/api/bookings/', {'email': 'regular@example.com'}, HTTP_ACCEPT_TIMEZONE='Nowhere')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_preference_does_not_write(self):
+        """Test that setting a timezone stores a cookie without touching the database."""
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/timezone/', {'timezone': 'America/New_York'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'timezone': 'America/New_York'})
+        self.assertEqual(response.cookies['timezone'].value, 'America/New_York')
+        
+        # The stored datetime is untouched, and later requests use the preference
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.datetime, datetime.datetime(2030, 1, 15, 18, 0, tzinfo=datetime.timezone.utc))
+        response = self.client.get('/api/classes/')
+        self.assertEqual(response.json()[0]['datetime'], '2030-01-15T13:00:00-05:00')
+
+
+class ClassListCacheTests(TestCase):
+    """Test cases for the cached GET /classes endpoint."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        classes_cache.get_cache().clear()
+        
+        self.fitness_class = FitnessClass.objects.create(
+            name="Zumba Dance",
+            class_type="ZUMBA",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Eva Brown",
+            total_slots=10,
+            available_slots=10
+        )
+    
+    def test_cached_response(self):
+        """Test that a repeated request is served without queries."""
+        first = self.client.get('/api/classes/')
+        
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/classes/')
+        
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+    
+    def test_if_none_match(self):
+        """Test that a matching ETag returns 304 without queries."""
+        etag = self.client.get('/api/classes/')['ETag']
+        
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/classes/', HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_invalidated_by_writes(self):
+        """Test that saves, bookings and queryset updates invalidate the cache."""
+        etag = self.client.get('/api/classes/')['ETag']
+        
+        reserve_slot(self.fitness_class.id, 'New User', 'new@example.com')
+        response = self.client.get('/api/classes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['available_slots'], 9)
+        
+        etag = response['ETag']
+        self.fitness_class.refresh_from_db()
+        self.fitness_class.instructor = "Sophia Wilson"
+        self.fitness_class.save()
+        response = self.client.get('/api/classes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()[0]['instructor'], "Sophia Wilson")
+        
+        etag = response['ETag']
+        FitnessClass.objects.update(datetime=F('datetime') + datetime.timedelta(hours=1))
+        classes_changed.send(sender=FitnessClass, fields=['datetime'])
+        response = self.client.get('/api/classes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_bookings_patch_slots(self):
+        """Test that bookings patch slot counts into cached pages instead of invalidating them."""
+        other = FitnessClass.objects.create(
+            name="Morning Yoga",
+            class_type="YOGA",
+            datetime=timezone.now() + datetime.timedelta(days=2),
+            instructor="Jane Smith",
+            total_slots=10,
+            available_slots=10
+        )
+        version = classes_cache.get_version()
+        etag = self.client.get('/api/classes/?class_type=ZUMBA')['ETag']
+        
+        # Booking a class that isn't on the page leaves it untouched
+        reserve_slot(other.id, 'New User', 'new@example.com')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/classes/?class_type=ZUMBA', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        # Booking a class on the page patches its count with one query
+        reserve_slot(self.fitness_class.id, 'New User', 'new@example.com')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/classes/?class_type=ZUMBA', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['available_slots'], 9)
+        self.assertNotEqual(response['ETag'], etag)
+        
+        with self.assertNumQueries(0):
+            self.client.get('/api/classes/?class_type=ZUMBA')
+        self.assertEqual(classes_cache.get_version(), version)
+    
+    def test_has_slots_pages_rendered_again(self):
+        """Test that pages filtered on has_slots are rendered again after slot changes."""
+        self.client.get('/api/classes/?has_slots=true')
+        FitnessClass.objects.filter(pk=self.fitness_class.pk).update(available_slots=0)
+        classes_changed.send(sender=FitnessClass, class_ids=[self.fitness_class.id], fields=['available_slots'])
+        
+        response = self.client.get('/api/classes/?has_slots=true')
+        self.assertEqual(response.json(), [])
+    
+    def test_timeout_ends_when_first_class_starts(self):
+        """Test that pages are not cached past the start of their first class."""
+        soon = timezone.now() + datetime.timedelta(seconds=30)
+        self.assertLessEqual(classes_cache.entry_timeout(soon), 30)
+        self.assertEqual(classes_cache.entry_timeout(soon, timeout=5), 5)
+        self.assertEqual(classes_cache.entry_timeout(timezone.now() - datetime.timedelta(seconds=1)), 0)
+        self.assertEqual(classes_cache.entry_timeout(None), classes_cache.get_timeout())
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], AVAILABILITY_INDEX_ENABLED=False)
+class ReadReplicaTests(TransactionTestCase):
+    """Test cases for routing the listing endpoints to a read replica."""
+    
+    def setUp(self):
+        """Set up test data and a replica in a temporary SQLite file."""
+        self.client = APIClient()
+        classes_cache.get_cache().clear()
+        
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        connections.settings['replica1'] = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(tmpdir.name, 'replica.sqlite3'),
+        }
+        self.addCleanup(self.remove_replica)
+        
+        self.fitness_class = FitnessClass.objects.create(
+            name="Yoga Basics",
+            class_type="YOGA",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="John Doe",
+            total_slots=10,
+            available_slots=10
+        )
+        self.sync()
+    
+    def remove_replica(self):
+        connections['replica1'].close()
+        del connections['replica1']
+        del connections.settings['replica1']
+    
+    def sync(self):
+        call_command('sync_replicas', stdout=io.StringIO())
+    
+    def test_router(self):
+        """Test that only reads inside replica_reads() go to the replica."""
+        request = RequestFactory().get('/api/classes/')
+        self.assertEqual(router.db_for_read(FitnessClass), 'default')
+        
+        with routing.replica_reads(request) as alias:
+            self.assertEqual(alias, 'replica1')
+            self.assertEqual(router.db_for_read(FitnessClass), 'replica1')
+            self.assertEqual(router.db_for_write(FitnessClass), 'default')
+        self.assertEqual(router.db_for_read(FitnessClass), 'default')
+        
+        request.COOKIES[routing.PIN_COOKIE] = '1'
+        with routing.replica_reads(request) as alias:
+            self.assertIsNone(alias)
+            self.assertEqual(router.db_for_read(FitnessClass), 'default')
+    
+    async def test_async_router(self):
+        """Test that areplica_reads() routes like replica_reads() and looks pins up asynchronously."""
+        request = RequestFactory().get('/api/bookings/')
+        async with routing.areplica_reads(request, 'jane@example.com') as alias:
+            self.assertEqual(alias, 'replica1')
+            self.assertEqual(router.db_for_read(FitnessClass), 'replica1')
+        self.assertEqual(router.db_for_read(FitnessClass), 'default')
+        
+        await routing.apin_to_primary(HttpResponse(), ['jane@example.com'])
+        self.assertTrue(await routing.ais_pinned(request, 'jane@example.com'))
+        async with routing.areplica_reads(request, 'jane@example.com') as alias:
+            self.assertIsNone(alias)
+            self.assertEqual(router.db_for_read(FitnessClass), 'default')
+    
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'pins': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'},
+        },
+        DATABASE_REPLICA_PIN_CACHE_ALIAS='pins',
+    )
+    def test_pin_cache_check(self):
+        """Test that deployments with replicas are told to pin clients through a shared cache."""
+        self.assertEqual(check_replica_pin_cache(None), [])
+        with override_settings(DATABASE_REPLICA_PIN_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in check_replica_pin_cache(None)], ['booking_api.E002'])
+            with override_settings(DATABASE_REPLICAS=[]):
+                self.assertEqual(check_replica_pin_cache(None), [])
+    
+    def test_listings_read_from_replica(self):
+        """Test that the listings show the replica until it is synced."""
+        reserve_slot(self.fitness_class.id, 'Jane Smith', 'jane@example.com')
+        
+        response = self.client.get('/api/classes/')
+        self.assertEqual(response.json()[0]['available_slots'], 10)
+        self.assertEqual(self.client.get('/api/bookings/', {'email': 'jane@example.com'}).json(), [])
+        
+        self.sync()
+        classes_cache.get_cache().clear()
+        response = self.client.get('/api/classes/')
+        self.assertEqual(response.json()[0]['available_slots'], 9)
+        self.assertEqual(len(self.client.get('/api/bookings/', {'email': 'jane@example.com'}).json()), 1)
+    
+    def test_reads_own_writes_after_booking(self):
+        """Test that a client that just booked reads from the primary."""
+        response = self.client.post('/api/book/', {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Jane Smith',
+            'client_email': 'jane@example.com'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(routing.PIN_COOKIE, response.cookies)
+        
+        # The cookie pins the client that booked
+        self.assertEqual(self.client.get('/api/classes/').json()[0]['available_slots'], 9)
+        
+        # The email pins its bookings for clients without the cookie
+        other = APIClient()
+        self.assertEqual(len(other.get('/api/bookings/', {'email': 'jane@example.com'}).json()), 1)
+        
+        # Everyone else reads the replica
+        response = other.get('/api/classes/', {'page_size': 5})
+        self.assertEqual(response.json()[0]['available_slots'], 10)
+    
+    def test_sync_replicas_requires_replicas(self):
+        """Test that sync_replicas fails without configured replicas."""
+        with override_settings(DATABASE_REPLICAS=[]):
+            with self.assertRaises(CommandError):
+                call_command('sync_replicas')
+
+
+class AsyncURLConf:
+    """URL configuration that routes the API to the async views."""
+    
+    urlpatterns = [path('api/', include(get_urlpatterns(use_async=True)))]
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTests(TestCase):
+    """Test cases for the async API views."""
+    
+    def setUp(self):
+        """Set up test data."""
+        classes_cache.get_cache().clear()
+        
+        self.future_class = FitnessClass.objects.create(
+            name="Power Yoga",
+            class_type="YOGA",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Alice Johnson",
+            total_slots=5,
+            available_slots=5
+        )
+    
+    async def test_get_classes(self):
+        """Test the async GET /classes endpoint."""
+        response = await self.async_client.get('/api/classes/', {'fields': 'id,name'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [{'id': self.future_class.id, 'name': "Power Yoga"}])
+    
+    async def test_create_and_list_bookings(self):
+        """Test the async POST /book and GET /bookings endpoints."""
+        payload = {
+            'class_id': self.future_class.id,
+            'client_name': 'New User',
+            'client_email': 'new@example.com'
+        }
+        response = await self.async_client.post('/api/book/', payload, content_type='application/json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['class_details']['available_slots'], 4)
+        
+        response = await self.async_client.post('/api/book/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = await self.async_client.get('/api/bookings/', {'email': 'new@example.com'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 1)
+        
+        response = await self.async_client.get('/api/bookings/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    async def test_booking_idempotency(self):
+        """Test that the async booking view replays responses and doesn't wait for running requests."""
+        await sync_to_async(idempotency.get_cache().clear)()
+        payload = {
+            'class_id': self.future_class.id,
+            'client_name': 'New User',
+            'client_email': 'new@example.com'
+        }
+        
+        async def book(key):
+            return await self.async_client.post(
+                '/api/book/', payload, content_type='application/json', headers={'Idempotency-Key': key}
+            )
+        
+        first = await book('async-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        second = await book('async-1')
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(await Booking.objects.acount(), 1)
+        
+        # A retry of a request still running after the wait gets a 409
+        with override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.1):
+            request = RequestFactory().post('/api/book/', payload, content_type='application/json')
+            claim = await idempotency.abegin('async-2', idempotency.fingerprint(request))
+            async with claim:
+                response = await book('async-2')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+    
+    async def test_booking_admission(self):
+        """Test that the async booking view goes through admission control."""
+        admission.clear()
+        self.addCleanup(admission.clear)
+        metrics.registry.clear()
+        await FitnessClass.objects.filter(pk=self.future_class.id).aupdate(available_slots=1)
+        
+        async def book(email):
+            return await self.async_client.post('/api/book/', {
+                'class_id': self.future_class.id,
+                'client_name': 'Client',
+                'client_email': email
+            }, content_type='application/json')
+        
+        self.assertEqual((await book('one@example.com')).status_code, status.HTTP_201_CREATED)
+        response = await book('two@example.com')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['error'], "No available slots for this class")
+        self.assertIn(
+            'booking_admission_decisions_total{decision="sold_out"} 1', metrics.registry.render()
+        )
+        
+        # A request beyond the writer bound is turned away once it has queued
+        admission.clear()
+        with override_settings(ADMISSION_MAX_WRITERS=1, ADMISSION_QUEUE_TIMEOUT=0.05):
+            async with await admission.aadmit(self.future_class.id):
+                response = await book('three@example.com')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class SeedDataTests(TestCase):
+    """Test cases for the seed_data management command."""
+    
+    def test_bulk_seed(self):
+        """Test that seeded bookings match each class's available slots."""
+        call_command('seed_data', classes=20, bookings_per_class=12, seed=1, batch_size=7, stdout=io.StringIO())
+        
+        self.assertEqual(FitnessClass.objects.count(), 20)
+        for fitness_class in FitnessClass.objects.annotate(booked=Count('bookings')):
+            self.assertEqual(fitness_class.booked, min(12, fitness_class.total_slots))
+            self.assertEqual(fitness_class.available_slots, fitness_class.total_slots - fitness_class.booked)
+    
+    def test_batch_size_must_be_positive(self):
+        """Test that a batch size below 1 is rejected before anything is deleted."""
+        with self.assertRaises(CommandError):
+            call_command('seed_data', '--batch-size', '0', stdout=io.StringIO())
+    
+    def test_seed_is_reproducible(self):
+        """Test that the same seed produces the same dataset."""
+        def snapshot():
+            call_command('seed_data', classes=5, seed=42, stdout=io.StringIO())
+            return list(Booking.objects.order_by('fitness_class__datetime', 'client_email').values_list(
+                'fitness_class__name', 'client_email'
+            ))
+        
+        self.assertEqual(snapshot(), snapshot())
+
+
+class BatchBookingTests(TestCase):
+    """Test cases for the POST /book/batch endpoint."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        
+        self.fitness_class = FitnessClass.objects.create(
+            name="Spin Session",
+            class_type="CYCLING",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="Ethan Taylor",
+            total_slots=3,
+            available_slots=3
+        )
+        self.other_class = FitnessClass.objects.create(
+            name="Core Pilates",
+            class_type="PILATES",
+            datetime=timezone.now() + datetime.timedelta(days=2),
+            instructor="Eva Brown",
+            total_slots=10,
+            available_slots=10
+        )
+    
+    def _items(self, fitness_class, count, start=0):
+        return [
+            {
+                'class_id': fitness_class.id,
+                'client_name': f'Employee {i}',
+                'client_email': f'employee{i}@example.com'
+            }
+            for i in range(start, start + count)
+        ]
+    
+    def test_batch_booking(self):
+        """Test booking several classes in one request with a constant number of queries."""
+        items = self._items(self.fitness_class, 3) + self._items(self.other_class, 5)
+        
+        # Classes, existing bookings, savepoint, two decrements, insert, release,
+        # one INSERT for the booking summaries and one INSERT into the outbox
+        with self.assertNumQueries(9):
+            response = self.client.post('/api/book/batch/', {'bookings': items}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['booked'], 8)
+        self.fitness_class.refresh_from_db()
+        self.other_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertEqual(self.other_class.available_slots, 5)
+    
+    def test_all_or_nothing(self):
+        """Test that one failing booking aborts the whole batch."""
+        items = self._items(self.other_class, 2) + self._items(self.fitness_class, 4)
+        
+        response = self.client.post('/api/book/batch/', {'bookings': items}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['booked'], 0)
+        self.assertEqual(Booking.objects.count(), 0)
+        self.other_class.refresh_from_db()
+        self.assertEqual(self.other_class.available_slots, 10)
+    
+    def test_best_effort(self):
+        """Test that best-effort mode books whatever it can."""
+        Booking.objects.create(
+            fitness_class=self.other_class,
+            client_name='Employee 0',
+            client_email='employee0@example.com'
+        )
+        items = self._items(self.fitness_class, 4) + self._items(self.other_class, 2)
+        
+        response = self.client.post(
+            '/api/book/batch/', {'bookings': items, 'mode': 'best_effort'}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['booked', 'booked', 'booked', 'failed', 'failed', 'booked'])
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+    
+    def test_best_effort_concurrent_duplicate(self):
+        """Test that a client booked concurrently fails alone, without failing the rest of the class."""
+        Booking.objects.create(
+            fitness_class=self.other_class,
+            client_name='Employee 1',
+            client_email='employee1@example.com'
+        )
+        items = self._items(self.other_class, 3)
+        
+        # The booking above is missed by the existing bookings check, as if
+        # it was made after the check ran
+        filter_bookings = Booking.objects.filter
+        calls = []
+        
+        def miss_existing(*args, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                return Booking.objects.none()
+            return filter_bookings(*args, **kwargs)
+        
+        with unittest.mock.patch.object(Booking.objects, 'filter', miss_existing):
+            results = reserve_batch(items, all_or_nothing=False)
+        
+        self.assertIsInstance(results[0], Booking)
+        self.assertIsInstance(results[1], AlreadyBooked)
+        self.assertIsInstance(results[2], Booking)
+        self.other_class.refresh_from_db()
+        self.assertEqual(self.other_class.available_slots, 8)
+        self.assertEqual(Booking.objects.filter(fitness_class=self.other_class).count(), 3)
+    
+    def test_invalid_batch(self):
+        """Test that malformed batches are rejected."""
+        response = self.client.post('/api/book/batch/', {'bookings': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        
+        response = self.client.post(
+            '/api/book/batch/', {'bookings': self._items(self.fitness_class, 1), 'mode': 'some'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "SQLite connection tuning")
+class SQLiteTuningTests(TestCase):
+    """Test cases for the SQLite connection_created hook."""
+    
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -4000})
+    def test_pragmas_applied(self):
+        """Test that SQLITE_PRAGMAS is applied to a new connection."""
+        configure_sqlite_connection(sender=connection.__class__, connection=connection)
+        
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -4000)
+
+
+class LoadTestHelperTests(TestCase):
+    """Test cases for the load test statistics helpers."""
+    
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+    
+    def test_summarize(self):
+        """Test the result summary."""
+        result = summarize([0.01, 0.02, 0.03, 0.04], 0.5, [200, 200, 201, 400], queries=10)
+        
+        self.assertEqual(result['throughput_rps'], 8.0)
+        self.assertEqual(result['p50_ms'], 20.0)
+        self.assertEqual(result['queries_per_request'], 2.5)
+        self.assertEqual(result['statuses'], {'200': 2, '201': 1, '400': 1})
+
+
+class RequestMetricsTests(TestCase):
+    """Test cases for the request metrics middleware and endpoint."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        self.fitness_class = FitnessClass.objects.create(
+            name="Metrics Yoga",
+            class_type="YOGA",
+            datetime=timezone.now() + datetime.timedelta(days=1),
+            instructor="John Doe",
+            total_slots=5,
+            available_slots=5
+        )
+        metrics.registry.clear()
+    
+    def test_server_timing_header(self):
+        """Test that responses carry the total, db and stage timings."""
+        response = self.client.post('/api/book/', {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Test Client',
+            'client_email': 'test@example.com'
+        }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        names = [entry.strip().split(';')[0] for entry in response['Server-Timing'].split(',')]
+        self.assertEqual(names, ['total', 'db', 'admit', 'validate', 'reserve', 'serialize'])
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+    
+    def test_metrics_endpoint(self):
+        """Test that requests are exported in Prometheus text format."""
+        self.client.get('/api/classes/')
+        
+        response = self.client.get('/api/metrics/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE booking_http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'booking_http_request_duration_seconds_count{method="GET",status="200",view="classes-list"} 1',
+            body
+        )
+        self.assertIn('booking_stage_db_queries_bucket{stage="query",view="classes-list",le="+Inf"} 1', body)
+    
+    def test_histogram_buckets(self):
+        """Test that histogram buckets are rendered cumulatively."""
+        registry = metrics.Registry()
+        registry.define('test_seconds', 'Test histogram.', (0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            registry.observe('test_seconds', (('view', 'x'),), value)
+        
+        body = registry.render()
+        
+        self.assertIn('test_seconds_bucket{view="x",le="0.1"} 1', body)
+        self.assertIn('test_seconds_bucket{view="x",le="1.0"} 2', body)
+        self.assertIn('test_seconds_bucket{view="x",le="+Inf"} 3', body)
+        self.assertIn('test_seconds_count{view="x"} 3', body)
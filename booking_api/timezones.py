@@ -0,0 +1,61 @@
+"""
+Timezone conversion helpers for the fitness booking API.
+
+Zones come from the standard library's ``zoneinfo``. Names are validated
+against a set built once at import, and ``ZoneInfo`` objects are cached.
+Stored datetimes are never converted: responses are rendered in the
+timezone each request asks for.
+"""
+import functools
+import zoneinfo
+
+from django.utils import timezone
+
+
+# Where clients ask for the timezone responses are rendered in, in order of
+# precedence: query parameter, request header, then the preference cookie
+# set by POST /api/timezone/
+TIMEZONE_PARAM = 'tz'
+TIMEZONE_HEADER = 'Accept-Timezone'
+TIMEZONE_COOKIE = 'timezone'
+TIMEZONE_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Set for O(1) membership tests
+VALID_TIMEZONES = frozenset(zoneinfo.available_timezones())
+
+
+def is_valid_timezone(name):
+    """Check whether ``name`` is a known IANA timezone."""
+    return name in VALID_TIMEZONES
+
+
+@functools.lru_cache(maxsize=64)
+def get_timezone(name):
+    """
+    Return the ``ZoneInfo`` for ``name``.
+
+    Raises ``ValueError`` for unknown names.
+    """
+    if name not in VALID_TIMEZONES:
+        raise ValueError(f"Invalid timezone: {name}")
+    return zoneinfo.ZoneInfo(name)
+
+
+def get_current_timezone():
+    """Return the ``ZoneInfo`` of Django's current timezone."""
+    return get_timezone(timezone.get_current_timezone_name())
+
+
+def get_request_timezone(request):
+    """
+    Return the ``ZoneInfo`` a request asked to have datetimes rendered in.
+
+    Falls back to the current timezone. Raises ``ValueError`` for unknown
+    names.
+    """
+    name = (
+        request.GET.get(TIMEZONE_PARAM)
+        or request.headers.get(TIMEZONE_HEADER)
+        or request.COOKIES.get(TIMEZONE_COOKIE)
+    )
+    return get_timezone(name.strip()) if name else get_current_timezone()
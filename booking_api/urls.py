@@ -1,17 +1,51 @@
 """
 URL patterns for the booking API.
 """
+from django.conf import settings
 from django.urls import path
 from .views import (
     FitnessClassListView, 
     BookingCreateView, 
+    BatchBookingCreateView,
+    BookingCancelView,
+    WaitlistCreateView,
     BookingListView,
-    TimezoneUpdateView
+    TimezoneUpdateView,
+    metrics_view,
+    export_view
 )
+from .async_views import (
+    AsyncFitnessClassListView,
+    AsyncBookingCreateView,
+    AsyncBookingListView,
+    AsyncExportView
+)
+
+
+def get_urlpatterns(use_async=False):
+    """Return the API URL patterns, using the async views if requested."""
+    if use_async:
+        classes_view, create_view, list_view = (
+            AsyncFitnessClassListView, AsyncBookingCreateView, AsyncBookingListView
+        )
+        export = AsyncExportView.as_view()
+    else:
+        classes_view, create_view, list_view = (
+            FitnessClassListView, BookingCreateView, BookingListView
+        )
+        export = export_view
+    
+    return [
+        path('classes/', classes_view.as_view(), name='classes-list'),
+        path('book/', create_view.as_view(), name='booking-create'),
+        path('book/batch/', BatchBookingCreateView.as_view(), name='booking-batch-create'),
+        path('book/cancel/', BookingCancelView.as_view(), name='booking-cancel'),
+        path('waitlist/', WaitlistCreateView.as_view(), name='waitlist-create'),
+        path('bookings/', list_view.as_view(), name='bookings-list'),
+        path('timezone/', TimezoneUpdateView.as_view(), name='timezone-update'),
+        path('metrics/', metrics_view, name='metrics'),
+        path('export/<slug:resource>/', export, name='export'),
+    ]
+
 
-urlpatterns = [
-    path('classes/', FitnessClassListView.as_view(), name='classes-list'),
-    path('book/', BookingCreateView.as_view(), name='booking-create'),
-    path('bookings/', BookingListView.as_view(), name='bookings-list'),
-    path('timezone/', TimezoneUpdateView.as_view(), name='timezone-update'),
-]
\ No newline at end of file
+urlpatterns = get_urlpatterns(getattr(settings, 'ASYNC_BOOKING_VIEWS', False))
@@ -1,24 +1,243 @@
 """
 Views for the fitness booking API.
 """
+import datetime
 import logging
 from rest_framework import status
 from rest_framework.views import APIView
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.utils import timezone
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.utils import dateparse, timezone
+from django.utils.cache import patch_vary_headers
 from django.shortcuts import get_object_or_404
 
-from .models import FitnessClass, Booking
+from . import admission
+from . import availability
+from . import cache as classes_cache
+from . import exports
+from . import idempotency
+from . import metrics
+from . import routing
+from .metrics import stage
+from .models import FitnessClass, Booking, BookingSummary
 from .serializers import (
     FitnessClassSerializer, 
     BookingSerializer,
-    BookingCreateSerializer
+    BookingSummarySerializer,
+    BookingCreateSerializer,
+    BookingItemSerializer,
+    BatchBookingCreateSerializer,
+    BookingCancelSerializer,
+    WaitlistEntrySerializer
+)
+from .pagination import paginate_by_datetime, get_page_size, InvalidCursor
+from .reservations import (
+    reserve_slot,
+    reserve_batch,
+    join_waitlist,
+    cancel_booking,
+    ReservationError,
+    ClassFull,
+    ClassNotFound,
+    AlreadyBooked,
+    BookingNotFound
+)
+from .timezones import (
+    get_timezone,
+    get_request_timezone,
+    TIMEZONE_HEADER,
+    TIMEZONE_COOKIE,
+    TIMEZONE_COOKIE_MAX_AGE
 )
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 
+def parse_class_fields(value):
+    """
+    Parse a ``fields=`` query parameter into serializer field names.
+    
+    Raises ``ValueError`` for unknown or empty field lists.
+    """
+    allowed = FitnessClassSerializer.Meta.fields
+    if not value:
+        return allowed
+    
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = set(fields) - set(allowed)
+    if unknown or not fields:
+        raise ValueError(f"Invalid fields: {', '.join(sorted(unknown)) or value}")
+    return fields
+
+
+# Query parameter values accepted by ``has_slots``
+BOOLEAN_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+CLASS_TYPE_VALUES = frozenset(value for value, _ in FitnessClass.CLASS_TYPES)
+INSTRUCTOR_MAX_LENGTH = FitnessClass._meta.get_field('instructor').max_length
+
+
+def parse_filter_datetime(name, value, end=False, tz=None):
+    """
+    Parse a ``date_from``/``date_to`` value into an aware datetime.
+    
+    A bare date means the start of that day, or for ``end`` the start of the
+    next one, so ``date_to=2024-05-01`` includes the whole of May 1st. Dates
+    and naive datetimes are taken to be in ``tz`` (default: the current
+    timezone).
+    """
+    try:
+        # Dates first, since parse_datetime() also accepts a bare date
+        day = dateparse.parse_date(value)
+        if day is not None:
+            parsed = datetime.datetime.combine(day, datetime.time.min)
+            if end:
+                parsed += datetime.timedelta(days=1)
+        else:
+            parsed = dateparse.parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+    
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, tz)
+    return parsed
+
+
+def parse_class_filters(query_params, tz=None):
+    """
+    Parse the classes listing filters into keyword arguments for
+    ``filter_classes`` and ``AvailabilityIndex.search``.
+    
+    Only the parameters are checked, so malformed filters are rejected
+    without a query. Raises ``ValueError`` for invalid values.
+    """
+    filters = {}
+    
+    class_type = query_params.get('class_type')
+    if class_type is not None:
+        if class_type not in CLASS_TYPE_VALUES:
+            raise ValueError(f"class_type must be one of: {', '.join(sorted(CLASS_TYPE_VALUES))}")
+        filters['class_type'] = class_type
+    
+    instructor = query_params.get('instructor')
+    if instructor is not None:
+        instructor = instructor.strip()
+        if not instructor or len(instructor) > INSTRUCTOR_MAX_LENGTH:
+            raise ValueError(f"instructor must be 1 to {INSTRUCTOR_MAX_LENGTH} characters")
+        filters['instructor'] = instructor
+    
+    if query_params.get('date_from'):
+        filters['start'] = parse_filter_datetime('date_from', query_params['date_from'], tz=tz)
+    if query_params.get('date_to'):
+        filters['end'] = parse_filter_datetime('date_to', query_params['date_to'], end=True, tz=tz)
+    if 'start' in filters and 'end' in filters and filters['start'] >= filters['end']:
+        raise ValueError("date_from must be before date_to")
+    
+    has_slots = query_params.get('has_slots')
+    if has_slots is not None:
+        if has_slots.lower() not in BOOLEAN_VALUES:
+            raise ValueError("has_slots must be true or false")
+        filters['has_slots'] = BOOLEAN_VALUES[has_slots.lower()]
+    
+    return filters
+
+
+def filter_classes(queryset, class_type=None, instructor=None, start=None, end=None, has_slots=False):
+    """Apply the filters returned by ``parse_class_filters`` to a queryset."""
+    if class_type is not None:
+        queryset = queryset.filter(class_type=class_type)
+    if instructor is not None:
+        queryset = queryset.filter(instructor=instructor)
+    if start is not None:
+        queryset = queryset.filter(datetime__gte=start)
+    if end is not None:
+        queryset = queryset.filter(datetime__lt=end)
+    if has_slots:
+        queryset = queryset.filter(available_slots__gt=0)
+    return queryset
+
+
+def upcoming_classes(fields):
+    """Return upcoming classes, only loading the columns needed for ``fields``."""
+    return FitnessClass.objects.filter(datetime__gt=timezone.now()).only(
+        'id', 'datetime', *fields
+    )
+
+
+def next_page_headers(request, next_cursor):
+    """Return the headers that point the client at the next page, if any."""
+    if not next_cursor:
+        return {}
+    
+    query = request.GET.copy()
+    query['cursor'] = next_cursor
+    return {
+        'X-Next-Cursor': next_cursor,
+        'Link': f'<{request.build_absolute_uri(request.path)}?{query.urlencode()}>; rel="next"',
+    }
+
+
+def cached_classes_response(request, entry):
+    """Build the response for a cached page of the classes listing."""
+    # Let polling clients skip the body when nothing changed
+    if classes_cache.etag_matches(request.headers.get('If-None-Match'), entry['etag']):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['content'], content_type='application/json')
+        for name, value in entry['headers'].items():
+            response[name] = value
+    
+    response['ETag'] = entry['etag']
+    response['Cache-Control'] = 'no-cache'
+    # Pages are rendered in the timezone the client asked for
+    patch_vary_headers(response, (TIMEZONE_HEADER, 'Cookie'))
+    return response
+
+
+def make_classes_entry(content, headers, page, fields, filters, sequence):
+    """Build the cache entry of a rendered page of classes."""
+    if 'available_slots' not in fields and not filters.get('has_slots'):
+        # Nothing on the page depends on slot counts
+        return classes_cache.make_entry(content, headers)
+    return classes_cache.make_entry(
+        content, headers, [fitness_class.id for fitness_class in page], sequence, bool(filters.get('has_slots'))
+    )
+
+
+def classes_entry_timeout(page, replica):
+    """Return how long a page of classes may be cached."""
+    return classes_cache.entry_timeout(
+        page[0].datetime if page else None, routing.get_max_lag() if replica else None
+    )
+
+
+def read_slots(class_ids):
+    """Return the current ``{id: available_slots}`` of classes."""
+    return dict(FitnessClass.objects.filter(pk__in=class_ids).values_list('id', 'available_slots'))
+
+
+def refresh_cached_slots(cache_key, entry):
+    """
+    Patch the slot counts that changed since a cached page was rendered.
+    
+    Returns the entry, or None if the page must be rendered again.
+    """
+    sequence = classes_cache.get_slot_sequence()
+    if not classes_cache.needs_patch(entry, sequence):
+        return entry
+    
+    class_ids = classes_cache.stale_classes(entry, classes_cache.changed_slots(entry['sequence'], sequence))
+    if class_ids is None:
+        return None
+    entry = classes_cache.patch_entry(entry, read_slots(class_ids) if class_ids else {}, sequence)
+    classes_cache.set_entry(cache_key, entry)
+    return entry
+
+
 class FitnessClassListView(APIView):
     """
     API view to retrieve a list of all upcoming fitness classes.
@@ -26,19 +245,90 @@ class FitnessClassListView(APIView):
     
     def get(self, request):
         """
-        GET method to retrieve all upcoming fitness classes.
+        GET method to retrieve upcoming fitness classes, one page at a time.
+        
+        Supports ``cursor`` and ``page_size`` query parameters for keyset
+        pagination and ``fields`` to only return a subset of fields. The
+        cursor for the next page is returned in the ``X-Next-Cursor`` and
+        ``Link`` headers. ``class_type``, ``instructor``, ``date_from``,
+        ``date_to`` and ``has_slots`` filter the classes. Datetimes are
+        rendered in the timezone from ``tz``, ``Accept-Timezone`` or the
+        preference cookie.
+        
+        Rendered pages are cached until a class changes or the first class
+        on the page starts, and requests with a matching ``If-None-Match``
+        header get a 304 without a database hit. Slot counts changed by
+        bookings are patched into cached pages. Pages read from a replica
+        are only cached for as long as replicas may lag, and clients pinned
+        to the primary skip the cache.
+        """
+        try:
+            tz = get_request_timezone(request)
+        except ValueError as e:
+            logger.warning("Invalid classes list request: %s", e)
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Look the page up under the current cache version
+        with stage('cache'):
+            cache_key = classes_cache.make_key(classes_cache.get_version(), request.query_params, str(tz))
+            sequence = classes_cache.get_slot_sequence()
+            pinned = routing.is_pinned(request)
+            entry = None if pinned else classes_cache.get_entry(cache_key)
+            if entry is not None:
+                entry = refresh_cached_slots(cache_key, entry)
+        
+        if entry is None:
+            query_params = request.query_params
+            try:
+                fields = parse_class_fields(query_params.get('fields'))
+                filters = parse_class_filters(query_params, tz)
+                page_size = get_page_size(query_params.get('page_size'))
+                with stage('query'):
+                    page, next_cursor, replica = self.query_page(request, fields, page_size, filters)
+            except (InvalidCursor, ValueError) as e:
+                logger.warning("Invalid classes list request: %s", e)
+                return Response(
+                    {"error": str(e)}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            # Serialize the data
+            with stage('serialize'):
+                serializer = FitnessClassSerializer(page, many=True, fields=fields, context={'timezone': tz})
+                data = serializer.data
+            
+            with stage('render'):
+                entry = make_classes_entry(
+                    JSONRenderer().render(data), next_page_headers(request, next_cursor),
+                    page, fields, filters, sequence
+                )
+                classes_cache.set_entry(cache_key, entry, classes_entry_timeout(page, replica))
+            
+            logger.info("Retrieved %s upcoming fitness classes", len(page))
+        
+        return cached_classes_response(request, entry)
+    
+    def query_page(self, request, fields, page_size, filters):
         """
-        # Get the current time
-        now = timezone.now()
+        Return a page of upcoming classes, the cursor for the next page and
+        the replica the page was read from, if any.
         
-        # Filter classes that are in the future
-        classes = FitnessClass.objects.filter(datetime__gt=now).order_by('datetime')
+        Pages come from the availability index, or from a replica while the
+        index is unavailable.
+        """
+        cursor = request.query_params.get('cursor')
         
-        # Serialize the data
-        serializer = FitnessClassSerializer(classes, many=True)
+        # Serve from the in-memory index unless it is being rebuilt
+        index = availability.get_index()
+        if index is not None:
+            page, next_cursor = index.page(cursor, page_size, **filters)
+            return page, next_cursor, None
         
-        logger.info(f"Retrieved {len(classes)} upcoming fitness classes")
-        return Response(serializer.data)
+        with routing.replica_reads(request) as replica:
+            page, next_cursor = paginate_by_datetime(
+                filter_classes(upcoming_classes(fields), **filters), cursor, page_size
+            )
+        return page, next_cursor, replica
 
 
 class BookingCreateView(APIView):
@@ -49,11 +339,80 @@ class BookingCreateView(APIView):
     def post(self, request):
         """
         POST method to create a new booking.
+        
+        With an ``Idempotency-Key`` header, retries of a request get its
+        original response back without running it again, and a retry that
+        arrives while the original is still running waits briefly for it.
+        """
+        key = request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+        if key is None:
+            return self.admit_booking(request)
+        
+        try:
+            with stage('idempotency'):
+                outcome = idempotency.begin(key, idempotency.fingerprint(request))
+        except idempotency.IdempotencyError as e:
+            logger.warning("Booking rejected for Idempotency-Key %r: %s", key, e)
+            return Response(
+                {"error": str(e)}, 
+                status=e.status_code,
+                headers={'Retry-After': str(e.retry_after)} if e.retry_after else None
+            )
+        
+        if not isinstance(outcome, idempotency.Claim):
+            logger.info("Replayed the booking response for Idempotency-Key %r", key)
+            return Response(
+                outcome['data'], 
+                status=outcome['status_code'],
+                headers={idempotency.REPLAYED_HEADER: 'true'}
+            )
+        
+        with outcome as claim:
+            response = self.admit_booking(request)
+            claim.complete(response.status_code, response.data)
+        return response
+    
+    def admit_booking(self, request):
+        """
+        Create a booking once admission control lets the request in.
+        
+        Admission control turns requests away without a query when the class
+        is sold out or has too many bookings running.
+        """
+        class_id = admission.parse_class_id(request.data)
+        try:
+            with stage('admit'):
+                ticket = admission.admit(class_id)
+        except admission.SoldOut as e:
+            logger.warning("Booking rejected for sold out class %s", class_id)
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except admission.Overloaded as e:
+            logger.warning("Booking turned away for busy class %s", class_id)
+            return Response(
+                {"error": str(e)}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'}
+            )
+        
+        with ticket:
+            return self.create_booking(request, ticket)
+    
+    def create_booking(self, request, ticket):
+        """
+        Validate and make an admitted booking, reporting what was learned
+        about the class to its admission ``ticket``.
         """
         # First validate the request data
-        serializer = BookingCreateSerializer(data=request.data)
-        if not serializer.is_valid():
-            logger.warning(f"Invalid booking request: {serializer.errors}")
+        with stage('validate'):
+            serializer = BookingCreateSerializer(data=request.data)
+            is_valid = serializer.is_valid()
+        
+        fitness_class = getattr(serializer, 'fitness_class', None)
+        if fitness_class is not None and fitness_class.is_upcoming():
+            ticket.learn(fitness_class.available_slots)
+        
+        if not is_valid:
+            logger.warning("Invalid booking request: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         # Get the validated data
@@ -62,44 +421,196 @@ class BookingCreateView(APIView):
         client_name = validated_data.get('client_name')
         client_email = validated_data.get('client_email')
         
-        # Get the fitness class
+        # Validation already checked for an existing booking
+        if validated_data.get('already_booked'):
+            logger.warning("Duplicate booking for class %s by %s", class_id, client_email)
+            return Response(
+                {"error": str(AlreadyBooked(class_id))}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Reserve a slot and create the booking in one transaction
         try:
-            fitness_class = FitnessClass.objects.get(pk=class_id)
-        except FitnessClass.DoesNotExist:
-            logger.warning(f"Fitness class not found: {class_id}")
+            with stage('reserve'):
+                booking = reserve_slot(
+                    class_id, client_name, client_email, validated_data.get('fitness_class')
+                )
+        except ClassNotFound:
+            logger.warning("Fitness class not found: %s", class_id)
             return Response(
                 {"error": "Fitness class not found"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
-        
-        # Check if the client has already booked this class
-        if Booking.objects.filter(fitness_class=fitness_class, client_email=client_email).exists():
-            logger.warning(f"Client {client_email} has already booked class {class_id}")
+        except ReservationError as e:
+            if isinstance(e, ClassFull):
+                ticket.sold_out()
+            logger.warning("Booking rejected for class %s: %s", class_id, e)
             return Response(
-                {"error": "You have already booked this class"}, 
+                {"error": str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        ticket.booked()
+        
+        # Serialize the booking
+        with stage('serialize'):
+            data = BookingSerializer(booking).data
+        
+        response = Response(data, status=status.HTTP_201_CREATED)
+        # Read this client's bookings from the primary until replicas catch up
+        routing.pin_to_primary(response, [client_email])
         
-        # Try to book a slot
-        if not fitness_class.book_slot():
-            logger.warning(f"No available slots for class {class_id}")
+        logger.info("Created booking %s for client %s", booking.id, client_email)
+        return response
+
+
+class BatchBookingCreateView(APIView):
+    """
+    API view to create many bookings at once, e.g. for group reservations.
+    """
+    
+    def post(self, request):
+        """
+        POST method to create a batch of bookings.
+        
+        Returns a result per booking. In ``all_or_nothing`` mode (the default)
+        either every booking is made or none are; in ``best_effort`` mode
+        every booking that can be made is made.
+        """
+        # First validate the request data
+        with stage('validate'):
+            serializer = BatchBookingCreateSerializer(data=request.data)
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            logger.warning("Invalid batch booking request: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        validated_data = serializer.validated_data
+        items = validated_data['bookings']
+        all_or_nothing = validated_data['mode'] == BatchBookingCreateSerializer.MODE_ALL_OR_NOTHING
+        
+        with stage('reserve'):
+            outcomes = reserve_batch(items, all_or_nothing=all_or_nothing)
+        
+        # Build a result per requested booking
+        results = []
+        booked = 0
+        for index, outcome in enumerate(outcomes):
+            if isinstance(outcome, Booking):
+                booked += 1
+                results.append({
+                    "index": index,
+                    "status": "booked",
+                    "booking": BookingSerializer(outcome).data
+                })
+            else:
+                results.append({
+                    "index": index,
+                    "status": "failed",
+                    "error": str(outcome)
+                })
+        
+        response = Response(
+            {"booked": booked, "failed": len(items) - booked, "results": results},
+            status=status.HTTP_201_CREATED if booked else status.HTTP_400_BAD_REQUEST
+        )
+        routing.pin_to_primary(
+            response, [outcome.client_email for outcome in outcomes if isinstance(outcome, Booking)]
+        )
+        
+        logger.info("Batch booking created %s of %s bookings", booked, len(items))
+        return response
+
+
+class WaitlistCreateView(APIView):
+    """
+    API view to join the waitlist of a full class.
+    """
+    
+    def post(self, request):
+        """
+        POST method to join a waitlist.
+        
+        Clients are booked automatically, first come first served, when a
+        booking for the class is cancelled, so there is no need to retry.
+        """
+        # First validate the request data
+        with stage('validate'):
+            serializer = BookingItemSerializer(data=request.data)
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            logger.warning("Invalid waitlist request: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        validated_data = serializer.validated_data
+        class_id = validated_data['class_id']
+        
+        try:
+            with stage('reserve'):
+                entry, position = join_waitlist(
+                    class_id, validated_data['client_name'], validated_data['client_email']
+                )
+        except ClassNotFound:
+            logger.warning("Fitness class not found: %s", class_id)
             return Response(
-                {"error": "No available slots for this class"}, 
+                {"error": "Fitness class not found"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except ReservationError as e:
+            logger.warning("Waitlist rejected for class %s: %s", class_id, e)
+            return Response(
+                {"error": str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create the booking
-        booking = Booking.objects.create(
-            fitness_class=fitness_class,
-            client_name=client_name,
-            client_email=client_email
-        )
+        data = WaitlistEntrySerializer(entry).data
+        data['position'] = position
         
-        # Serialize the booking
-        booking_serializer = BookingSerializer(booking)
+        logger.info("Added %s to the waitlist of class %s at position %s", entry.client_email, class_id, position)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class BookingCancelView(APIView):
+    """
+    API view to cancel a booking.
+    """
+    
+    def post(self, request):
+        """
+        POST method to cancel a booking.
+        
+        The freed slot goes to the first client on the class's waitlist,
+        whose new booking is returned as ``promoted``.
+        """
+        serializer = BookingCancelSerializer(data=request.data)
+        if not serializer.is_valid():
+            logger.warning("Invalid cancellation request: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        booking_id = serializer.validated_data['booking_id']
+        
+        try:
+            with stage('cancel'):
+                promoted = cancel_booking(booking_id, serializer.validated_data['client_email'])
+        except BookingNotFound:
+            logger.warning("Booking not found: %s", booking_id)
+            return Response(
+                {"error": "Booking not found"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        if promoted is not None:
+            logger.info("Cancelled booking %s; promoted %s from the waitlist", booking_id, promoted.client_email)
+        else:
+            logger.info("Cancelled booking %s", booking_id)
         
-        logger.info(f"Created booking {booking.id} for client {client_email}")
-        return Response(booking_serializer.data, status=status.HTTP_201_CREATED)
+        response = Response({
+            "cancelled": booking_id,
+            "promoted": BookingSerializer(promoted).data if promoted is not None else None
+        })
+        routing.pin_to_primary(
+            response, [serializer.validated_data['client_email'], promoted.client_email if promoted else None]
+        )
+        return response
 
 
 class BookingListView(APIView):
@@ -110,6 +621,9 @@ class BookingListView(APIView):
     def get(self, request):
         """
         GET method to retrieve all bookings for a specific email address.
+        
+        Datetimes are rendered in the timezone from ``tz``,
+        ``Accept-Timezone`` or the preference cookie.
         """
         # Get the email from the query parameters
         email = request.query_params.get('email')
@@ -122,24 +636,36 @@ class BookingListView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get all bookings for the email
-        bookings = Booking.objects.filter(client_email=email).order_by('-booking_time')
+        try:
+            tz = get_request_timezone(request)
+        except ValueError as e:
+            logger.warning("Invalid bookings request: %s", e)
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Get all bookings for the email from the denormalized summaries
+        bookings = BookingSummary.objects.filter(client_email=email).order_by('-booking_time')
         
-        # Serialize the bookings
-        serializer = BookingSerializer(bookings, many=True)
+        # Serialize the bookings with a single indexed lookup, on a replica
+        # unless this client just wrote
+        with stage('serialize'), routing.replica_reads(request, email):
+            data = BookingSummarySerializer(bookings, timezone=tz).data
         
-        logger.info(f"Retrieved {len(bookings)} bookings for email {email}")
-        return Response(serializer.data)
+        logger.info("Retrieved %s bookings for email %s", len(data), email)
+        return Response(data)
 
 
 class TimezoneUpdateView(APIView):
     """
-    API view to update the timezone of all classes.
+    API view to set the timezone a client's responses are rendered in.
     """
     
     def post(self, request):
         """
-        POST method to update the timezone of all classes.
+        POST method to set the timezone preference.
+        
+        Stored datetimes are not touched, and nothing is read: the timezone
+        is saved in a cookie that the listing endpoints render datetimes in,
+        and echoed back.
         """
         # Get the timezone from the request data
         timezone_str = request.data.get('timezone')
@@ -152,37 +678,88 @@ class TimezoneUpdateView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if the timezone is valid
         try:
-            import pytz
-            if not timezone_str in pytz.all_timezones:
-                logger.warning(f"Invalid timezone: {timezone_str}")
-                return Response(
-                    {"error": f"Invalid timezone: {timezone_str}"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except ImportError:
-            logger.warning("pytz module not found")
+            get_timezone(timezone_str)
+        except ValueError:
+            logger.warning("Invalid timezone: %s", timezone_str)
             return Response(
-                {"error": "Server configuration error"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": f"Invalid timezone: {timezone_str}"}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update the timezone for all classes
-        classes = FitnessClass.objects.all()
-        for fitness_class in classes:
-            try:
-                fitness_class.update_timezone(timezone_str)
-            except Exception as e:
-                logger.error(f"Error updating timezone for class {fitness_class.id}: {e}")
-                return Response(
-                    {"error": f"Error updating timezone: {str(e)}"}, 
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        response = Response({"timezone": timezone_str})
+        response.set_cookie(TIMEZONE_COOKIE, timezone_str, max_age=TIMEZONE_COOKIE_MAX_AGE, samesite='Lax')
         
-        # Return the updated classes
-        updated_classes = FitnessClass.objects.filter(datetime__gt=timezone.now()).order_by('datetime')
-        serializer = FitnessClassSerializer(updated_classes, many=True)
-        
-        logger.info(f"Updated timezone to {timezone_str} for {len(classes)} classes")
-        return Response(serializer.data)
\ No newline at end of file
+        logger.info("Set timezone preference to %s", timezone_str)
+        return response
+
+
+def metrics_view(request):
+    """
+    Expose the in-process request metrics in Prometheus text format.
+    """
+    return HttpResponse(
+        metrics.registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+EXPORT_FORBIDDEN = {"error": "Exports are only available to staff"}
+
+
+def export_params(resource, query_params):
+    """
+    Parse the parameters of an export request.
+    
+    Returns ``(format, since, until)``, where ``until`` is the time the export
+    starts. Raises ``Http404`` for an unknown resource and ``ValueError`` for
+    invalid parameters.
+    """
+    if resource not in exports.RESOURCES:
+        raise Http404(f"Unknown export: {resource}")
+    
+    export_format = query_params.get('format') or 'ndjson'
+    if export_format not in exports.FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(exports.FORMATS)}")
+    
+    return export_format, exports.parse_since(query_params.get('since')), timezone.now()
+
+
+def export_headers(resource, export_format, until):
+    """Return the headers of an export response."""
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    return {
+        'Content-Disposition': f'attachment; filename="{resource}.{extension}"',
+        # Pass this back as ?since= to fetch only what changed afterwards;
+        # it overlaps this export a little, so upsert rows by id
+        'X-Export-Until': exports.resume_point(until).isoformat(),
+    }
+
+
+@require_GET
+def export_view(request, resource):
+    """
+    Stream every fitness class or booking as NDJSON or CSV.
+    
+    ``?format=csv`` selects CSV instead of NDJSON, and ``?since=`` limits the
+    export to rows written after a previous export's ``X-Export-Until``.
+    Consecutive exports overlap by ``EXPORT_OVERLAP`` seconds, and
+    cancelled bookings only disappear from full exports. Only staff users
+    and holders of ``EXPORT_TOKEN`` may export.
+    """
+    if not exports.can_export(request):
+        logger.warning("Export of %s refused to an unauthorized client", resource)
+        return JsonResponse(EXPORT_FORBIDDEN, status=status.HTTP_403_FORBIDDEN)
+    
+    try:
+        export_format, since, until = export_params(resource, request.GET)
+    except ValueError as e:
+        logger.warning("Invalid export request: %s", e)
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    logger.info("Exporting %s as %s since %s", resource, export_format, since)
+    return StreamingHttpResponse(
+        exports.stream_export(resource, export_format, since, until),
+        content_type=exports.CONTENT_TYPES[export_format],
+        headers=export_headers(resource, export_format, until)
+    )
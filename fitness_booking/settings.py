@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'booking_api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,10 +63,30 @@ WSGI_APPLICATION = 'fitness_booking.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH') or BASE_DIR / 'db.sqlite3',
     }
 }
 
+# Read replicas of the primary: SQLite files listed in SQLITE_REPLICA_PATHS
+# (comma-separated) and refreshed by `manage.py sync_replicas`. The listing
+# endpoints read from them, and clients that just booked stick to the
+# primary for DATABASE_REPLICA_MAX_LAG seconds, which must cover the time
+# between copies.
+DATABASE_REPLICAS = []
+for number, path in enumerate(filter(None, os.environ.get('SQLITE_REPLICA_PATHS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['booking_api.routing.PrimaryReplicaRouter']
+DATABASE_REPLICA_MAX_LAG = 10
+# Cache that remembers the emails of clients that just booked; it must be
+# shared by every server process when replicas are used
+DATABASE_REPLICA_PIN_CACHE_ALIAS = 'default'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,4 +123,74 @@ REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
-}
\ No newline at end of file
+}
+# Keyset pagination for the classes listing
+CLASSES_PAGE_SIZE = 50
+CLASSES_MAX_PAGE_SIZE = 500
+
+# Cache
+# Local memory is only seen by the process that wrote it; deployments with
+# several server processes need a shared backend (see `check --deploy`), e.g.
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+# 'LOCATION': 'redis://127.0.0.1:6379',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cache for the upcoming classes listing
+CLASSES_CACHE_ALIAS = 'default'
+CLASSES_CACHE_TIMEOUT = 60
+
+# In-memory index of upcoming classes; processes read each other's changes
+# from the cache above at most every AVAILABILITY_CHECK_INTERVAL seconds
+AVAILABILITY_INDEX_ENABLED = True
+AVAILABILITY_CHECK_INTERVAL = 1.0
+
+# Route the listing and booking endpoints to the async views (for ASGI servers)
+ASYNC_BOOKING_VIEWS = os.environ.get('ASYNC_BOOKING_VIEWS', '') == '1'
+
+# Admission control in front of POST /api/book/, per class and process: at
+# most ADMISSION_MAX_WRITERS bookings run at once, up to ADMISSION_MAX_QUEUE
+# more wait ADMISSION_QUEUE_TIMEOUT seconds for a turn, and sold out classes
+# are rejected without a query until their slot count is relearned
+# ADMISSION_REFRESH_INTERVAL seconds later
+ADMISSION_CONTROL_ENABLED = True
+ADMISSION_MAX_WRITERS = 4
+ADMISSION_MAX_QUEUE = 64
+ADMISSION_QUEUE_TIMEOUT = 2.0
+ADMISSION_REFRESH_INTERVAL = 1.0
+
+# Idempotency-Key support on POST /api/book/: responses are kept in the
+# table for IDEMPOTENCY_KEY_TTL seconds and in the cache for
+# IDEMPOTENCY_CACHE_TIMEOUT; retries of a running first request wait up to
+# IDEMPOTENCY_WAIT_TIMEOUT for its response (holding a worker thread in the
+# sync view) before a 409, and it is taken to have died after IDEMPOTENCY_LEASE
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_CACHE_TIMEOUT = 60 * 60
+IDEMPOTENCY_WAIT_TIMEOUT = 2.0
+IDEMPOTENCY_LEASE = 30.0
+
+# Seconds that consecutive incremental exports overlap by, so rows whose
+# transactions commit after an export started are in the next one; must
+# exceed the longest write transaction
+EXPORT_OVERLAP = 60
+# Bearer token that lets non-staff clients use /api/export/; unset, only
+# logged-in staff users can export
+EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN')
+
+# Maximum number of bookings in one POST /api/book/batch/ request
+BATCH_BOOKING_MAX_ITEMS = 100
+
+# Seconds a process collects bookings of sharded classes before folding
+# their shards back into available_slots with one UPDATE; 0 folds after
+# every booking
+SLOT_FOLD_DELAY = 1.0
+
+# Where `manage.py run_outbox_worker` delivers booking side effects, and how
+# many times a message is tried before it is given up on
+OUTBOX_SINK = 'booking_api.outbox.ConsoleSink'
+OUTBOX_SINK_OPTIONS = {}
+OUTBOX_MAX_ATTEMPTS = 8
@@ -0,0 +1,56 @@
+"""
+Production settings for fitness_booking project.
+
+Use with DJANGO_SETTINGS_MODULE=fitness_booking.settings_production.
+Tunes SQLite for concurrent bookings: WAL journaling, a busy timeout,
+memory-mapped reads, persistent connections and BEGIN IMMEDIATE for
+write transactions.
+
+Server processes tell each other about changes through the cache, so set
+REDIS_URL to share one between them. Without it the availability index is
+turned off, since it would never see other processes' bookings.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DEBUG = False
+
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+
+# Database
+DATABASES['default'].update({
+    'ENGINE': 'fitness_booking.sqlite_backend',
+    # Keep connections open between requests instead of reconnecting every time
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        # Seconds to wait for a lock before raising "database is locked"
+        'timeout': 20,
+        # Take the write lock up front in atomic blocks (booking writes)
+        'transaction_mode': 'IMMEDIATE',
+    },
+})
+
+# Cache shared by every server process, e.g. redis://127.0.0.1:6379
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+AVAILABILITY_INDEX_ENABLED = bool(REDIS_URL)
+
+# Applied to every new SQLite connection by booking_api's connection_created hook
+SQLITE_PRAGMAS = {
+    # Readers don't block the writer and the writer doesn't block readers
+    'journal_mode': 'WAL',
+    # Safe with WAL; only fsyncs at checkpoints
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 268435456,
+}
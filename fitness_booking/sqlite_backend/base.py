@@ -0,0 +1,37 @@
+"""
+SQLite database backend with a configurable transaction mode.
+
+Behaves like ``django.db.backends.sqlite3`` but accepts a
+``transaction_mode`` option (``DEFERRED``, ``IMMEDIATE`` or ``EXCLUSIVE``),
+as Django 5.1+ does. With ``IMMEDIATE``, every ``atomic`` block takes the
+write lock when it starts, so concurrent writers wait on the busy timeout
+instead of failing with "database is locked" when they try to upgrade a
+read lock mid-transaction.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite wrapper that starts transactions with a configurable mode."""
+
+    transaction_mode = None
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        transaction_mode = kwargs.pop('transaction_mode', None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES has an invalid transaction_mode: {transaction_mode}"
+            )
+        self.transaction_mode = transaction_mode
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode.upper()}")